@@ -5,14 +5,19 @@ import datetime as dt
 
 from app.core.config import AppConfig
 from app.core.context import AppContext, set_context
+from app.core.events import SCHEDULE_CHANGED, EventBus
 from app.core.commands import get_default_bot_commands
 from app.handlers import get_routers
 from app.handlers.start import TosMiddleware
 from app.services.admin_service import AdminPasswordService
+from app.services.banner_renderer import BannerRenderer
+from app.services.banner_warmup import BannerWarmer
 from app.services.db import Database
 from app.services.group_service import GroupResolver
 from app.services.schedule_service import ScheduleService
 from app.services.homework_service import HomeworkService
+from app.services.janitor import FileJanitor
+from app.services.notifier import NotificationDispatcher
 from app.services.schedule_watchdog import schedule_watchdog_loop
 
 
@@ -20,8 +25,22 @@ async def setup_bot(bot: Bot, dp: Dispatcher, config: AppConfig) -> None:
     db = Database(str(config.db_path))
     await db.init()
     group_resolver = GroupResolver(config.groups_path, config.group_aliases_path)
+    renderer = BannerRenderer(
+        workers=config.render_workers,
+        max_pending=config.render_queue,
+        backend=config.render_backend,
+        font=config.banner_font,
+        font_bold=config.banner_font_bold,
+    )
+    renderer.start()
+    events = EventBus()
     schedule_service = ScheduleService(
-        config.url_path, times_path=config.times_path, banner_dir=config.url_path.parent
+        config.url_path,
+        times_path=config.times_path,
+        banner_dir=config.url_path.parent,
+        renderer=renderer,
+        db=db,
+        events=events,
     )
     admin_service = AdminPasswordService(config.passwords_path)
     homework_service = HomeworkService(
@@ -33,6 +52,16 @@ async def setup_bot(bot: Bot, dp: Dispatcher, config: AppConfig) -> None:
         freeimage_api_key=config.freeimage_api_key,
         telegraph_token=config.telegraph_token,
     )
+    notifier = NotificationDispatcher(bot, db)
+    await notifier.start()
+    tz = dt.timezone(dt.timedelta(hours=3))
+    banner_warmer = BannerWarmer(schedule_service, db, tz)
+    await banner_warmer.start()
+    janitor = FileJanitor(schedule_service, tz)
+    await janitor.start()
+    # Order matters: stale banners are dropped before they are re-warmed.
+    events.subscribe(SCHEDULE_CHANGED, schedule_service.on_schedule_changed)
+    events.subscribe(SCHEDULE_CHANGED, banner_warmer.on_schedule_changed)
     ctx = AppContext(
         db=db,
         group_resolver=group_resolver,
@@ -40,11 +69,28 @@ async def setup_bot(bot: Bot, dp: Dispatcher, config: AppConfig) -> None:
         admin_service=admin_service,
         storage=dp.storage,
         homework_service=homework_service,
+        notifier=notifier,
+        banner_warmer=banner_warmer,
+        janitor=janitor,
+        events=events,
     )
     set_context(ctx)
 
-    tz = dt.timezone(dt.timedelta(hours=3))
-    asyncio.create_task(schedule_watchdog_loop(bot, tz))
+    watchdog = asyncio.create_task(schedule_watchdog_loop(tz))
+
+    async def shutdown() -> None:
+        # Everything below uses the database, so it goes down before the
+        # connection does.
+        watchdog.cancel()
+        try:
+            await watchdog
+        except asyncio.CancelledError:
+            pass
+        for service in (janitor, banner_warmer, notifier, schedule_service):
+            await service.close()
+        await db.close()
+
+    dp.shutdown.register(shutdown)
 
     dp.message.middleware(TosMiddleware())
     dp.callback_query.middleware(TosMiddleware())
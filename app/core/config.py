@@ -16,6 +16,11 @@ class AppConfig:
     homeworks_dir: Path
     freeimage_api_key: str | None
     telegraph_token: str | None
+    render_workers: int = 2
+    render_queue: int = 16
+    render_backend: str = "weasyprint"
+    banner_font: str | None = None
+    banner_font_bold: str | None = None
 
 
 def load_config() -> AppConfig:
@@ -28,6 +33,13 @@ def load_config() -> AppConfig:
     bot_token = data["bot_token"]
     freeimage_api_key = data.get("freeimage_api_key")
     telegraph_token = data.get("telegraph_token")
+    # Banner rendering processes; 0 renders in a thread inside the bot process.
+    render_workers = int(data.get("render_workers", 2))
+    render_queue = int(data.get("render_queue", 16))
+    # "weasyprint" renders the banner HTML, "pillow" draws the same layout directly.
+    render_backend = data.get("render_backend", "weasyprint")
+    banner_font = data.get("banner_font")
+    banner_font_bold = data.get("banner_font_bold")
     config_dir = base_dir / "config"
     config_dir.mkdir(parents=True, exist_ok=True)
     db_path = config_dir / "nmk_bot.db"
@@ -78,4 +90,9 @@ def load_config() -> AppConfig:
         homeworks_dir=homeworks_dir,
         freeimage_api_key=freeimage_api_key,
         telegraph_token=telegraph_token,
+        render_workers=render_workers,
+        render_queue=render_queue,
+        render_backend=render_backend,
+        banner_font=banner_font,
+        banner_font_bold=banner_font_bold,
     )
@@ -2,13 +2,17 @@ from typing import Optional
 
 
 class AppContext:
-    def __init__(self, db, group_resolver, schedule_service, admin_service=None, storage=None, homework_service=None):
+    def __init__(self, db, group_resolver, schedule_service, admin_service=None, storage=None, homework_service=None, notifier=None, banner_warmer=None, janitor=None, events=None):
         self.db = db
         self.group_resolver = group_resolver
         self.schedule_service = schedule_service
         self.admin_service = admin_service
         self.storage = storage
         self.homework_service = homework_service
+        self.notifier = notifier
+        self.banner_warmer = banner_warmer
+        self.janitor = janitor
+        self.events = events
 
 
 _context: Optional[AppContext] = None
@@ -0,0 +1,41 @@
+import inspect
+import logging
+from collections.abc import Callable
+from typing import Any
+
+# schedule_changed(group: str, dates: list[dt.date])
+# The stored schedule of ``group`` changed for ``dates`` (published by
+# ScheduleService.store_schedule once the new days are saved).
+SCHEDULE_CHANGED = "schedule_changed"
+
+
+class EventBus:
+    """In-process publish/subscribe.
+
+    ``publish`` runs the handlers of an event one after another, in the order
+    they subscribed, and awaits coroutine handlers. A failing handler is
+    logged and does not stop the others.
+    """
+
+    def __init__(self) -> None:
+        self._handlers: dict[str, list[Callable[..., Any]]] = {}
+        self.stats = {"published": 0, "errors": 0}
+
+    def subscribe(self, event: str, handler: Callable[..., Any]) -> None:
+        self._handlers.setdefault(event, []).append(handler)
+
+    def unsubscribe(self, event: str, handler: Callable[..., Any]) -> None:
+        handlers = self._handlers.get(event, [])
+        if handler in handlers:
+            handlers.remove(handler)
+
+    async def publish(self, event: str, **payload: Any) -> None:
+        self.stats["published"] += 1
+        for handler in list(self._handlers.get(event, [])):
+            try:
+                result = handler(**payload)
+                if inspect.isawaitable(result):
+                    await result
+            except Exception as e:
+                self.stats["errors"] += 1
+                logging.error("event %s: handler %s failed: %s", event, getattr(handler, "__qualname__", handler), e)
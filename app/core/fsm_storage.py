@@ -1,5 +1,8 @@
+import asyncio
 import datetime as dt
 import json
+import logging
+from collections import OrderedDict
 from collections.abc import Mapping
 from typing import Any
 
@@ -7,13 +10,41 @@ import aiosqlite
 from aiogram.fsm.storage.base import BaseStorage, StorageKey, StateType
 from aiogram.fsm.state import State
 
+from app.services.db import open_connection
+
+_MISSING = object()
+
 
 class SQLiteStorage(BaseStorage):
-    def __init__(self, path: str):
+    """FSM storage that serves reads from memory and batches writes.
+
+    aiogram reads and writes the state several times per update. Values are
+    cached per ``StorageKey`` and changed keys are written by a background
+    flusher in a single transaction every ``flush_interval`` seconds, so one
+    update costs at most one commit.
+    """
+
+    def __init__(self, path: str, flush_interval: float = 0.2, max_cached: int = 50000):
         self.path = path
+        self.flush_interval = flush_interval
+        self.max_cached = max_cached
+        self._conn: aiosqlite.Connection | None = None
+        self._states: OrderedDict[StorageKey, str | None] = OrderedDict()
+        self._data: OrderedDict[StorageKey, str | None] = OrderedDict()
+        self._dirty_states: set[StorageKey] = set()
+        self._dirty_data: set[StorageKey] = set()
+        self._db_lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        self._flusher: asyncio.Task | None = None
+
+    async def _connection(self) -> aiosqlite.Connection:
+        if self._conn is None:
+            self._conn = await open_connection(self.path)
+        return self._conn
 
     async def init(self) -> None:
-        async with aiosqlite.connect(self.path) as db:
+        async with self._db_lock:
+            db = await self._connection()
             await db.execute(
                 """
                 CREATE TABLE IF NOT EXISTS fsm_states (
@@ -41,78 +72,151 @@ class SQLiteStorage(BaseStorage):
                 """
             )
             await db.commit()
+        if self._flusher is None:
+            self._flusher = asyncio.create_task(self._flush_loop())
 
     async def close(self) -> None:
-        return
+        if self._flusher is not None:
+            self._flusher.cancel()
+            try:
+                await self._flusher
+            except asyncio.CancelledError:
+                pass
+            self._flusher = None
+        await self.flush()
+        async with self._db_lock:
+            if self._conn is not None:
+                await self._conn.close()
+                self._conn = None
 
-    async def get_state(self, key: StorageKey) -> str | None:
-        async with aiosqlite.connect(self.path) as db:
-            db.row_factory = aiosqlite.Row
+    async def _flush_loop(self) -> None:
+        while True:
+            await self._wakeup.wait()
+            # Let the rest of the update (and concurrent updates) pile up
+            # their changes before committing them together.
+            await asyncio.sleep(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logging.error("fsm storage flush failed: %s", e)
+
+    async def flush(self) -> None:
+        if not self._dirty_states and not self._dirty_data:
+            return
+        async with self._db_lock:
+            states = {key: self._states.get(key) for key in self._dirty_states}
+            data = {key: self._data.get(key) for key in self._dirty_data}
+            self._dirty_states.clear()
+            self._dirty_data.clear()
+            now = dt.datetime.utcnow().isoformat()
+            try:
+                db = await self._connection()
+                for key, value in states.items():
+                    params = (key.bot_id, key.chat_id, key.user_id, key.destiny)
+                    if value is None:
+                        await db.execute(
+                            "DELETE FROM fsm_states WHERE bot_id = ? AND chat_id = ? AND user_id = ? AND destiny = ?",
+                            params,
+                        )
+                        continue
+                    await db.execute(
+                        """
+                        INSERT INTO fsm_states (bot_id, chat_id, user_id, destiny, state, updated_at)
+                        VALUES (?, ?, ?, ?, ?, ?)
+                        ON CONFLICT(bot_id, chat_id, user_id, destiny)
+                        DO UPDATE SET state = excluded.state, updated_at = excluded.updated_at
+                        """,
+                        params + (value, now),
+                    )
+                for key, payload in data.items():
+                    params = (key.bot_id, key.chat_id, key.user_id, key.destiny)
+                    if payload is None:
+                        await db.execute(
+                            "DELETE FROM fsm_data WHERE bot_id = ? AND chat_id = ? AND user_id = ? AND destiny = ?",
+                            params,
+                        )
+                        continue
+                    await db.execute(
+                        """
+                        INSERT INTO fsm_data (bot_id, chat_id, user_id, destiny, data, updated_at)
+                        VALUES (?, ?, ?, ?, ?, ?)
+                        ON CONFLICT(bot_id, chat_id, user_id, destiny)
+                        DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at
+                        """,
+                        params + (payload, now),
+                    )
+                await db.commit()
+            except BaseException:
+                if self._conn is not None:
+                    await self._conn.rollback()
+                # Keep the keys dirty so the next flush retries them.
+                self._dirty_states.update(states)
+                self._dirty_data.update(data)
+                raise
+
+    def _mark_dirty(self, dirty: set[StorageKey], key: StorageKey) -> None:
+        dirty.add(key)
+        self._wakeup.set()
+
+    def _remember(self, cache: OrderedDict, dirty: set[StorageKey], key: StorageKey, value: Any) -> None:
+        cache[key] = value
+        cache.move_to_end(key)
+        # Dirty keys are few (they are flushed every flush_interval), so
+        # rotating them to the back keeps eviction O(1) instead of a scan.
+        rotated = 0
+        while len(cache) > self.max_cached and rotated <= len(dirty):
+            old_key, old_value = cache.popitem(last=False)
+            if old_key in dirty:
+                cache[old_key] = old_value
+                rotated += 1
+
+    async def _load(self, table: str, column: str, key: StorageKey) -> str | None:
+        async with self._db_lock:
+            db = await self._connection()
             cursor = await db.execute(
-                "SELECT state FROM fsm_states WHERE bot_id = ? AND chat_id = ? AND user_id = ? AND destiny = ?",
+                f"SELECT {column} FROM {table} WHERE bot_id = ? AND chat_id = ? AND user_id = ? AND destiny = ?",
                 (key.bot_id, key.chat_id, key.user_id, key.destiny),
             )
             row = await cursor.fetchone()
-            return row["state"] if row else None
+            return row[column] if row else None
+
+    async def get_state(self, key: StorageKey) -> str | None:
+        value = self._states.get(key, _MISSING)
+        if value is not _MISSING:
+            self._states.move_to_end(key)
+            return value
+        value = await self._load("fsm_states", "state", key)
+        # A concurrent set_state may have landed while we were reading.
+        if key not in self._states:
+            self._remember(self._states, self._dirty_states, key, value)
+        return self._states.get(key)
 
     async def set_state(self, key: StorageKey, state: StateType = None) -> None:
         if isinstance(state, State):
             value = state.state
         else:
             value = state
-        async with aiosqlite.connect(self.path) as db:
-            if value is None:
-                await db.execute(
-                    "DELETE FROM fsm_states WHERE bot_id = ? AND chat_id = ? AND user_id = ? AND destiny = ?",
-                    (key.bot_id, key.chat_id, key.user_id, key.destiny),
-                )
-                await db.commit()
-                return
-            now = dt.datetime.utcnow().isoformat()
-            await db.execute(
-                """
-                INSERT INTO fsm_states (bot_id, chat_id, user_id, destiny, state, updated_at)
-                VALUES (?, ?, ?, ?, ?, ?)
-                ON CONFLICT(bot_id, chat_id, user_id, destiny)
-                DO UPDATE SET state = excluded.state, updated_at = excluded.updated_at
-                """,
-                (key.bot_id, key.chat_id, key.user_id, key.destiny, value, now),
-            )
-            await db.commit()
+        self._mark_dirty(self._dirty_states, key)
+        self._remember(self._states, self._dirty_states, key, value)
 
     async def get_data(self, key: StorageKey) -> dict[str, Any]:
-        async with aiosqlite.connect(self.path) as db:
-            db.row_factory = aiosqlite.Row
-            cursor = await db.execute(
-                "SELECT data FROM fsm_data WHERE bot_id = ? AND chat_id = ? AND user_id = ? AND destiny = ?",
-                (key.bot_id, key.chat_id, key.user_id, key.destiny),
-            )
-            row = await cursor.fetchone()
-            if not row or row["data"] is None:
-                return {}
-            try:
-                return json.loads(row["data"])
-            except Exception:
-                return {}
+        payload = self._data.get(key, _MISSING)
+        if payload is _MISSING:
+            payload = await self._load("fsm_data", "data", key)
+            if key not in self._data:
+                self._remember(self._data, self._dirty_data, key, payload)
+            payload = self._data.get(key)
+        else:
+            self._data.move_to_end(key)
+        if payload is None:
+            return {}
+        try:
+            return json.loads(payload)
+        except Exception:
+            return {}
 
     async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
-        async with aiosqlite.connect(self.path) as db:
-            if not data:
-                await db.execute(
-                    "DELETE FROM fsm_data WHERE bot_id = ? AND chat_id = ? AND user_id = ? AND destiny = ?",
-                    (key.bot_id, key.chat_id, key.user_id, key.destiny),
-                )
-                await db.commit()
-                return
-            now = dt.datetime.utcnow().isoformat()
-            payload = json.dumps(dict(data), ensure_ascii=False)
-            await db.execute(
-                """
-                INSERT INTO fsm_data (bot_id, chat_id, user_id, destiny, data, updated_at)
-                VALUES (?, ?, ?, ?, ?, ?)
-                ON CONFLICT(bot_id, chat_id, user_id, destiny)
-                DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at
-                """,
-                (key.bot_id, key.chat_id, key.user_id, key.destiny, payload, now),
-            )
-            await db.commit()
+        payload = json.dumps(dict(data), ensure_ascii=False) if data else None
+        self._mark_dirty(self._dirty_data, key)
+        self._remember(self._data, self._dirty_data, key, payload)
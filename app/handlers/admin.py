@@ -1,4 +1,3 @@
-import asyncio
 import datetime as dt
 import json
 import logging
@@ -42,7 +41,7 @@ from app.core.commands import get_admin_bot_commands, get_default_bot_commands
 from app.core.context import get_context
 from app.keyboards.inline import broadcast_cancel_inline_keyboard
 from app.keyboards.reply import main_menu_keyboard
-from app.services.schedule_service import week_bounds_mon_sun, parse_schedule
+from app.services.schedule_service import week_bounds_mon_sun
 
 router = Router()
 
@@ -1080,29 +1079,16 @@ async def admin_schedule_cleanup_files(message: Message, state: FSMContext) -> N
     if not session:
         return
     ctx = get_context()
-    schedule_service = ctx.schedule_service
-    schedule_dir = getattr(schedule_service, "schedule_dir", None)
-    if schedule_dir is None:
-        await message.answer("⚠️ Директория с расписанием не найдена.")
-        return
-    now_ts = dt.datetime.now().timestamp()
-    threshold = now_ts - 10 * 24 * 60 * 60
-    deleted = 0
-    for path in Path(schedule_dir).glob("*.json"):
-        try:
-            stat = path.stat()
-        except OSError:
-            continue
-        if stat.st_mtime < threshold:
-            try:
-                path.unlink()
-                deleted += 1
-            except OSError:
-                continue
+    if ctx.janitor is None:
+        await message.answer("⚠️ Очистка файлов недоступна.")
+        return
+    deleted, reclaimed = await ctx.janitor.run()
     if deleted == 0:
         await message.answer("Старых файлов расписания не найдено.")
     else:
-        await message.answer(f"Удалено старых файлов расписания: <b>{deleted}</b>.")
+        await message.answer(
+            f"Удалено старых файлов: <b>{deleted}</b> ({reclaimed / (1024 * 1024):.1f} МБ)."
+        )
 
 
 @router.message(AdminStates.SCHEDULE_MENU, F.text == "🔄 Перепарсить текущее")
@@ -1125,9 +1111,10 @@ async def admin_schedule_reparse_current(message: Message, state: FSMContext) ->
         if not url:
             continue
         try:
-            schedule = await asyncio.to_thread(parse_schedule, url)
+            schedule = await schedule_service.fetch_schedule(url)
             if schedule:
-                schedule_service._save_schedule(group_code, today, schedule)
+                # Changed days get their banners dropped and re-warmed.
+                await schedule_service.store_schedule(group_code, today, schedule)
                 success += 1
             else:
                 errors += 1
@@ -1273,12 +1260,44 @@ async def admin_logs_resources(message: Message, state: FSMContext) -> None:
         f"Использовано: {disk.used / gb:.2f} ГБ ({disk.percent:.1f}%)",
         f"Свободно: {disk.free / gb:.2f} ГБ",
     ]
+    parse_stats = get_context().schedule_service.parse_stats
+    parse_lines = [
+        f"Не изменились (304): {parse_stats['not_modified']}",
+        f"Совпал хэш страницы: {parse_stats['hash_hits']}",
+        f"Разобрано заново: {parse_stats['misses']}",
+    ]
+    banner_cache = get_context().schedule_service.banner_cache
+    banner_lines = [
+        f"Баннеров на диске: {len(banner_cache)} ({banner_cache.size_bytes / (1024 * 1024):.1f} МБ)",
+        f"Отправлено по file_id: {banner_cache.stats['file_id_hits']}",
+        f"Взято с диска: {banner_cache.stats['disk_hits']}",
+        f"Отрисовано: {banner_cache.stats['renders']}",
+        f"Вытеснено: {banner_cache.stats['evictions']}",
+    ]
+    janitor_lines = ["Очистка файлов отключена"]
+    janitor = get_context().janitor
+    if janitor is not None:
+        mb = 1024 * 1024
+        stats = janitor.stats
+        last_run = stats["last_run"].strftime("%d.%m.%Y %H:%M") if stats["last_run"] else "ещё не было"
+        by_area = stats["bytes_by_area"]
+        janitor_lines = [
+            f"Последний запуск: {last_run} ({stats['last_bytes'] / mb:.1f} МБ)",
+            f"Удалено файлов и записей: {stats['files']} ({stats['bytes'] / mb:.1f} МБ)",
+            f"Расписание: {by_area['schedule'] / mb:.1f} МБ",
+            f"Старые JSON-файлы: {by_area['legacy'] / mb:.1f} МБ",
+            f"Баннеры: {by_area['banners'] / mb:.1f} МБ",
+            f"Рассылки: {stats['outbox_jobs']} заданий, {stats['outbox_items']} сообщений",
+        ]
     text = (
         "🧠 <b>Память и CPU</b>\n\n"
         "CPU по ядрам:\n<pre>\n" + "\n".join(cpu_lines) + "\n</pre>\n\n"
         "RAM:\n<pre>\n" + "\n".join(ram_lines) + "\n</pre>\n\n"
         "Swap:\n<pre>\n" + "\n".join(swap_lines) + "\n</pre>\n\n"
-        f"Диск для config/ ({config_path}):\n<pre>\n" + "\n".join(disk_lines) + "\n</pre>"
+        f"Диск для config/ ({config_path}):\n<pre>\n" + "\n".join(disk_lines) + "\n</pre>\n\n"
+        "Кэш разбора расписания:\n<pre>\n" + "\n".join(parse_lines) + "\n</pre>\n\n"
+        "Кэш баннеров:\n<pre>\n" + "\n".join(banner_lines) + "\n</pre>\n\n"
+        "Очистка файлов:\n<pre>\n" + "\n".join(janitor_lines) + "\n</pre>"
     )
     await message.answer(text)
 
@@ -1450,46 +1469,36 @@ async def admin_broadcast_process(message: Message, state: FSMContext) -> None:
     if not session:
         return
     ctx = get_context()
-    users = await ctx.db.get_all_users_for_broadcast()
     blocklist = _load_broadcast_blocklist()
-    blocked_ids = set(blocklist.get("ids", []))
-    blocked_usernames = set(blocklist.get("usernames", []))
-    sent = 0
-    errors = 0
-    for u in users:
-        tg_id = u.get("tg_id")
-        if not tg_id:
-            continue
-        if tg_id == message.chat.id:
-            continue
-        username = u.get("username")
-        if tg_id in blocked_ids:
-            continue
-        if username and username.lower() in blocked_usernames:
-            continue
-        if u.get("is_blocked"):
-            continue
-        banned = await ctx.db.is_user_banned(tg_id, username)
-        if banned:
-            continue
-        try:
-            await message.bot.copy_message(
-                chat_id=tg_id,
-                from_chat_id=message.chat.id,
-                message_id=message.message_id,
-            )
-            sent += 1
-        except Exception:
-            errors += 1
-            await ctx.db.set_user_blocked(tg_id, True)
+    recipients = await ctx.db.get_broadcast_recipients(
+        message.chat.id,
+        blocklist.get("ids", []),
+        blocklist.get("usernames", []),
+    )
     level = session.get("level", 1)
     await state.set_state(AdminStates.MAIN)
     await message.answer(
-        f"📢 Рассылка завершена.\n\n"
-        f"Успешно отправлено: <b>{sent}</b>\n"
-        f"Ошибок при отправке: <b>{errors}</b>",
+        f"📢 Рассылка поставлена в очередь.\n\nПолучателей: <b>{len(recipients)}</b>",
         reply_markup=admin_main_keyboard(level),
     )
+    # Delivery runs in the outbox workers; they keep editing this message
+    # (a message with a reply keyboard cannot be edited).
+    progress = await message.answer("⏳ Рассылка начинается…")
+    job_id = await ctx.notifier.enqueue(
+        "broadcast",
+        {
+            "method": "copy_message",
+            "params": {"from_chat_id": message.chat.id, "message_id": message.message_id},
+        },
+        recipients,
+        created_by=message.from_user.id if message.from_user else None,
+        progress_chat_id=progress.chat.id,
+        progress_message_id=progress.message_id,
+    )
+    try:
+        await progress.edit_reply_markup(reply_markup=broadcast_cancel_inline_keyboard(job_id))
+    except TelegramBadRequest:
+        pass
 
 
 @router.message(AdminStates.MAIN, F.text == "🚫 Бан / Разбан")
@@ -2213,6 +2222,23 @@ async def admin_sessions_refresh(callback: CallbackQuery, state: FSMContext) ->
     await callback.answer()
 
 
+@router.callback_query(F.data.startswith("broadcast_cancel:"))
+async def admin_broadcast_job_cancel_callback(callback: CallbackQuery, state: FSMContext) -> None:
+    session = await _ensure_admin_session_callback(callback, state, min_level=2)
+    if not session:
+        return
+    try:
+        job_id = int(callback.data.split(":", 1)[1])
+    except ValueError:
+        await callback.answer()
+        return
+    ctx = get_context()
+    if await ctx.notifier.cancel(job_id):
+        await callback.answer("Рассылка отменена.", show_alert=False)
+    else:
+        await callback.answer("Рассылка уже завершена.", show_alert=False)
+
+
 @router.callback_query(F.data == "broadcast_cancel")
 async def admin_broadcast_cancel_callback(callback: CallbackQuery, state: FSMContext) -> None:
     session = await _ensure_admin_session_callback(callback, state, min_level=2)
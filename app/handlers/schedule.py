@@ -1,7 +1,7 @@
 import datetime as dt
-from pathlib import Path
 
 from aiogram import Router, F
+from aiogram.exceptions import TelegramBadRequest
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import StatesGroup, State
 from aiogram.types import Message, FSInputFile
@@ -9,6 +9,7 @@ from aiogram.types import Message, FSInputFile
 from app.core.context import get_context
 from app.core.states import MenuStates
 from app.keyboards.reply import main_menu_keyboard, schedule_keyboard
+from app.services.banner_cache import CachedBanner
 from app.services.schedule_service import day_name_ru
 
 router = Router()
@@ -18,7 +19,7 @@ class ScheduleGroupStates(StatesGroup):
     WAITING_FOR_GROUP = State()
 
 
-async def _prepare_day_response(message: Message, group_code: str, target_date: dt.date, title_prefix: str) -> tuple[list[Path], str]:
+async def _prepare_day_response(message: Message, group_code: str, target_date: dt.date, title_prefix: str) -> tuple[list[CachedBanner], str]:
     ctx = get_context()
     schedule = await ctx.schedule_service.get_schedule_data(group_code, target_date)
     style = await ctx.db.get_schedule_style(message.from_user.id)
@@ -30,29 +31,34 @@ async def _prepare_day_response(message: Message, group_code: str, target_date:
     return banners, text
 
 
-async def _prepare_week_response(message: Message, group_code: str, base_date: dt.date) -> tuple[list[Path], str]:
+async def _prepare_week_response(message: Message, group_code: str, base_date: dt.date) -> tuple[list[CachedBanner], str]:
     ctx = get_context()
     schedule = await ctx.schedule_service.get_schedule_data(group_code, base_date)
     style = await ctx.db.get_schedule_style(message.from_user.id)
-    banners = await ctx.schedule_service.generate_week_banners(
+    banner = await ctx.schedule_service.generate_week_banner(
         schedule, group_code, base_date, style
     )
     text = ctx.schedule_service.build_week_schedule_text(schedule, base_date, group_code)
+    banners = [banner] if banner else []
     return banners, text
 
 
-async def _send_banners(message: Message, banners: list[Path]) -> None:
+async def _send_banners(message: Message, banners: list[CachedBanner]) -> None:
+    cache = get_context().schedule_service.banner_cache
     for banner in banners:
-        try:
-            await message.answer_photo(FSInputFile(banner))
-        finally:
+        if banner.file_id:
             try:
-                banner.unlink(missing_ok=True)
-            except OSError:
-                pass
+                await message.answer_photo(banner.file_id)
+                continue
+            except TelegramBadRequest:
+                # The file_id went stale; upload the file again below.
+                cache.forget_file_id(banner.key)
+        sent = await message.answer_photo(FSInputFile(banner.path))
+        if sent.photo:
+            cache.remember_file_id(banner.key, sent.photo[-1].file_id)
 
 
-async def _send_schedule(message: Message, banners: list[Path], text: str) -> None:
+async def _send_schedule(message: Message, banners: list[CachedBanner], text: str) -> None:
     if banners:
         await _send_banners(message, banners)
     await message.answer(text, reply_markup=schedule_keyboard())
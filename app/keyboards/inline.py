@@ -16,13 +16,13 @@ def tos_keyboard() -> InlineKeyboardMarkup:
     )
 
 
-def broadcast_cancel_inline_keyboard() -> InlineKeyboardMarkup:
+def broadcast_cancel_inline_keyboard(job_id: int | None = None) -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(
         inline_keyboard=[
             [
                 InlineKeyboardButton(
                     text="❌ Отмена",
-                    callback_data="broadcast_cancel",
+                    callback_data="broadcast_cancel" if job_id is None else f"broadcast_cancel:{job_id}",
                 )
             ]
         ]
@@ -0,0 +1,83 @@
+from typing import Any
+
+
+def normalize_username(username: str | None) -> str | None:
+    if not username:
+        return None
+    return username.lower()
+
+
+class BanIndex:
+    """In-memory mirror of ``banned_users`` keyed by tg_id and lowercase username."""
+
+    def __init__(self) -> None:
+        self.loaded = False
+        self._rows: dict[int, dict[str, Any]] = {}
+        self._by_tg_id: dict[int, set[int]] = {}
+        self._by_username: dict[str, set[int]] = {}
+
+    def load(self, rows: list[dict[str, Any]]) -> None:
+        self._rows.clear()
+        self._by_tg_id.clear()
+        self._by_username.clear()
+        for row in rows:
+            self.add(row)
+        self.loaded = True
+
+    def add(self, row: dict[str, Any]) -> None:
+        row_id = row["id"]
+        self._rows[row_id] = row
+        tg_id = row.get("tg_id")
+        if tg_id is not None:
+            self._by_tg_id.setdefault(tg_id, set()).add(row_id)
+        username_lc = normalize_username(row.get("username"))
+        if username_lc:
+            self._by_username.setdefault(username_lc, set()).add(row_id)
+
+    def _discard(self, row_id: int) -> None:
+        row = self._rows.pop(row_id, None)
+        if row is None:
+            return
+        tg_id = row.get("tg_id")
+        if tg_id is not None:
+            ids = self._by_tg_id.get(tg_id)
+            if ids is not None:
+                ids.discard(row_id)
+                if not ids:
+                    del self._by_tg_id[tg_id]
+        username_lc = normalize_username(row.get("username"))
+        if username_lc:
+            ids = self._by_username.get(username_lc)
+            if ids is not None:
+                ids.discard(row_id)
+                if not ids:
+                    del self._by_username[username_lc]
+
+    def remove(self, tg_id: int | None = None, username: str | None = None) -> None:
+        row_ids: set[int] = set()
+        if tg_id is not None:
+            row_ids |= self._by_tg_id.get(tg_id, set())
+        username_lc = normalize_username(username)
+        if username_lc:
+            row_ids |= self._by_username.get(username_lc, set())
+        for row_id in row_ids:
+            self._discard(row_id)
+
+    def lookup(self, tg_id: int | None, username: str | None) -> dict[str, Any] | None:
+        row_ids: set[int] = set()
+        if tg_id is not None:
+            row_ids |= self._by_tg_id.get(tg_id, set())
+        username_lc = normalize_username(username)
+        if username_lc:
+            row_ids |= self._by_username.get(username_lc, set())
+        if not row_ids:
+            return None
+        rows = [self._rows[row_id] for row_id in row_ids]
+        latest = max(rows, key=lambda r: (r.get("created_at") or "", r["id"]))
+        return dict(latest)
+
+    def is_banned(self, tg_id: int | None, username: str | None) -> bool:
+        if tg_id is not None and tg_id in self._by_tg_id:
+            return True
+        username_lc = normalize_username(username)
+        return bool(username_lc) and username_lc in self._by_username
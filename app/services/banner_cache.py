@@ -0,0 +1,242 @@
+import datetime as dt
+import hashlib
+import json
+import logging
+import os
+from collections import OrderedDict
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
+from uuid import uuid4
+
+from app.services.single_flight import SingleFlight
+
+
+@dataclass
+class CachedBanner:
+    key: str
+    path: Path
+    file_id: str | None = None
+
+
+class BannerCache:
+    """Size-bounded on-disk LRU of rendered banners.
+
+    Entries are keyed by a hash of everything that ends up in the picture.
+    After the first upload the Telegram ``file_id`` is remembered, so later
+    requests re-send the photo without rendering or uploading it again. The
+    index (order and file ids) is kept in ``index.json`` next to the files.
+    """
+
+    def __init__(self, directory: Path, max_bytes: int = 200 * 1024 * 1024) -> None:
+        self.directory = directory
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.index_path = directory / "index.json"
+        self._entries: OrderedDict[str, dict[str, Any]] = OrderedDict()
+        self._bytes = 0
+        self._inflight = SingleFlight()
+        self.stats = {"file_id_hits": 0, "disk_hits": 0, "renders": 0, "evictions": 0}
+        self._load_index()
+
+    @staticmethod
+    def make_key(*parts: Any) -> str:
+        raw = json.dumps(parts, ensure_ascii=False, sort_keys=True, default=str)
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.directory / f"{key}.png"
+
+    def _load_index(self) -> None:
+        try:
+            with self.index_path.open("r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (FileNotFoundError, ValueError):
+            data = []
+        if not isinstance(data, list):
+            data = []
+        for item in data:
+            if not isinstance(item, dict) or not isinstance(item.get("key"), str):
+                continue
+            path = self._path(item["key"])
+            try:
+                size = path.stat().st_size
+            except OSError:
+                continue
+            self._entries[item["key"]] = {
+                "size": size,
+                "file_id": item.get("file_id"),
+                "day": item.get("day"),
+                "since": item.get("since"),
+                "group": item.get("group"),
+            }
+            self._bytes += size
+        # Files the index does not know about (e.g. after a crash) are garbage.
+        for path in self.directory.glob("*.png"):
+            if path.stem not in self._entries:
+                path.unlink(missing_ok=True)
+        self._evict()
+
+    def _save_index(self) -> None:
+        data = [
+            {
+                "key": key,
+                "file_id": entry.get("file_id"),
+                "day": entry.get("day"),
+                "since": entry.get("since"),
+                "group": entry.get("group"),
+            }
+            for key, entry in self._entries.items()
+        ]
+        tmp = self.index_path.with_suffix(".tmp")
+        try:
+            with tmp.open("w", encoding="utf-8") as f:
+                json.dump(data, f)
+            os.replace(tmp, self.index_path)
+        except OSError as e:
+            logging.error("banner cache: failed to save index: %s", e)
+
+    def _evict(self) -> None:
+        evicted = False
+        while self._bytes > self.max_bytes and len(self._entries) > 1:
+            key, entry = self._entries.popitem(last=False)
+            self._bytes -= entry["size"]
+            self._path(key).unlink(missing_ok=True)
+            self.stats["evictions"] += 1
+            evicted = True
+        if evicted:
+            self._save_index()
+
+    def _hit(self, key: str) -> CachedBanner | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        path = self._path(key)
+        # Even with a file_id the PNG must be there: it is what gets uploaded
+        # when Telegram rejects the file_id.
+        if not path.exists():
+            self._bytes -= entry["size"]
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        if entry.get("file_id"):
+            self.stats["file_id_hits"] += 1
+        else:
+            self.stats["disk_hits"] += 1
+        return CachedBanner(key=key, path=path, file_id=entry.get("file_id"))
+
+    async def get_or_render(
+        self,
+        key: str,
+        render: Callable[[Path], Awaitable[None]],
+        day: dt.date | None = None,
+        group: str | None = None,
+        since: dt.date | None = None,
+    ) -> CachedBanner | None:
+        """``since``..``day`` are the schedule dates the banner shows (``day``
+        alone for one day) and ``group`` whose they are; ``prune`` and
+        ``evict`` use them."""
+        cached = self._hit(key)
+        if cached is not None:
+            return cached
+        # Someone else rendering the same banner right now shares the result.
+        return await self._inflight.run(key, lambda: self._render(key, render, day, group, since))
+
+    async def _render(
+        self,
+        key: str,
+        render: Callable[[Path], Awaitable[None]],
+        day: dt.date | None,
+        group: str | None = None,
+        since: dt.date | None = None,
+    ) -> CachedBanner | None:
+        self.stats["renders"] += 1
+        path = self._path(key)
+        tmp = self.directory / f"{key}.{uuid4().hex}.tmp"
+        try:
+            await render(tmp)
+            if not tmp.exists():
+                return None
+            os.replace(tmp, path)
+        finally:
+            tmp.unlink(missing_ok=True)
+        size = path.stat().st_size
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._bytes -= old["size"]
+        self._entries[key] = {
+            "size": size,
+            "file_id": None,
+            "day": day.isoformat() if day else None,
+            "since": since.isoformat() if since else None,
+            "group": group,
+        }
+        self._bytes += size
+        self._evict()
+        return CachedBanner(key=key, path=path)
+
+    def remember_file_id(self, key: str, file_id: str) -> None:
+        entry = self._entries.get(key)
+        if entry is None or entry.get("file_id") == file_id:
+            return
+        entry["file_id"] = file_id
+        self._save_index()
+
+    def forget_file_id(self, key: str) -> None:
+        entry = self._entries.get(key)
+        if entry is None or not entry.get("file_id"):
+            return
+        entry["file_id"] = None
+        self._save_index()
+
+    def prune(self, before: dt.date) -> tuple[int, int]:
+        """Drop banners of days before ``before``; returns (files, bytes) removed."""
+        cutoff = before.isoformat()
+        return self._drop(lambda entry: bool(entry.get("day")) and entry["day"] < cutoff)
+
+    def evict(self, group: str, dates: list[dt.date]) -> tuple[int, int]:
+        """Drop ``group``'s banners showing any of ``dates``; returns (files, bytes) removed."""
+        days = [d.isoformat() for d in dates]
+
+        def _shows(entry: dict[str, Any]) -> bool:
+            last = entry.get("day")
+            if entry.get("group") != group or not last:
+                return False
+            first = entry.get("since") or last
+            return any(first <= d <= last for d in days)
+
+        return self._drop(_shows)
+
+    def _drop(self, match: Callable[[dict[str, Any]], bool]) -> tuple[int, int]:
+        dropped = 0
+        files = 0
+        reclaimed = 0
+        for key, entry in list(self._entries.items()):
+            if not match(entry):
+                continue
+            del self._entries[key]
+            dropped += 1
+            self._bytes -= entry["size"]
+            path = self._path(key)
+            if path.exists():
+                path.unlink(missing_ok=True)
+                files += 1
+                reclaimed += entry["size"]
+        if dropped:
+            self._save_index()
+        return files, reclaimed
+
+    def clear(self) -> None:
+        for key in list(self._entries):
+            self._path(key).unlink(missing_ok=True)
+        self._entries.clear()
+        self._bytes = 0
+        self._save_index()
+
+    @property
+    def size_bytes(self) -> int:
+        return self._bytes
+
+    def __len__(self) -> int:
+        return len(self._entries)
@@ -0,0 +1,298 @@
+import functools
+import logging
+import os
+import re
+from pathlib import Path
+from typing import Any
+
+try:
+    from PIL import Image, ImageColor, ImageDraw, ImageFilter, ImageFont
+except ImportError:  # pragma: no cover - optional dependency
+    Image = None
+
+# Mirrors the CSS of ScheduleService._banner_css so both backends produce
+# the same picture.
+BANNER_PAD_X = 32
+BANNER_PAD_Y = 28
+BANNER_RADIUS = 18
+OVERLAY_PAD = (20, 18, 18, 18)  # top, right, bottom, left
+OVERLAY_RADIUS = 14
+OVERLAY_FILL = (0, 0, 0, 89)
+TITLE_SIZE = 28
+TITLE_GAP = 14
+DAY_TITLE_SIZE = 22
+DAY_TITLE_GAP = 10
+WEEK_SPACING = 18
+TABLE_SIZE = 16
+CELL_PAD_X = 12
+CELL_PAD_Y = 10
+COLUMNS = (0.08, 0.22, 0.35, 0.35)
+HEADERS = ("#", "Время", "Подгруппа 1", "Подгруппа 2")
+LINE_HEIGHT = 1.2
+PNG_COMPRESS_LEVEL = 3
+GRADIENT = ((0x1A, 0x2A, 0x6C), (0x16, 0x22, 0x2A))
+
+FONT_CANDIDATES = {
+    False: ("DejaVuSans.ttf", "Arial.ttf", "arial.ttf", "LiberationSans-Regular.ttf"),
+    True: ("DejaVuSans-Bold.ttf", "Arial_Bold.ttf", "arialbd.ttf", "LiberationSans-Bold.ttf"),
+}
+_font_overrides: dict[bool, str | None] = {False: None, True: None}
+
+_RGBA_RE = re.compile(r"rgba?\(([^)]*)\)")
+
+
+def configure_fonts(regular: str | None = None, bold: str | None = None) -> None:
+    _font_overrides[False] = regular
+    _font_overrides[True] = bold or regular
+    _font.cache_clear()
+
+
+@functools.lru_cache(maxsize=16)
+def _font(size: int, bold: bool = False):
+    names = [_font_overrides[bold]] if _font_overrides[bold] else []
+    for name in names + list(FONT_CANDIDATES[bold]):
+        try:
+            return ImageFont.truetype(name, size)
+        except OSError:
+            continue
+    logging.error("banner renderer: no TrueType font found, Cyrillic will not render")
+    return ImageFont.load_default(size)
+
+
+def preload_fonts() -> None:
+    for size in (TABLE_SIZE, DAY_TITLE_SIZE, TITLE_SIZE):
+        _font(size, False)
+        _font(size, True)
+
+
+def _color(value: str) -> tuple[int, int, int, int]:
+    value = value.strip()
+    match = _RGBA_RE.search(value)
+    if not match:
+        r, g, b = ImageColor.getrgb(value)[:3]
+        return r, g, b, 255
+    parts = [p.strip() for p in match.group(1).split(",")]
+    r, g, b = (int(float(p)) for p in parts[:3])
+    alpha = float(parts[3]) if len(parts) > 3 else 1.0
+    return r, g, b, round(alpha * 255)
+
+
+def _shadow(value: str) -> tuple[int, int, int, tuple[int, int, int, int]]:
+    """Parse ``text-shadow: <x> <y> <blur> <color>``."""
+    head = value.split("rgb", 1)[0].split()
+    offsets = [int(float(p.replace("px", ""))) for p in head[:3]] + [0, 0, 0]
+    return offsets[0], offsets[1], offsets[2], _color(value)
+
+
+@functools.lru_cache(maxsize=4)
+def _scaled_background(path: str, mtime: float, width: int):
+    with Image.open(path) as im:
+        im = im.convert("RGB")
+        height = max(1, round(im.height * width / im.width))
+        return im.resize((width, height), Image.LANCZOS)
+
+
+@functools.lru_cache(maxsize=4)
+def _gradient(width: int, height: int):
+    # 135deg linear gradient, drawn small and scaled up.
+    w, h = max(2, width // 16), max(2, height // 16)
+    small = Image.new("RGB", (w, h))
+    (r1, g1, b1), (r2, g2, b2) = GRADIENT
+    data = []
+    for y in range(h):
+        for x in range(w):
+            t = (x / (w - 1) + y / (h - 1)) / 2
+            data.append((round(r1 + (r2 - r1) * t), round(g1 + (g2 - g1) * t), round(b1 + (b2 - b1) * t)))
+    small.putdata(data)
+    return small.resize((width, height), Image.BILINEAR)
+
+
+def _background(path: str | None, width: int, height: int, overlay: tuple[int, int, int, int]):
+    mtime = None
+    if path:
+        try:
+            mtime = os.stat(path).st_mtime
+        except OSError:
+            path = None
+    if not path:
+        return _gradient(width, height).convert("RGBA")
+    img = _scaled_background(path, mtime, width)
+    if img.height < height:
+        # background-size: cover — grow until the height fits too.
+        scaled_w = round(width * height / img.height)
+        img = img.resize((scaled_w, height), Image.LANCZOS)
+    left = (img.width - width) // 2
+    top = (img.height - height) // 2
+    img = img.crop((left, top, left + width, top + height)).convert("RGBA")
+    img.alpha_composite(Image.new("RGBA", img.size, overlay))
+    return img
+
+
+def _line_height(font) -> int:
+    return round(font.size * LINE_HEIGHT)
+
+
+@functools.lru_cache(maxsize=4096)
+def _wrap(text: str, size: int, bold: bool, width: int) -> tuple[str, ...]:
+    # Subjects repeat across days, weeks and groups, so line breaks are memoized.
+    font = _font(size, bold)
+    lines: list[str] = []
+    for paragraph in text.split("\n"):
+        line = ""
+        for word in paragraph.split():
+            candidate = f"{line} {word}" if line else word
+            if font.getlength(candidate) <= width:
+                line = candidate
+                continue
+            if line:
+                lines.append(line)
+            # A single word wider than the column is broken by characters.
+            line = ""
+            for ch in word:
+                if line and font.getlength(line + ch) > width:
+                    lines.append(line)
+                    line = ""
+                line += ch
+        lines.append(line)
+    return tuple(lines) or ("",)
+
+
+class _Canvas:
+    """Collects shapes and text so translucent fills can be composited once."""
+
+    def __init__(self) -> None:
+        self.boxes: list[tuple[tuple[int, int, int, int], Any, Any, int]] = []
+        self.texts: list[tuple[tuple[int, int], str, Any, Any]] = []
+        self.shadows: list[tuple[tuple[int, int], str, Any, tuple[int, int, int, tuple]]] = []
+
+
+def _column_widths(width: int) -> list[int]:
+    widths = [int(width * share) for share in COLUMNS[:-1]]
+    widths.append(width - sum(widths))
+    return widths
+
+
+def _layout_table(rows: list[dict[str, str]], width: int):
+    widths = _column_widths(width)
+    laid: list[tuple[int, list[tuple[str, ...]], bool]] = []
+    for values, header in [(HEADERS, True)] + [
+        ((r["pair"], r["time"], r["sub1"], r["sub2"]), False) for r in rows
+    ]:
+        cells = [_wrap(str(v), TABLE_SIZE, header, w - 2 * CELL_PAD_X) for v, w in zip(values, widths)]
+        height = max(len(c) for c in cells) * _line_height(_font(TABLE_SIZE, header)) + 2 * CELL_PAD_Y
+        laid.append((height, cells, header))
+    return widths, laid, sum(h for h, _, _ in laid)
+
+
+def _draw_table(canvas: _Canvas, x: int, y: int, layout, palette: dict) -> None:
+    widths, laid, _ = layout
+    cell = _color(palette["cell"])
+    border = _color(palette["border"])
+    header_color = _color(palette["header"])
+    accent = _color(palette["accent"])
+    for height, cells, header in laid:
+        font = _font(TABLE_SIZE, header)
+        line_h = _line_height(font)
+        cx = x
+        for col, (w, lines) in enumerate(zip(widths, cells)):
+            canvas.boxes.append(((cx, y, cx + w, y + height), cell, border, 1))
+            ty = y + (height - len(lines) * line_h) // 2
+            color = accent if header and col == 1 else header_color
+            for line in lines:
+                if col == 0:
+                    tx = cx + (w - round(font.getlength(line))) // 2
+                else:
+                    tx = cx + CELL_PAD_X
+                canvas.texts.append(((tx, ty), line, font, color))
+                ty += line_h
+            cx += w
+        y += height
+
+
+def draw_banner(spec: dict[str, Any], out_path: str) -> None:
+    """Draw a day (one entry in ``days``) or week banner straight to PNG.
+
+    ``spec`` holds ``title``, ``days`` (``[(day_title or None, rows)]``),
+    ``palette`` (see banner_styles.STYLE_PALETTES), ``background`` (path
+    or None) and ``width``.
+    """
+    if Image is None:
+        return
+    palette = spec["palette"]
+    width = spec["width"]
+    days = spec["days"]
+    week = len(days) > 1 or days[0][0] is not None
+    title_font = _font(TITLE_SIZE, True)
+    inner_x = BANNER_PAD_X + OVERLAY_PAD[3]
+    inner_w = width - 2 * BANNER_PAD_X - OVERLAY_PAD[1] - OVERLAY_PAD[3]
+
+    # Measure first so the background can be cut to the final size.
+    panels: list[tuple[int, int, str | None, Any]] = []
+    if week:
+        col_w = (inner_w - WEEK_SPACING) // 2
+        day_font = _font(DAY_TITLE_SIZE, True)
+        panel_head = _line_height(day_font) + DAY_TITLE_GAP
+        offset = 0
+        for i in range(0, len(days), 2):
+            pair = days[i:i + 2]
+            layouts = [_layout_table(rows, col_w) for _, rows in pair]
+            for j, ((day_title, _), layout) in enumerate(zip(pair, layouts)):
+                panels.append((j * (col_w + WEEK_SPACING), offset, day_title, layout))
+            offset += panel_head + max(layout[2] for layout in layouts) + WEEK_SPACING
+        content_h = offset - WEEK_SPACING
+    else:
+        layout = _layout_table(days[0][1], inner_w)
+        content_h = layout[2]
+        panels.append((0, 0, None, layout))
+
+    title_h = _line_height(title_font)
+    content_top = BANNER_PAD_Y + OVERLAY_PAD[0] + title_h + TITLE_GAP
+    height = content_top + content_h + OVERLAY_PAD[2] + BANNER_PAD_Y
+
+    canvas = _Canvas()
+    title_color = _color(palette["header"])
+    shadow = _shadow(palette["title_shadow"])
+    canvas.shadows.append(((inner_x, BANNER_PAD_Y + OVERLAY_PAD[0]), spec["title"], title_font, shadow))
+    canvas.texts.append(((inner_x, BANNER_PAD_Y + OVERLAY_PAD[0]), spec["title"], title_font, title_color))
+    for px, py, day_title, layout in panels:
+        x = inner_x + px
+        y = content_top + py
+        if day_title is not None:
+            day_font = _font(DAY_TITLE_SIZE, True)
+            canvas.shadows.append(((x, y), day_title, day_font, shadow))
+            canvas.texts.append(((x, y), day_title, day_font, title_color))
+            y += _line_height(day_font) + DAY_TITLE_GAP
+        _draw_table(canvas, x, y, layout, palette)
+
+    image = _background(spec.get("background"), width, height, _color(palette["bg_overlay"]))
+    layer = Image.new("RGBA", image.size, (0, 0, 0, 0))
+    ImageDraw.Draw(layer).rounded_rectangle(
+        (BANNER_PAD_X, BANNER_PAD_Y, width - BANNER_PAD_X, height - BANNER_PAD_Y),
+        radius=OVERLAY_RADIUS,
+        fill=OVERLAY_FILL,
+    )
+    image.alpha_composite(layer)
+    layer = Image.new("RGBA", image.size, (0, 0, 0, 0))
+    draw = ImageDraw.Draw(layer)
+    for box, fill, outline, line_width in canvas.boxes:
+        draw.rectangle(box, fill=fill, outline=outline, width=line_width)
+    image.alpha_composite(layer)
+    for (x, y), text, font, (dx, dy, blur, color) in canvas.shadows:
+        # Blur only the patch under the text, not a full-size layer.
+        margin = blur + 2
+        left, top, right, bottom = font.getbbox(text)
+        patch = Image.new("RGBA", (right + 2 * margin, bottom + 2 * margin), (0, 0, 0, 0))
+        ImageDraw.Draw(patch).text((margin, margin), text, font=font, fill=color)
+        if blur:
+            patch = patch.filter(ImageFilter.GaussianBlur(blur / 2))
+        image.alpha_composite(patch, (x + dx - margin, y + dy - margin))
+    draw = ImageDraw.Draw(image)
+    for xy, text, font, color in canvas.texts:
+        draw.text(xy, text, font=font, fill=color)
+
+    # Transparent rounded corners, like the HTML banner on a transparent page.
+    mask = Image.new("L", image.size, 0)
+    ImageDraw.Draw(mask).rounded_rectangle((0, 0, width - 1, height - 1), radius=BANNER_RADIUS, fill=255)
+    image.putalpha(mask)
+    # Telegram re-encodes photos anyway; heavier zlib levels only cost CPU.
+    image.save(Path(out_path), format="PNG", compress_level=PNG_COMPRESS_LEVEL)
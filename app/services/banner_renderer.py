@@ -0,0 +1,177 @@
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Any
+
+from app.services import banner_pillow
+
+try:
+    from weasyprint import HTML, CSS
+except (ImportError, OSError):  # pragma: no cover - optional dependency
+    HTML = None
+    CSS = None
+
+_WARM_UP_HTML = "<html><body style=\"font-family: 'Arial', sans-serif\"><b>Пн</b> 1 • 08:30</body></html>"
+
+
+BACKENDS = ("weasyprint", "pillow")
+
+
+def warm_up(backend: str = "weasyprint", fonts: tuple[str | None, str | None] = (None, None)) -> None:
+    """Process-pool initializer: load the backend and its fonts once per worker."""
+    if backend == "pillow":
+        banner_pillow.configure_fonts(*fonts)
+        if banner_pillow.Image is not None:
+            banner_pillow.preload_fonts()
+        return
+    if HTML is None:
+        return
+    try:
+        HTML(string=_WARM_UP_HTML).render()
+    except Exception as e:  # pragma: no cover - optional dependency issues
+        logging.error("banner renderer warm-up failed: %s", e)
+
+
+def _noop() -> None:
+    return None
+
+
+def render_html_to_png(html: str, out_path: str, base_url: str) -> None:
+    if HTML is None:
+        return
+    html_doc = HTML(string=html, base_url=base_url)
+    stylesheets = [CSS(string="body { background: transparent; }")]
+
+    # Newer versions of WeasyPrint ship write_png on the HTML instance, but
+    # some distributions package builds without this helper. Gracefully fall
+    # back to rendering the document and trying alternative outputs instead
+    # of crashing the bot with AttributeError.
+    if hasattr(html_doc, "write_png"):
+        html_doc.write_png(target=str(out_path), stylesheets=stylesheets)
+        return
+
+    try:
+        document = html_doc.render(stylesheets=stylesheets)
+    except Exception as e:  # pragma: no cover - optional dependency issues
+        logging.error("failed to render banner html: %s", e)
+        return
+
+    if hasattr(document, "write_png"):
+        document.write_png(target=str(out_path))
+        return
+
+    try:
+        from pdf2image import convert_from_bytes
+    except Exception as e:  # pragma: no cover - optional dependency issues
+        logging.error(
+            "PNG export is unavailable; install WeasyPrint with PNG support or pdf2image: %s",
+            e,
+        )
+        return
+
+    try:
+        pdf_bytes = document.write_pdf()
+        images = convert_from_bytes(pdf_bytes)
+        if images:
+            images[0].save(out_path, format="PNG")
+    except Exception as e:  # pragma: no cover - optional dependency issues
+        logging.error("failed to convert banner pdf to png: %s", e)
+
+
+class BannerRenderer:
+    """Runs banner rendering off the event loop.
+
+    ``backend`` is "weasyprint" (HTML via ``render``) or "pillow" (a layout
+    spec via ``draw``). With ``workers > 0`` renders go to a process pool
+    whose workers load the backend and fonts once, so banners render in
+    parallel instead of contending for the GIL. With ``workers == 0`` they
+    fall back to a thread like before. At most ``max_pending`` renders are
+    queued or running; further callers wait for a slot.
+    """
+
+    def __init__(
+        self,
+        workers: int = 2,
+        max_pending: int = 16,
+        backend: str = "weasyprint",
+        font: str | None = None,
+        font_bold: str | None = None,
+    ) -> None:
+        if backend not in BACKENDS:
+            raise ValueError(f"unknown banner renderer backend: {backend}")
+        self.workers = max(0, workers)
+        self.max_pending = max(1, max_pending)
+        self.backend = backend
+        self.fonts = (font, font_bold)
+        self._slots = asyncio.Semaphore(self.max_pending)
+        self._executor: ProcessPoolExecutor | None = None
+        self._active = 0
+        # Thread mode renders in this process.
+        banner_pillow.configure_fonts(*self.fonts)
+
+    @property
+    def available(self) -> bool:
+        if self.backend == "pillow":
+            return banner_pillow.Image is not None
+        return HTML is not None
+
+    @property
+    def busy(self) -> int:
+        """Renders currently queued or running."""
+        return self._active
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # spawn: forking a process that runs an event loop and sqlite
+            # threads is not safe.
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=warm_up,
+                initargs=(self.backend, self.fonts),
+            )
+        return self._executor
+
+    def start(self) -> None:
+        """Spin the workers up ahead of the first request."""
+        if self.workers and self.available:
+            executor = self._get_executor()
+            for _ in range(self.workers):
+                executor.submit(_noop)
+
+    async def render(self, html: str, out_path: Path, base_url: Path) -> None:
+        """Render banner HTML with WeasyPrint."""
+        await self._run(render_html_to_png, html, str(out_path), str(base_url))
+
+    async def draw(self, spec: dict[str, Any], out_path: Path) -> None:
+        """Draw a banner layout with Pillow (see ``banner_pillow.draw_banner``)."""
+        await self._run(banner_pillow.draw_banner, spec, str(out_path))
+
+    async def _run(self, func, *args: Any) -> None:
+        self._active += 1
+        try:
+            async with self._slots:
+                if not self.workers:
+                    await asyncio.to_thread(func, *args)
+                    return
+                loop = asyncio.get_running_loop()
+                try:
+                    await loop.run_in_executor(self._get_executor(), func, *args)
+                except BrokenProcessPool:
+                    # A worker died (OOM, segfault in a native lib): start a fresh pool.
+                    logging.error("banner renderer: process pool broke, restarting it")
+                    self._shutdown()
+                    await loop.run_in_executor(self._get_executor(), func, *args)
+        finally:
+            self._active -= 1
+
+    def _shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def close(self) -> None:
+        self._shutdown()
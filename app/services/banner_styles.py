@@ -0,0 +1,32 @@
+# Shared by the HTML and Pillow banners; kept apart from both renderers so a
+# palette can be had without loading WeasyPrint.
+STYLE_PALETTES = {
+    "Обычный": {
+        "header": "#ffffff",
+        "accent": "#8ab4f8",
+        "bg_overlay": "rgba(0, 0, 0, 0.45)",
+        "cell": "rgba(255, 255, 255, 0.08)",
+        "border": "rgba(255, 255, 255, 0.25)",
+        "title_shadow": "0 4px 12px rgba(0, 0, 0, 0.45)",
+    },
+    "Новогодний": {
+        "header": "#fefefe",
+        "accent": "#f04f54",
+        "bg_overlay": "rgba(0, 0, 0, 0.55)",
+        "cell": "rgba(255, 255, 255, 0.1)",
+        "border": "rgba(240, 79, 84, 0.45)",
+        "title_shadow": "0 6px 16px rgba(240, 79, 84, 0.45)",
+    },
+    "Премиальный": {
+        "header": "#f5e6c4",
+        "accent": "#d4af37",
+        "bg_overlay": "rgba(0, 0, 0, 0.55)",
+        "cell": "rgba(245, 230, 196, 0.08)",
+        "border": "rgba(212, 175, 55, 0.5)",
+        "title_shadow": "0 6px 16px rgba(212, 175, 55, 0.4)",
+    },
+}
+
+
+def style_palette(style: str) -> dict:
+    return STYLE_PALETTES.get(style, STYLE_PALETTES["Обычный"])
@@ -0,0 +1,127 @@
+import asyncio
+import datetime as dt
+import logging
+from collections.abc import Iterable
+
+
+class BannerWarmer:
+    """Renders "Сегодня"/"Завтра" banners ahead of the people who ask for them.
+
+    ``request`` marks groups whose schedule was (re)loaded; a background task
+    then renders their day banners in every style their users picked, one at
+    a time and only while the renderer has nothing else to do. Once a day at
+    ``morning_at`` all groups are warmed so the cache is hot for the morning
+    rush even when nothing changed overnight.
+    """
+
+    def __init__(
+        self,
+        schedule_service,
+        db,
+        tz: dt.tzinfo,
+        morning_at: dt.time = dt.time(5, 30),
+        idle_poll: float = 1.0,
+    ) -> None:
+        self.schedule_service = schedule_service
+        self.db = db
+        self.tz = tz
+        self.morning_at = morning_at
+        self.idle_poll = idle_poll
+        self._pending: set[str] = set()
+        self._all = False
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        self.stats = {"runs": 0, "banners": 0}
+
+    def request(self, groups: Iterable[str] | None = None) -> None:
+        """Queue a warm-up for ``groups`` (all groups when None)."""
+        if groups is None:
+            self._all = True
+        else:
+            self._pending.update(groups)
+        self._wakeup.set()
+
+    def on_schedule_changed(self, group: str, dates: list[dt.date], **_) -> None:
+        """schedule_changed handler: re-warm when today or tomorrow changed."""
+        today = dt.datetime.now(self.tz).date()
+        if any(d in (today, today + dt.timedelta(days=1)) for d in dates):
+            self.request([group])
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    def _seconds_until_morning(self) -> float:
+        now = dt.datetime.now(self.tz)
+        at = dt.datetime.combine(now.date(), self.morning_at, tzinfo=self.tz)
+        if at <= now:
+            at += dt.timedelta(days=1)
+        return (at - now).total_seconds()
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self._seconds_until_morning())
+            except asyncio.TimeoutError:
+                self._all = True
+            self._wakeup.clear()
+            try:
+                await self._warm()
+            except Exception as e:
+                logging.error("banner warm-up failed: %s", e)
+
+    def _targets(self) -> list[tuple[dt.date, str]]:
+        today = dt.datetime.now(self.tz).date()
+        tomorrow = today + dt.timedelta(days=1)
+        # Tomorrow is asked for as "Завтра" tonight and as "Сегодня" in the morning.
+        return [(today, "Сегодня"), (tomorrow, "Завтра"), (tomorrow, "Сегодня")]
+
+    async def _wait_idle(self) -> None:
+        renderer = self.schedule_service.renderer
+        while renderer.busy:
+            await asyncio.sleep(self.idle_poll)
+
+    async def _warm(self) -> None:
+        if not self.schedule_service.renderer.available:
+            self._pending.clear()
+            self._all = False
+            return
+        styles = await self.db.get_group_schedule_styles()
+        if self._all:
+            groups = set(styles)
+        else:
+            groups = self._pending & styles.keys()
+        self._pending.clear()
+        self._all = False
+        if not groups:
+            return
+        self.stats["runs"] += 1
+        targets = self._targets()
+        for group in sorted(groups):
+            for date_obj, prefix in targets:
+                try:
+                    schedule = await self.schedule_service.get_schedule_data(group, date_obj)
+                except Exception as e:
+                    logging.error("banner warm-up: schedule for %s failed: %s", group, e)
+                    break
+                for style in sorted(styles[group]):
+                    await self._wait_idle()
+                    try:
+                        banner = await self.schedule_service.generate_day_banner(
+                            schedule, group, date_obj, style, prefix
+                        )
+                    except Exception as e:
+                        logging.error("banner warm-up: %s %s failed: %s", group, style, e)
+                        continue
+                    if banner:
+                        self.stats["banners"] += 1
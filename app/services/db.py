@@ -1,104 +1,97 @@
+import asyncio
 import datetime as dt
-from typing import Any
+import json
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator
 
 import aiosqlite
 
+from app.services.ban_index import BanIndex, normalize_username
+from app.services.migrations import run_migrations
+from app.services.schedule_model import DaySchedule
+from app.services.user_cache import DEFAULT_SCHEDULE_STYLE, UserProfile, UserProfileCache
+
+STATEMENT_CACHE_SIZE = 256
+
+
+def _day_iso(date_str: str) -> str:
+    return dt.datetime.strptime(date_str, "%d.%m.%Y").date().isoformat()
+
+
+def _day_ru(day_iso: str) -> str:
+    return dt.date.fromisoformat(day_iso).strftime("%d.%m.%Y")
+
+
+def _encode_day(info: DaySchedule | dict[str, Any]) -> tuple[str, str]:
+    return DaySchedule.from_json(info).encode()
+
+
+def _decode_day(data: str) -> DaySchedule:
+    # Rows written before the model existed hold pairs/pairs_cols/merge maps.
+    return DaySchedule.from_json(json.loads(data))
+
+
+async def open_connection(path: str) -> aiosqlite.Connection:
+    """Open a long-lived SQLite connection tuned for a single bot process.
+
+    WAL lets readers proceed while a write is in flight and, together with
+    ``synchronous=NORMAL``, turns every commit into an append to the log
+    instead of a full fsync of the database file.
+    """
+
+    conn = await aiosqlite.connect(path, cached_statements=STATEMENT_CACHE_SIZE)
+    conn.row_factory = aiosqlite.Row
+    await conn.execute("PRAGMA journal_mode = WAL")
+    await conn.execute("PRAGMA synchronous = NORMAL")
+    await conn.execute("PRAGMA busy_timeout = 5000")
+    return conn
+
 
 class Database:
     def __init__(self, path: str) -> None:
         self.path = path
+        self._conn: aiosqlite.Connection | None = None
+        self._closed = False
+        self._lock = asyncio.Lock()
+        self._profiles = UserProfileCache()
+        self._bans = BanIndex()
+
+    @asynccontextmanager
+    async def _connect(self) -> AsyncIterator[aiosqlite.Connection]:
+        # All methods share one connection; the lock keeps multi-statement
+        # writes of concurrent handlers from interleaving inside one
+        # transaction.
+        async with self._lock:
+            if self._closed:
+                raise RuntimeError("database is closed")
+            if self._conn is None:
+                self._conn = await open_connection(self.path)
+            try:
+                yield self._conn
+            except BaseException:
+                await self._conn.rollback()
+                raise
+
+    async def close(self) -> None:
+        async with self._lock:
+            self._closed = True
+            if self._conn is None:
+                return
+            await self._conn.close()
+            self._conn = None
 
     async def init(self) -> None:
-        async with aiosqlite.connect(self.path) as db:
-            await db.execute(
-                """
-                CREATE TABLE IF NOT EXISTS users (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    tg_id INTEGER UNIQUE NOT NULL,
-                    username TEXT,
-                    first_name TEXT,
-                    last_name TEXT,
-                    tos_accepted INTEGER NOT NULL DEFAULT 0,
-                    group_code TEXT,
-                    created_at TEXT NOT NULL
-                )
-                """
-            )
-            cursor = await db.execute("PRAGMA table_info(users)")
-            rows = await cursor.fetchall()
-            column_names = {row[1] for row in rows}
-            if "is_blocked" not in column_names:
-                await db.execute(
-                    "ALTER TABLE users "
-                    "ADD COLUMN is_blocked INTEGER NOT NULL DEFAULT 0"
-                )
-            if "schedule_notify_enabled" not in column_names:
-                await db.execute(
-                    "ALTER TABLE users "
-                    "ADD COLUMN schedule_notify_enabled INTEGER NOT NULL DEFAULT 1"
-                )
-            if "schedule_style" not in column_names:
-                await db.execute(
-                    "ALTER TABLE users "
-                    "ADD COLUMN schedule_style TEXT"
-                )
-            await db.execute(
-                """
-                CREATE TABLE IF NOT EXISTS admin_sessions (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    tg_id INTEGER NOT NULL,
-                    level INTEGER NOT NULL,
-                    password TEXT NOT NULL,
-                    active INTEGER NOT NULL DEFAULT 1,
-                    created_at TEXT NOT NULL
-                )
-                """
-            )
-            await db.execute(
-                """
-                CREATE TABLE IF NOT EXISTS admin_login_limits (
-                    tg_id INTEGER PRIMARY KEY,
-                    attempts_left INTEGER NOT NULL,
-                    blocked_until TEXT
-                )
-                """
-            )
-            await db.execute(
-                """
-                CREATE TABLE IF NOT EXISTS banned_users (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    tg_id INTEGER,
-                    username TEXT,
-                    reason TEXT,
-                    created_at TEXT NOT NULL
-                )
-                """
-            )
-            await db.execute(
-                """
-                CREATE TABLE IF NOT EXISTS premium_users (
-                    tg_id INTEGER PRIMARY KEY,
-                    until TEXT NOT NULL
-                )
-                """
-            )
-            await db.execute(
-                """
-                CREATE TABLE IF NOT EXISTS stewards (
-                    tg_id INTEGER PRIMARY KEY,
-                    group_code TEXT NOT NULL
-                )
-                """
-            )
-            await db.execute(
-                """
-                CREATE TABLE IF NOT EXISTS homework_notifications (
-                    tg_id INTEGER PRIMARY KEY,
-                    minutes_before INTEGER NOT NULL
-                )
-                """
-            )
-            await db.commit()
+        async with self._connect() as db:
+            await run_migrations(db)
+            await self._load_bans(db)
+
+    async def _load_bans(self, db: aiosqlite.Connection) -> None:
+        cursor = await db.execute(
+            "SELECT id, tg_id, username, reason, created_at FROM banned_users"
+        )
+        rows = await cursor.fetchall()
+        self._bans.load([dict(r) for r in rows])
 
     async def ensure_user(
         self,
@@ -107,12 +100,13 @@ class Database:
         first_name: str | None,
         last_name: str | None,
     ) -> None:
-        async with aiosqlite.connect(self.path) as db:
+        async with self._connect() as db:
             await db.execute(
                 """
                 INSERT OR IGNORE INTO users (
                     tg_id,
                     username,
+                    username_lc,
                     first_name,
                     last_name,
                     tos_accepted,
@@ -120,11 +114,12 @@ class Database:
                     is_blocked,
                     created_at
                 )
-                VALUES (?, ?, ?, ?, 0, NULL, 0, ?)
+                VALUES (?, ?, ?, ?, ?, 0, NULL, 0, ?)
                 """,
                 (
                     tg_id,
                     username,
+                    normalize_username(username),
                     first_name,
                     last_name,
                     dt.datetime.utcnow().isoformat(),
@@ -133,17 +128,19 @@ class Database:
             await db.execute(
                 """
                 UPDATE users
-                SET username = ?, first_name = ?, last_name = ?
+                SET username = ?, username_lc = ?, first_name = ?, last_name = ?
                 WHERE tg_id = ?
                 """,
                 (
                     username,
+                    normalize_username(username),
                     first_name,
                     last_name,
                     tg_id,
                 ),
             )
             await db.commit()
+            self._profiles.invalidate(tg_id)
 
     async def accept_tos(
         self,
@@ -152,12 +149,13 @@ class Database:
         first_name: str | None,
         last_name: str | None,
     ) -> None:
-        async with aiosqlite.connect(self.path) as db:
+        async with self._connect() as db:
             await db.execute(
                 """
                 INSERT OR IGNORE INTO users (
                     tg_id,
                     username,
+                    username_lc,
                     first_name,
                     last_name,
                     tos_accepted,
@@ -165,11 +163,12 @@ class Database:
                     is_blocked,
                     created_at
                 )
-                VALUES (?, ?, ?, ?, 1, NULL, 0, ?)
+                VALUES (?, ?, ?, ?, ?, 1, NULL, 0, ?)
                 """,
                 (
                     tg_id,
                     username,
+                    normalize_username(username),
                     first_name,
                     last_name,
                     dt.datetime.utcnow().isoformat(),
@@ -180,46 +179,60 @@ class Database:
                 UPDATE users
                 SET tos_accepted = 1,
                     username = ?,
+                    username_lc = ?,
                     first_name = ?,
                     last_name = ?
                 WHERE tg_id = ?
                 """,
                 (
                     username,
+                    normalize_username(username),
                     first_name,
                     last_name,
                     tg_id,
                 ),
             )
             await db.commit()
+            self._profiles.invalidate(tg_id)
 
-    async def get_user(self, tg_id: int) -> dict[str, Any] | None:
-        async with aiosqlite.connect(self.path) as db:
-            db.row_factory = aiosqlite.Row
+    async def get_profile(self, tg_id: int) -> UserProfile:
+        profile = self._profiles.get(tg_id)
+        if profile is not None:
+            return profile
+        async with self._connect() as db:
             cursor = await db.execute(
                 """
                 SELECT
-                    id,
-                    tg_id,
-                    username,
-                    first_name,
-                    last_name,
-                    tos_accepted,
-                    group_code,
-                    is_blocked,
-                    created_at
-                FROM users
-                WHERE tg_id = ?
+                    u.id,
+                    u.username,
+                    u.first_name,
+                    u.last_name,
+                    u.tos_accepted,
+                    u.group_code,
+                    u.is_blocked,
+                    u.created_at,
+                    u.schedule_notify_enabled,
+                    u.schedule_style,
+                    p.until AS premium_until,
+                    s.group_code AS steward_group
+                FROM (SELECT ? AS tg_id) k
+                LEFT JOIN users u ON u.tg_id = k.tg_id
+                LEFT JOIN premium_users p ON p.tg_id = k.tg_id
+                LEFT JOIN stewards s ON s.tg_id = k.tg_id
                 """,
                 (tg_id,),
             )
             row = await cursor.fetchone()
-            if not row:
-                return None
-            return dict(row)
+            profile = UserProfile.from_row(tg_id, row)
+            self._profiles.put(profile)
+            return profile
+
+    async def get_user(self, tg_id: int) -> dict[str, Any] | None:
+        profile = await self.get_profile(tg_id)
+        return profile.as_user_dict()
 
     async def set_user_group(self, tg_id: int, group_code: str) -> None:
-        async with aiosqlite.connect(self.path) as db:
+        async with self._connect() as db:
             await db.execute(
                 """
                 INSERT OR IGNORE INTO users (
@@ -245,22 +258,27 @@ class Database:
                 (group_code, tg_id),
             )
             await db.commit()
+            profile = self._profiles.get(tg_id)
+            if profile is not None and profile.exists:
+                profile.group_code = group_code
+            else:
+                self._profiles.invalidate(tg_id)
 
     async def set_user_blocked(self, tg_id: int, blocked: bool) -> None:
-        async with aiosqlite.connect(self.path) as db:
+        async with self._connect() as db:
             await db.execute(
                 "UPDATE users SET is_blocked = ? WHERE tg_id = ?",
                 (1 if blocked else 0, tg_id),
             )
             await db.commit()
+            self._profiles.update_user(tg_id, is_blocked=1 if blocked else 0)
 
     async def list_users_page(
         self,
         page: int,
         per_page: int,
     ) -> tuple[list[dict[str, Any]], int, int]:
-        async with aiosqlite.connect(self.path) as db:
-            db.row_factory = aiosqlite.Row
+        async with self._connect() as db:
             cursor = await db.execute("SELECT COUNT(*) AS c FROM users")
             row = await cursor.fetchone()
             total = row["c"] if row else 0
@@ -299,8 +317,7 @@ class Database:
             return users, total, pages
 
     async def get_users_stats(self) -> dict[str, int]:
-        async with aiosqlite.connect(self.path) as db:
-            db.row_factory = aiosqlite.Row
+        async with self._connect() as db:
             cursor = await db.execute("SELECT COUNT(*) AS c FROM users")
             row = await cursor.fetchone()
             total = row["c"] if row else 0
@@ -327,8 +344,7 @@ class Database:
             }
 
     async def search_users(self, query: str) -> list[dict[str, Any]]:
-        async with aiosqlite.connect(self.path) as db:
-            db.row_factory = aiosqlite.Row
+        async with self._connect() as db:
             if query.isdigit():
                 cursor = await db.execute(
                     """
@@ -354,6 +370,8 @@ class Database:
                 )
             else:
                 username = query.lstrip("@").lower()
+                # A range on the indexed username_lc column instead of
+                # LOWER(username) LIKE keeps prefix search off a full scan.
                 cursor = await db.execute(
                     """
                     SELECT
@@ -371,10 +389,10 @@ class Database:
                               AND s.active = 1
                         ) AS is_admin
                     FROM users u
-                    WHERE LOWER(u.username) LIKE ?
+                    WHERE u.username_lc >= ? AND u.username_lc < ?
                     ORDER BY u.id
                     """,
-                    (username + "%",),
+                    (username, username + "\U0010ffff"),
                 )
             rows = await cursor.fetchall()
             return [dict(r) for r in rows]
@@ -383,8 +401,7 @@ class Database:
         self,
         tg_id: int,
     ) -> dict[str, Any] | None:
-        async with aiosqlite.connect(self.path) as db:
-            db.row_factory = aiosqlite.Row
+        async with self._connect() as db:
             cursor = await db.execute(
                 """
                 SELECT id, tg_id, level, password, active, created_at
@@ -404,8 +421,7 @@ class Database:
         self,
         password: str,
     ) -> dict[str, Any] | None:
-        async with aiosqlite.connect(self.path) as db:
-            db.row_factory = aiosqlite.Row
+        async with self._connect() as db:
             cursor = await db.execute(
                 """
                 SELECT id, tg_id, level, password, active, created_at
@@ -427,7 +443,7 @@ class Database:
         level: int,
         password: str,
     ) -> int:
-        async with aiosqlite.connect(self.path) as db:
+        async with self._connect() as db:
             now = dt.datetime.utcnow().isoformat()
             cursor = await db.execute(
                 """
@@ -446,7 +462,7 @@ class Database:
             return cursor.lastrowid
 
     async def deactivate_admin_sessions_for_user(self, tg_id: int) -> None:
-        async with aiosqlite.connect(self.path) as db:
+        async with self._connect() as db:
             await db.execute(
                 "UPDATE admin_sessions SET active = 0 WHERE tg_id = ? AND active = 1",
                 (tg_id,),
@@ -454,8 +470,7 @@ class Database:
             await db.commit()
 
     async def get_active_admin_sessions_with_users(self) -> list[dict[str, Any]]:
-        async with aiosqlite.connect(self.path) as db:
-            db.row_factory = aiosqlite.Row
+        async with self._connect() as db:
             cursor = await db.execute(
                 """
                 SELECT
@@ -481,8 +496,7 @@ class Database:
         self,
         session_id: int,
     ) -> dict[str, Any] | None:
-        async with aiosqlite.connect(self.path) as db:
-            db.row_factory = aiosqlite.Row
+        async with self._connect() as db:
             cursor = await db.execute(
                 """
                 SELECT id, tg_id, level, password, active, created_at
@@ -497,7 +511,7 @@ class Database:
             return dict(row)
 
     async def deactivate_admin_session_by_id(self, session_id: int) -> None:
-        async with aiosqlite.connect(self.path) as db:
+        async with self._connect() as db:
             await db.execute(
                 "UPDATE admin_sessions SET active = 0 WHERE id = ?",
                 (session_id,),
@@ -508,8 +522,7 @@ class Database:
         self,
         tg_id: int,
     ) -> dict[str, Any] | None:
-        async with aiosqlite.connect(self.path) as db:
-            db.row_factory = aiosqlite.Row
+        async with self._connect() as db:
             cursor = await db.execute(
                 """
                 SELECT tg_id, attempts_left, blocked_until
@@ -529,7 +542,7 @@ class Database:
         attempts_left: int,
         blocked_until: str | None,
     ) -> None:
-        async with aiosqlite.connect(self.path) as db:
+        async with self._connect() as db:
             await db.execute(
                 """
                 INSERT INTO admin_login_limits (tg_id, attempts_left, blocked_until)
@@ -543,25 +556,44 @@ class Database:
             await db.commit()
 
     async def clear_admin_login_limits(self, tg_id: int) -> None:
-        async with aiosqlite.connect(self.path) as db:
+        async with self._connect() as db:
             await db.execute(
                 "DELETE FROM admin_login_limits WHERE tg_id = ?",
                 (tg_id,),
             )
             await db.commit()
 
-    async def get_all_users_for_broadcast(self) -> list[dict[str, Any]]:
-        async with aiosqlite.connect(self.path) as db:
-            db.row_factory = aiosqlite.Row
+    async def get_broadcast_recipients(
+        self,
+        exclude_tg_id: int | None,
+        blocked_ids: list[int],
+        blocked_usernames: list[str],
+    ) -> list[int]:
+        async with self._connect() as db:
             cursor = await db.execute(
                 """
-                SELECT tg_id, username, is_blocked
-                FROM users
-                ORDER BY id
-                """
+                SELECT u.tg_id
+                FROM users u
+                WHERE u.tg_id IS NOT NULL
+                  AND COALESCE(u.is_blocked, 0) = 0
+                  AND u.tg_id != COALESCE(?, 0)
+                  AND u.tg_id NOT IN (SELECT value FROM json_each(?))
+                  AND (u.username_lc IS NULL OR u.username_lc NOT IN (SELECT value FROM json_each(?)))
+                  AND NOT EXISTS (SELECT 1 FROM banned_users b WHERE b.tg_id = u.tg_id)
+                  AND NOT EXISTS (
+                      SELECT 1 FROM banned_users b
+                      WHERE u.username_lc IS NOT NULL AND b.username_lc = u.username_lc
+                  )
+                ORDER BY u.id
+                """,
+                (
+                    exclude_tg_id,
+                    json.dumps([int(v) for v in blocked_ids]),
+                    json.dumps([normalize_username(v) for v in blocked_usernames if v]),
+                ),
             )
             rows = await cursor.fetchall()
-            return [dict(r) for r in rows]
+            return [int(r["tg_id"]) for r in rows]
 
     async def ban_user(
         self,
@@ -569,8 +601,8 @@ class Database:
         username: str | None,
         reason: str,
     ) -> None:
-        async with aiosqlite.connect(self.path) as db:
-            username_norm = username.lower() if username else None
+        async with self._connect() as db:
+            username_norm = normalize_username(username)
             if tg_id is not None:
                 await db.execute(
                     "DELETE FROM banned_users WHERE tg_id = ?",
@@ -578,41 +610,52 @@ class Database:
                 )
             if username_norm:
                 await db.execute(
-                    "DELETE FROM banned_users WHERE LOWER(username) = ?",
+                    "DELETE FROM banned_users WHERE username_lc = ?",
                     (username_norm,),
                 )
             now = dt.datetime.utcnow().isoformat()
-            await db.execute(
+            cursor = await db.execute(
                 """
-                INSERT INTO banned_users (tg_id, username, reason, created_at)
-                VALUES (?, ?, ?, ?)
+                INSERT INTO banned_users (tg_id, username, username_lc, reason, created_at)
+                VALUES (?, ?, ?, ?, ?)
                 """,
-                (tg_id, username, reason, now),
+                (tg_id, username, username_norm, reason, now),
             )
             await db.commit()
+            self._bans.remove(tg_id=tg_id, username=username)
+            self._bans.add(
+                {
+                    "id": cursor.lastrowid,
+                    "tg_id": tg_id,
+                    "username": username,
+                    "reason": reason,
+                    "created_at": now,
+                }
+            )
 
     async def unban_by_tg_id(self, tg_id: int) -> int:
-        async with aiosqlite.connect(self.path) as db:
+        async with self._connect() as db:
             cursor = await db.execute(
                 "DELETE FROM banned_users WHERE tg_id = ?",
                 (tg_id,),
             )
             await db.commit()
+            self._bans.remove(tg_id=tg_id)
             return cursor.rowcount
 
     async def unban_by_username(self, username: str) -> int:
-        async with aiosqlite.connect(self.path) as db:
-            username_norm = username.lower()
+        async with self._connect() as db:
+            username_norm = normalize_username(username)
             cursor = await db.execute(
-                "DELETE FROM banned_users WHERE LOWER(username) = ?",
+                "DELETE FROM banned_users WHERE username_lc = ?",
                 (username_norm,),
             )
             await db.commit()
+            self._bans.remove(username=username)
             return cursor.rowcount
 
     async def get_banned_users(self) -> list[dict[str, Any]]:
-        async with aiosqlite.connect(self.path) as db:
-            db.row_factory = aiosqlite.Row
+        async with self._connect() as db:
             cursor = await db.execute(
                 """
                 SELECT id, tg_id, username, reason, created_at
@@ -623,63 +666,35 @@ class Database:
             rows = await cursor.fetchall()
             return [dict(r) for r in rows]
 
+    async def _ensure_bans_loaded(self) -> None:
+        if not self._bans.loaded:
+            async with self._connect() as db:
+                if not self._bans.loaded:
+                    await self._load_bans(db)
+
     async def get_ban_for_user(
         self,
         tg_id: int,
         username: str | None,
     ) -> dict[str, Any] | None:
-        async with aiosqlite.connect(self.path) as db:
-            db.row_factory = aiosqlite.Row
-            username_norm = username.lower() if username else None
-            if username_norm:
-                cursor = await db.execute(
-                    """
-                    SELECT id, tg_id, username, reason, created_at
-                    FROM banned_users
-                    WHERE tg_id = ? OR LOWER(username) = ?
-                    ORDER BY created_at DESC, id DESC
-                    LIMIT 1
-                    """,
-                    (tg_id, username_norm),
-                )
-            else:
-                cursor = await db.execute(
-                    """
-                    SELECT id, tg_id, username, reason, created_at
-                    FROM banned_users
-                    WHERE tg_id = ?
-                    ORDER BY created_at DESC, id DESC
-                    LIMIT 1
-                    """,
-                    (tg_id,),
-                )
-            row = await cursor.fetchone()
-            if not row:
-                return None
-            return dict(row)
+        await self._ensure_bans_loaded()
+        return self._bans.lookup(tg_id, username)
 
     async def is_user_banned(self, tg_id: int, username: str | None) -> bool:
-        entry = await self.get_ban_for_user(tg_id, username)
-        return entry is not None
+        if not self._bans.loaded:
+            return await self.get_ban_for_user(tg_id, username) is not None
+        return self._bans.is_banned(tg_id, username)
+
+    async def exclude_banned(self, users: list[dict[str, Any]]) -> list[dict[str, Any]]:
+        await self._ensure_bans_loaded()
+        return [u for u in users if not self._bans.is_banned(u.get("tg_id"), u.get("username"))]
 
     async def is_user_premium(self, tg_id: int) -> bool:
-        async with aiosqlite.connect(self.path) as db:
-            db.row_factory = aiosqlite.Row
-            cursor = await db.execute(
-                "SELECT until FROM premium_users WHERE tg_id = ?",
-                (tg_id,),
-            )
-            row = await cursor.fetchone()
-            if not row:
-                return False
-            try:
-                until = dt.datetime.fromisoformat(row["until"])
-            except Exception:
-                return False
-            return until > dt.datetime.utcnow()
+        profile = await self.get_profile(tg_id)
+        return profile.active_premium_until() is not None
 
     async def set_user_premium(self, tg_id: int, until: dt.datetime) -> None:
-        async with aiosqlite.connect(self.path) as db:
+        async with self._connect() as db:
             await db.execute(
                 """
                 INSERT INTO premium_users (tg_id, until)
@@ -689,72 +704,57 @@ class Database:
                 (tg_id, until.isoformat()),
             )
             await db.commit()
+            self._profiles.update(tg_id, premium_until=until)
 
     async def get_user_premium_until(self, tg_id: int) -> dt.datetime | None:
-        async with aiosqlite.connect(self.path) as db:
-            db.row_factory = aiosqlite.Row
-            cursor = await db.execute(
-                "SELECT until FROM premium_users WHERE tg_id = ?",
-                (tg_id,),
-            )
-            row = await cursor.fetchone()
-            if not row:
-                return None
-            try:
-                until = dt.datetime.fromisoformat(row["until"])
-            except Exception:
-                return None
-            if until <= dt.datetime.utcnow():
-                return None
-            return until
+        profile = await self.get_profile(tg_id)
+        return profile.active_premium_until()
 
     async def get_schedule_notify_enabled(self, tg_id: int) -> bool:
-        async with aiosqlite.connect(self.path) as db:
-            db.row_factory = aiosqlite.Row
-            cursor = await db.execute(
-                "SELECT schedule_notify_enabled FROM users WHERE tg_id = ?",
-                (tg_id,),
-            )
-            row = await cursor.fetchone()
-            if not row:
-                return True
-            value = row["schedule_notify_enabled"]
-            if value is None:
-                return True
-            return bool(value)
+        profile = await self.get_profile(tg_id)
+        return profile.schedule_notify_enabled
 
     async def set_schedule_notify_enabled(self, tg_id: int, enabled: bool) -> None:
-        async with aiosqlite.connect(self.path) as db:
+        async with self._connect() as db:
             await db.execute(
                 "UPDATE users SET schedule_notify_enabled = ? WHERE tg_id = ?",
                 (1 if enabled else 0, tg_id),
             )
             await db.commit()
+            self._profiles.update_user(tg_id, schedule_notify_enabled=enabled)
 
     async def get_schedule_style(self, tg_id: int) -> str:
-        async with aiosqlite.connect(self.path) as db:
-            db.row_factory = aiosqlite.Row
-            cursor = await db.execute(
-                "SELECT schedule_style FROM users WHERE tg_id = ?",
-                (tg_id,),
-            )
-            row = await cursor.fetchone()
-            value = row["schedule_style"] if row else None
-            if not value:
-                return "Обычный"
-            return str(value)
+        profile = await self.get_profile(tg_id)
+        return profile.style_or_default()
 
     async def set_schedule_style(self, tg_id: int, style: str) -> None:
-        async with aiosqlite.connect(self.path) as db:
+        async with self._connect() as db:
             await db.execute(
                 "UPDATE users SET schedule_style = ? WHERE tg_id = ?",
                 (style, tg_id),
             )
             await db.commit()
+            self._profiles.update_user(tg_id, schedule_style=style)
+
+    async def get_group_schedule_styles(self) -> dict[str, set[str]]:
+        """Banner styles in use per group, counting only reachable users."""
+        async with self._connect() as db:
+            cursor = await db.execute(
+                """
+                SELECT DISTINCT group_code, COALESCE(NULLIF(schedule_style, ''), ?) AS style
+                FROM users
+                WHERE group_code IS NOT NULL AND group_code != '' AND COALESCE(is_blocked, 0) = 0
+                """,
+                (DEFAULT_SCHEDULE_STYLE,),
+            )
+            rows = await cursor.fetchall()
+        result: dict[str, set[str]] = {}
+        for r in rows:
+            result.setdefault(r["group_code"], set()).add(r["style"])
+        return result
 
     async def get_users_for_schedule_notifications(self, group_code: str) -> list[dict[str, Any]]:
-        async with aiosqlite.connect(self.path) as db:
-            db.row_factory = aiosqlite.Row
+        async with self._connect() as db:
             cursor = await db.execute(
                 """
                 SELECT tg_id, username, is_blocked, schedule_notify_enabled
@@ -780,7 +780,7 @@ class Database:
             return result
 
     async def set_steward(self, tg_id: int, group_code: str) -> None:
-        async with aiosqlite.connect(self.path) as db:
+        async with self._connect() as db:
             await db.execute(
                 """
                 INSERT INTO stewards (tg_id, group_code)
@@ -790,30 +790,23 @@ class Database:
                 (tg_id, group_code),
             )
             await db.commit()
+            self._profiles.update(tg_id, steward_group=group_code)
 
     async def remove_steward(self, tg_id: int) -> None:
-        async with aiosqlite.connect(self.path) as db:
+        async with self._connect() as db:
             await db.execute(
                 "DELETE FROM stewards WHERE tg_id = ?",
                 (tg_id,),
             )
             await db.commit()
+            self._profiles.update(tg_id, steward_group=None)
 
     async def get_steward_group(self, tg_id: int) -> str | None:
-        async with aiosqlite.connect(self.path) as db:
-            db.row_factory = aiosqlite.Row
-            cursor = await db.execute(
-                "SELECT group_code FROM stewards WHERE tg_id = ?",
-                (tg_id,),
-            )
-            row = await cursor.fetchone()
-            if not row:
-                return None
-            return row["group_code"]
+        profile = await self.get_profile(tg_id)
+        return profile.steward_group
 
     async def list_stewards(self) -> list[dict[str, Any]]:
-        async with aiosqlite.connect(self.path) as db:
-            db.row_factory = aiosqlite.Row
+        async with self._connect() as db:
             cursor = await db.execute(
                 """
                 SELECT
@@ -831,8 +824,7 @@ class Database:
             return [dict(r) for r in rows]
 
     async def get_homework_notify_minutes(self, tg_id: int) -> int | None:
-        async with aiosqlite.connect(self.path) as db:
-            db.row_factory = aiosqlite.Row
+        async with self._connect() as db:
             cursor = await db.execute(
                 "SELECT minutes_before FROM homework_notifications WHERE tg_id = ?",
                 (tg_id,),
@@ -843,7 +835,7 @@ class Database:
             return int(row["minutes_before"])
 
     async def set_homework_notify_minutes(self, tg_id: int, minutes_before: int) -> None:
-        async with aiosqlite.connect(self.path) as db:
+        async with self._connect() as db:
             await db.execute(
                 """
                 INSERT INTO homework_notifications (tg_id, minutes_before)
@@ -852,4 +844,340 @@ class Database:
                 """,
                 (tg_id, minutes_before),
             )
-            await db.commit()
\ No newline at end of file
+            await db.commit()
+
+    async def create_outbox_job(
+        self,
+        kind: str,
+        payload: dict[str, Any],
+        recipients: list[int],
+        created_by: int | None = None,
+        progress_chat_id: int | None = None,
+        progress_message_id: int | None = None,
+    ) -> int:
+        now = time.time()
+        async with self._connect() as db:
+            cursor = await db.execute(
+                """
+                INSERT INTO outbox_jobs (
+                    kind, payload, total, created_by, progress_chat_id, progress_message_id, created_at
+                )
+                VALUES (?, ?, 0, ?, ?, ?, ?)
+                """,
+                (
+                    kind,
+                    json.dumps(payload, ensure_ascii=False),
+                    created_by,
+                    progress_chat_id,
+                    progress_message_id,
+                    dt.datetime.utcnow().isoformat(),
+                ),
+            )
+            job_id = cursor.lastrowid
+            await db.executemany(
+                "INSERT OR IGNORE INTO outbox (job_id, tg_id, next_attempt_at) VALUES (?, ?, ?)",
+                [(job_id, tg_id, now) for tg_id in recipients],
+            )
+            await db.execute(
+                "UPDATE outbox_jobs SET total = (SELECT COUNT(*) FROM outbox WHERE job_id = ?) WHERE id = ?",
+                (job_id, job_id),
+            )
+            await db.commit()
+            return job_id
+
+    async def set_outbox_job_progress_message(self, job_id: int, chat_id: int, message_id: int) -> None:
+        async with self._connect() as db:
+            await db.execute(
+                "UPDATE outbox_jobs SET progress_chat_id = ?, progress_message_id = ? WHERE id = ?",
+                (chat_id, message_id, job_id),
+            )
+            await db.commit()
+
+    async def get_outbox_job(self, job_id: int) -> dict[str, Any] | None:
+        async with self._connect() as db:
+            cursor = await db.execute("SELECT * FROM outbox_jobs WHERE id = ?", (job_id,))
+            row = await cursor.fetchone()
+            if not row:
+                return None
+            job = dict(row)
+            job["payload"] = json.loads(job["payload"])
+            return job
+
+    async def get_active_outbox_job_ids(self) -> list[int]:
+        async with self._connect() as db:
+            cursor = await db.execute("SELECT id FROM outbox_jobs WHERE status = 'active' ORDER BY id")
+            rows = await cursor.fetchall()
+            return [int(r["id"]) for r in rows]
+
+    async def get_outbox_job_counts(self, job_id: int) -> dict[str, int]:
+        async with self._connect() as db:
+            cursor = await db.execute(
+                "SELECT status, COUNT(*) AS cnt FROM outbox WHERE job_id = ? GROUP BY status",
+                (job_id,),
+            )
+            rows = await cursor.fetchall()
+            return {r["status"]: int(r["cnt"]) for r in rows}
+
+    async def cancel_outbox_job(self, job_id: int) -> bool:
+        async with self._connect() as db:
+            cursor = await db.execute(
+                "UPDATE outbox_jobs SET status = 'cancelled', finished_at = ? WHERE id = ? AND status = 'active'",
+                (dt.datetime.utcnow().isoformat(), job_id),
+            )
+            if cursor.rowcount != 1:
+                await db.rollback()
+                return False
+            await db.execute(
+                "UPDATE outbox SET status = 'cancelled' WHERE job_id = ? AND status = 'pending'",
+                (job_id,),
+            )
+            await db.commit()
+            return True
+
+    async def finish_outbox_job(self, job_id: int, status: str = "done") -> None:
+        async with self._connect() as db:
+            await db.execute(
+                "UPDATE outbox_jobs SET status = ?, finished_at = ? WHERE id = ? AND status = 'active'",
+                (status, dt.datetime.utcnow().isoformat(), job_id),
+            )
+            await db.commit()
+
+    async def prune_outbox(self, before: dt.datetime) -> tuple[int, int]:
+        """Delete jobs finished before ``before`` (UTC) with their sent, failed
+        and cancelled items; returns (items, jobs) removed."""
+        async with self._connect() as db:
+            cutoff = before.isoformat()
+            cursor = await db.execute(
+                """
+                DELETE FROM outbox
+                WHERE status IN ('sent', 'failed', 'cancelled')
+                  AND job_id IN (
+                      SELECT id FROM outbox_jobs
+                      WHERE status != 'active' AND finished_at IS NOT NULL AND finished_at < ?
+                  )
+                """,
+                (cutoff,),
+            )
+            items = cursor.rowcount
+            cursor = await db.execute(
+                """
+                DELETE FROM outbox_jobs
+                WHERE status != 'active' AND finished_at IS NOT NULL AND finished_at < ?
+                  AND NOT EXISTS (SELECT 1 FROM outbox WHERE outbox.job_id = outbox_jobs.id)
+                """,
+                (cutoff,),
+            )
+            jobs = cursor.rowcount
+            await db.commit()
+            return items, jobs
+
+    async def recover_outbox(self) -> int:
+        # A row left in 'sending' may or may not have reached Telegram.
+        # Never resend it: a lost message beats a duplicate.
+        async with self._connect() as db:
+            cursor = await db.execute(
+                "UPDATE outbox SET status = 'failed', last_error = 'interrupted' WHERE status = 'sending'"
+            )
+            await db.commit()
+            return cursor.rowcount
+
+    async def get_due_outbox_items(self, limit: int, exclude: set[int] | None = None) -> list[dict[str, Any]]:
+        async with self._connect() as db:
+            cursor = await db.execute(
+                """
+                SELECT id, job_id, tg_id, attempts
+                FROM outbox
+                WHERE status = 'pending' AND next_attempt_at <= ?
+                ORDER BY next_attempt_at, id
+                LIMIT ?
+                """,
+                (time.time(), limit + len(exclude or ())),
+            )
+            rows = await cursor.fetchall()
+        items = [dict(r) for r in rows if not exclude or r["id"] not in exclude]
+        return items[:limit]
+
+    async def get_next_outbox_attempt_at(self) -> float | None:
+        async with self._connect() as db:
+            cursor = await db.execute("SELECT MIN(next_attempt_at) FROM outbox WHERE status = 'pending'")
+            row = await cursor.fetchone()
+            return float(row[0]) if row and row[0] is not None else None
+
+    async def claim_outbox_item(self, item_id: int) -> bool:
+        async with self._connect() as db:
+            cursor = await db.execute(
+                "UPDATE outbox SET status = 'sending' WHERE id = ? AND status = 'pending'",
+                (item_id,),
+            )
+            await db.commit()
+            return cursor.rowcount == 1
+
+    async def finish_outbox_item(self, item_id: int, status: str, error: str | None = None) -> None:
+        async with self._connect() as db:
+            await db.execute(
+                "UPDATE outbox SET status = ?, attempts = attempts + 1, last_error = ? WHERE id = ?",
+                (status, error, item_id),
+            )
+            await db.commit()
+
+    async def retry_outbox_item(
+        self,
+        item_id: int,
+        next_attempt_at: float,
+        error: str,
+        count_attempt: bool = True,
+    ) -> None:
+        async with self._connect() as db:
+            await db.execute(
+                """
+                UPDATE outbox
+                SET status = 'pending', attempts = attempts + ?, next_attempt_at = ?, last_error = ?
+                WHERE id = ? AND status = 'sending'
+                """,
+                (1 if count_attempt else 0, next_attempt_at, error, item_id),
+            )
+            await db.commit()
+
+    async def get_schedule_days(self, group_code: str, start: dt.date, end: dt.date) -> dict[str, DaySchedule]:
+        async with self._connect() as db:
+            cursor = await db.execute(
+                """
+                SELECT day, data FROM schedule_days
+                WHERE group_code = ? AND day BETWEEN ? AND ? AND data IS NOT NULL
+                ORDER BY day
+                """,
+                (group_code, start.isoformat(), end.isoformat()),
+            )
+            rows = await cursor.fetchall()
+        return {_day_ru(r["day"]): _decode_day(r["data"]) for r in rows}
+
+    async def upsert_schedule_days(self, group_code: str, days: dict[str, DaySchedule]) -> list[str]:
+        """Store freshly parsed days; returns the dates (``dd.mm.yyyy``) whose
+        stored content changed. Rows whose content hash is unchanged are left
+        alone; stored days inside the page's range that the page no longer
+        lists are withdrawn from users (the watchdog baseline stays)."""
+        now = time.time()
+        encoded = {}
+        for date_str, info in days.items():
+            try:
+                day = _day_iso(date_str)
+            except ValueError:
+                continue
+            encoded[day] = (date_str, *_encode_day(info))
+        if not encoded:
+            return []
+        async with self._connect() as db:
+            async with db.execute(
+                "SELECT day, hash FROM schedule_days WHERE group_code = ? AND day BETWEEN ? AND ?",
+                (group_code, min(encoded), max(encoded)),
+            ) as cursor:
+                stored = {r["day"]: r["hash"] for r in await cursor.fetchall()}
+            changed = {day: row for day, row in encoded.items() if stored.get(day) != row[2]}
+            withdrawn = [day for day, digest in stored.items() if day not in encoded and digest is not None]
+            if not changed and not withdrawn:
+                return []
+            await db.executemany(
+                """
+                INSERT INTO schedule_days (group_code, day, data, hash, updated_at)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(group_code, day) DO UPDATE SET
+                    data = excluded.data, hash = excluded.hash, updated_at = excluded.updated_at
+                """,
+                [(group_code, day, data, digest, now) for day, (_, data, digest) in changed.items()],
+            )
+            if withdrawn:
+                params = [(now, group_code, day) for day in withdrawn]
+                await db.executemany(
+                    "UPDATE schedule_days SET data = NULL, hash = NULL, updated_at = ? WHERE group_code = ? AND day = ?",
+                    params,
+                )
+                await db.executemany(
+                    "DELETE FROM schedule_days WHERE group_code = ? AND day = ? AND notified_data IS NULL",
+                    [(group_code, day) for day in withdrawn],
+                )
+            await db.commit()
+        return [date_str for date_str, _, _ in changed.values()] + [_day_ru(day) for day in withdrawn]
+
+    async def get_notified_schedule_day(self, group_code: str, date_obj: dt.date) -> DaySchedule | None:
+        async with self._connect() as db:
+            cursor = await db.execute(
+                "SELECT notified_data FROM schedule_days WHERE group_code = ? AND day = ?",
+                (group_code, date_obj.isoformat()),
+            )
+            row = await cursor.fetchone()
+        if row is None or row["notified_data"] is None:
+            return None
+        return _decode_day(row["notified_data"])
+
+    async def get_notified_schedule_hashes(
+        self, group_code: str, start: dt.date, end: dt.date
+    ) -> dict[str, tuple[str | None, str | None]]:
+        """(notified_hash, notified_fingerprint) per stored day, without loading the days."""
+        async with self._connect() as db:
+            cursor = await db.execute(
+                """
+                SELECT day, notified_hash, notified_fingerprint FROM schedule_days
+                WHERE group_code = ? AND day BETWEEN ? AND ?
+                """,
+                (group_code, start.isoformat(), end.isoformat()),
+            )
+            rows = await cursor.fetchall()
+        return {_day_ru(r["day"]): (r["notified_hash"], r["notified_fingerprint"]) for r in rows}
+
+    async def set_notified_schedule_days(
+        self,
+        group_code: str,
+        days: dict[str, DaySchedule | dict[str, Any]],
+        replace: bool = True,
+        fingerprints: dict[str, str] | None = None,
+    ) -> None:
+        """Record what subscribers were told; ``replace=False`` only fills days without a baseline.
+
+        ``fingerprints`` maps a day to the change set that was sent for it;
+        days without one keep their stored fingerprint.
+        """
+        now = time.time()
+        params = []
+        for date_str, info in days.items():
+            try:
+                day = _day_iso(date_str)
+            except ValueError:
+                continue
+            data, digest = _encode_day(info)
+            fingerprint = (fingerprints or {}).get(date_str)
+            params.append((group_code, day, data, digest, fingerprint, now))
+        if not params:
+            return
+        condition = "" if replace else "WHERE schedule_days.notified_hash IS NULL"
+        async with self._connect() as db:
+            await db.executemany(
+                f"""
+                INSERT INTO schedule_days
+                    (group_code, day, notified_data, notified_hash, notified_fingerprint, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(group_code, day) DO UPDATE SET
+                    notified_data = excluded.notified_data,
+                    notified_hash = excluded.notified_hash,
+                    notified_fingerprint = COALESCE(excluded.notified_fingerprint, schedule_days.notified_fingerprint)
+                {condition}
+                """,
+                params,
+            )
+            await db.commit()
+
+    async def prune_schedule_days(self, before: dt.date) -> tuple[int, int]:
+        """Delete days before ``before``; returns (rows, bytes of payload) removed."""
+        async with self._connect() as db:
+            cursor = await db.execute(
+                """
+                SELECT COUNT(*), COALESCE(SUM(COALESCE(LENGTH(CAST(data AS BLOB)), 0)
+                    + COALESCE(LENGTH(CAST(notified_data AS BLOB)), 0)), 0)
+                FROM schedule_days WHERE day < ?
+                """,
+                (before.isoformat(),),
+            )
+            count, size = await cursor.fetchone()
+            if count:
+                await db.execute("DELETE FROM schedule_days WHERE day < ?", (before.isoformat(),))
+                await db.commit()
+            return int(count), int(size)
@@ -268,17 +268,9 @@ class HomeworkService:
                     date_obj = dt.datetime.strptime(date_str, "%d.%m.%Y").date()
                 except Exception:
                     continue
-                pairs = info.get("pairs", {}) if isinstance(info, dict) else {}
-                for pair_num_raw, entries in pairs.items():
-                    try:
-                        pair_num = int(pair_num_raw)
-                    except Exception:
-                        continue
-                    if not isinstance(entries, list):
-                        continue
-                    for raw in entries:
-                        subj = str(raw or "").split("|")[0].strip()
-                        if self._normalize_text(subj) == normalized_target:
+                for pair_num, first, second in info.items():
+                    for lesson in (first, second):
+                        if lesson and self._normalize_text(lesson.subject) == normalized_target:
                             candidates.append((date_obj, pair_num))
                             break
         if not candidates:
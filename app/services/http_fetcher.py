@@ -0,0 +1,87 @@
+import asyncio
+from dataclasses import dataclass
+
+import aiohttp
+
+DEFAULT_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (X11; Linux x86_64; rv:109.0) Gecko/20100101 Firefox/117.0",
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+}
+
+
+@dataclass
+class FetchResult:
+    url: str
+    status: int
+    content: bytes | None
+
+    @property
+    def not_modified(self) -> bool:
+        return self.status == 304
+
+
+class PageFetcher:
+    """Shared keep-alive HTTP client with conditional GET support.
+
+    All schedule pages live on one host, so a single session reuses its
+    TCP/TLS connections and ``limit_per_host`` bounds how hard we hit the
+    college server. ETag/Last-Modified validators are remembered per URL and
+    sent back so unchanged pages come back as an empty 304.
+    """
+
+    def __init__(self, limit_per_host: int = 4, timeout: float = 15.0) -> None:
+        self.limit_per_host = limit_per_host
+        self.timeout = timeout
+        self._session: aiohttp.ClientSession | None = None
+        self._session_lock = asyncio.Lock()
+        self._validators: dict[str, dict[str, str]] = {}
+
+    async def _get_session(self) -> aiohttp.ClientSession:
+        async with self._session_lock:
+            if self._session is None or self._session.closed:
+                connector = aiohttp.TCPConnector(
+                    limit_per_host=self.limit_per_host,
+                    keepalive_timeout=60,
+                )
+                self._session = aiohttp.ClientSession(
+                    connector=connector,
+                    headers=DEFAULT_HEADERS,
+                    timeout=aiohttp.ClientTimeout(total=self.timeout),
+                )
+            return self._session
+
+    async def fetch(self, url: str, conditional: bool = True) -> FetchResult:
+        session = await self._get_session()
+        headers: dict[str, str] = {}
+        validators = self._validators.get(url) if conditional else None
+        if validators:
+            if "etag" in validators:
+                headers["If-None-Match"] = validators["etag"]
+            if "last_modified" in validators:
+                headers["If-Modified-Since"] = validators["last_modified"]
+        async with session.get(url, headers=headers) as resp:
+            if resp.status == 304:
+                return FetchResult(url=url, status=304, content=None)
+            if resp.status != 200:
+                raise RuntimeError(f"HTTP {resp.status}")
+            content = await resp.read()
+            fresh: dict[str, str] = {}
+            etag = resp.headers.get("ETag")
+            if etag:
+                fresh["etag"] = etag
+            last_modified = resp.headers.get("Last-Modified")
+            if last_modified:
+                fresh["last_modified"] = last_modified
+            if fresh:
+                self._validators[url] = fresh
+            else:
+                self._validators.pop(url, None)
+            return FetchResult(url=url, status=200, content=content)
+
+    def forget(self, url: str) -> None:
+        self._validators.pop(url, None)
+
+    async def close(self) -> None:
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
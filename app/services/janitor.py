@@ -0,0 +1,126 @@
+import asyncio
+import datetime as dt
+import logging
+import time
+from pathlib import Path
+
+from app.services import schedule_watchdog
+
+# Banners left behind by the pre-cache renderer (one file per request).
+LEGACY_BANNER_GLOB = "banner_*.png"
+
+
+def _prune_by_mtime(directory: Path, pattern: str, older_than: float) -> tuple[int, int]:
+    files = 0
+    reclaimed = 0
+    for path in directory.glob(pattern):
+        try:
+            stat = path.stat()
+            if stat.st_mtime >= older_than:
+                continue
+            path.unlink()
+        except OSError:
+            continue
+        files += 1
+        reclaimed += stat.st_size
+    return files, reclaimed
+
+
+class FileJanitor:
+    """Periodically deletes schedule data nobody will ask for again.
+
+    One policy for every area: data goes once the last schedule day it
+    describes is more than ``retention`` in the past. Stored days are judged
+    by their date, banners by the day recorded in the banner cache; stray
+    files without a date (including the per-week JSON files the bot used to
+    write) fall back to their mtime. Broadcast jobs finished more than
+    ``retention`` ago are dropped from the outbox with their messages.
+    """
+
+    AREAS = ("schedule", "legacy", "banners")
+
+    def __init__(
+        self,
+        schedule_service,
+        tz: dt.tzinfo,
+        retention: dt.timedelta = dt.timedelta(days=7),
+        interval: float = 6 * 3600,
+    ) -> None:
+        self.schedule_service = schedule_service
+        self.tz = tz
+        self.retention = retention
+        self.interval = interval
+        self._lock = asyncio.Lock()
+        self._task: asyncio.Task | None = None
+        self.stats = {
+            "runs": 0,
+            "files": 0,
+            "bytes": 0,
+            "last_run": None,
+            "last_bytes": 0,
+            "bytes_by_area": {area: 0 for area in self.AREAS},
+            "outbox_items": 0,
+            "outbox_jobs": 0,
+        }
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def close(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _loop(self) -> None:
+        while True:
+            try:
+                await self.run()
+            except Exception as e:
+                logging.error("janitor: run failed: %s", e)
+            await asyncio.sleep(self.interval)
+
+    async def run(self) -> tuple[int, int]:
+        """Sweep every area once; returns (files, bytes) removed by this run."""
+        async with self._lock:
+            before = dt.datetime.now(self.tz).date() - self.retention
+            older_than = time.time() - self.retention.total_seconds()
+            service = self.schedule_service
+            results = {"schedule": (0, 0)}
+            if service.db is not None:
+                results["schedule"] = await service.db.prune_schedule_days(before)
+                items, jobs = await service.db.prune_outbox(dt.datetime.utcnow() - self.retention)
+                self.stats["outbox_items"] += items
+                self.stats["outbox_jobs"] += jobs
+            legacy = [
+                await asyncio.to_thread(_prune_by_mtime, directory, "*.json", older_than)
+                for directory in (service.schedule_dir, schedule_watchdog.SCHEDULE_CACHE_DIR)
+                if directory.is_dir()
+            ]
+            results["legacy"] = (sum(f for f, _ in legacy), sum(b for _, b in legacy))
+            cache_files, cache_bytes = service.banner_cache.prune(before)
+            legacy_files, legacy_bytes = await asyncio.to_thread(
+                _prune_by_mtime, service.banner_dir, LEGACY_BANNER_GLOB, older_than
+            )
+            tmp_files, tmp_bytes = await asyncio.to_thread(
+                _prune_by_mtime, service.banner_cache.directory, "*.tmp", older_than
+            )
+            results["banners"] = (
+                cache_files + legacy_files + tmp_files,
+                cache_bytes + legacy_bytes + tmp_bytes,
+            )
+            files = sum(f for f, _ in results.values())
+            reclaimed = sum(b for _, b in results.values())
+            self.stats["runs"] += 1
+            self.stats["files"] += files
+            self.stats["bytes"] += reclaimed
+            self.stats["last_run"] = dt.datetime.now(self.tz)
+            self.stats["last_bytes"] = reclaimed
+            for area, (_, area_bytes) in results.items():
+                self.stats["bytes_by_area"][area] += area_bytes
+            return files, reclaimed
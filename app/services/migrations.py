@@ -0,0 +1,303 @@
+import datetime as dt
+import logging
+from collections.abc import Awaitable, Callable
+
+import aiosqlite
+
+MigrationStep = Callable[[aiosqlite.Connection], Awaitable[None]]
+
+
+async def _column_names(db: aiosqlite.Connection, table: str) -> set[str]:
+    cursor = await db.execute(f"PRAGMA table_info({table})")
+    rows = await cursor.fetchall()
+    return {row[1] for row in rows}
+
+
+async def _add_column_if_missing(
+    db: aiosqlite.Connection,
+    table: str,
+    column: str,
+    definition: str,
+) -> bool:
+    if column in await _column_names(db, table):
+        return False
+    await db.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+    return True
+
+
+async def _base_schema(db: aiosqlite.Connection) -> None:
+    # Databases created before versioning already have these tables, so the
+    # step has to stay idempotent.
+    await db.execute(
+        """
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            tg_id INTEGER UNIQUE NOT NULL,
+            username TEXT,
+            first_name TEXT,
+            last_name TEXT,
+            tos_accepted INTEGER NOT NULL DEFAULT 0,
+            group_code TEXT,
+            created_at TEXT NOT NULL
+        )
+        """
+    )
+    await _add_column_if_missing(db, "users", "is_blocked", "INTEGER NOT NULL DEFAULT 0")
+    await _add_column_if_missing(db, "users", "schedule_notify_enabled", "INTEGER NOT NULL DEFAULT 1")
+    await _add_column_if_missing(db, "users", "schedule_style", "TEXT")
+    await db.execute(
+        """
+        CREATE TABLE IF NOT EXISTS admin_sessions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            tg_id INTEGER NOT NULL,
+            level INTEGER NOT NULL,
+            password TEXT NOT NULL,
+            active INTEGER NOT NULL DEFAULT 1,
+            created_at TEXT NOT NULL
+        )
+        """
+    )
+    await db.execute(
+        """
+        CREATE TABLE IF NOT EXISTS admin_login_limits (
+            tg_id INTEGER PRIMARY KEY,
+            attempts_left INTEGER NOT NULL,
+            blocked_until TEXT
+        )
+        """
+    )
+    await db.execute(
+        """
+        CREATE TABLE IF NOT EXISTS banned_users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            tg_id INTEGER,
+            username TEXT,
+            reason TEXT,
+            created_at TEXT NOT NULL
+        )
+        """
+    )
+    await db.execute(
+        """
+        CREATE TABLE IF NOT EXISTS premium_users (
+            tg_id INTEGER PRIMARY KEY,
+            until TEXT NOT NULL
+        )
+        """
+    )
+    await db.execute(
+        """
+        CREATE TABLE IF NOT EXISTS stewards (
+            tg_id INTEGER PRIMARY KEY,
+            group_code TEXT NOT NULL
+        )
+        """
+    )
+    await db.execute(
+        """
+        CREATE TABLE IF NOT EXISTS homework_notifications (
+            tg_id INTEGER PRIMARY KEY,
+            minutes_before INTEGER NOT NULL
+        )
+        """
+    )
+
+
+async def _banned_username_lc(db: aiosqlite.Connection) -> None:
+    if await _add_column_if_missing(db, "banned_users", "username_lc", "TEXT"):
+        await db.execute(
+            "UPDATE banned_users SET username_lc = LOWER(username) "
+            "WHERE username IS NOT NULL"
+        )
+    await db.execute(
+        "CREATE INDEX IF NOT EXISTS idx_banned_users_username_lc "
+        "ON banned_users (username_lc)"
+    )
+
+
+async def _secondary_indexes(db: aiosqlite.Connection) -> None:
+    await db.execute(
+        "CREATE INDEX IF NOT EXISTS idx_users_group_code "
+        "ON users (group_code)"
+    )
+    await db.execute(
+        "CREATE INDEX IF NOT EXISTS idx_admin_sessions_tg_id_active "
+        "ON admin_sessions (tg_id, active)"
+    )
+    await db.execute(
+        "CREATE INDEX IF NOT EXISTS idx_admin_sessions_password_active "
+        "ON admin_sessions (password, active)"
+    )
+    await db.execute(
+        "CREATE INDEX IF NOT EXISTS idx_banned_users_tg_id "
+        "ON banned_users (tg_id)"
+    )
+
+
+async def _users_username_lc(db: aiosqlite.Connection) -> None:
+    if await _add_column_if_missing(db, "users", "username_lc", "TEXT"):
+        await db.execute(
+            "UPDATE users SET username_lc = LOWER(username) "
+            "WHERE username IS NOT NULL"
+        )
+    await db.execute(
+        "CREATE INDEX IF NOT EXISTS idx_users_username_lc "
+        "ON users (username_lc)"
+    )
+
+
+async def _outbox(db: aiosqlite.Connection) -> None:
+    await db.execute(
+        """
+        CREATE TABLE IF NOT EXISTS outbox_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'active',
+            total INTEGER NOT NULL DEFAULT 0,
+            created_by INTEGER,
+            progress_chat_id INTEGER,
+            progress_message_id INTEGER,
+            created_at TEXT NOT NULL,
+            finished_at TEXT
+        )
+        """
+    )
+    await db.execute(
+        """
+        CREATE TABLE IF NOT EXISTS outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            job_id INTEGER NOT NULL,
+            tg_id INTEGER NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at REAL NOT NULL,
+            last_error TEXT,
+            UNIQUE (job_id, tg_id)
+        )
+        """
+    )
+    await db.execute(
+        "CREATE INDEX IF NOT EXISTS idx_outbox_status_next_attempt "
+        "ON outbox (status, next_attempt_at)"
+    )
+    await db.execute(
+        "CREATE INDEX IF NOT EXISTS idx_outbox_jobs_status "
+        "ON outbox_jobs (status)"
+    )
+
+
+async def _schedule_days(db: aiosqlite.Connection) -> None:
+    # One row per (group, day). ``data`` is what users are shown; the
+    # ``notified_*`` columns are the watchdog's baseline of what subscribers
+    # were last told, so a user-side refresh never hides a change from it.
+    await db.execute(
+        """
+        CREATE TABLE IF NOT EXISTS schedule_days (
+            group_code TEXT NOT NULL,
+            day TEXT NOT NULL,
+            data TEXT NOT NULL,
+            hash TEXT NOT NULL,
+            notified_data TEXT,
+            notified_hash TEXT,
+            updated_at REAL NOT NULL,
+            PRIMARY KEY (group_code, day)
+        ) WITHOUT ROWID
+        """
+    )
+    await db.execute(
+        "CREATE INDEX IF NOT EXISTS idx_schedule_days_day "
+        "ON schedule_days (day)"
+    )
+
+
+async def _schedule_fingerprints(db: aiosqlite.Connection) -> None:
+    # Fingerprint of the last change set sent for a day, replacing
+    # config/watchdog_state.json.
+    await _add_column_if_missing(db, "schedule_days", "notified_fingerprint", "TEXT")
+
+
+async def _schedule_days_nullable_page(db: aiosqlite.Connection) -> None:
+    # A row may hold only the watchdog's baseline (legacy imports, overlay
+    # days) or a day the page withdrew, so the page columns become optional.
+    # SQLite cannot relax NOT NULL in place; the table is rebuilt.
+    await db.execute(
+        """
+        CREATE TABLE schedule_days_new (
+            group_code TEXT NOT NULL,
+            day TEXT NOT NULL,
+            data TEXT,
+            hash TEXT,
+            notified_data TEXT,
+            notified_hash TEXT,
+            notified_fingerprint TEXT,
+            updated_at REAL NOT NULL,
+            PRIMARY KEY (group_code, day)
+        ) WITHOUT ROWID
+        """
+    )
+    await db.execute(
+        """
+        INSERT INTO schedule_days_new
+            (group_code, day, data, hash, notified_data, notified_hash, notified_fingerprint, updated_at)
+        SELECT group_code, day, data, hash, notified_data, notified_hash, notified_fingerprint, updated_at
+        FROM schedule_days
+        """
+    )
+    await db.execute("DROP TABLE schedule_days")
+    await db.execute("ALTER TABLE schedule_days_new RENAME TO schedule_days")
+    await db.execute(
+        "CREATE INDEX IF NOT EXISTS idx_schedule_days_day "
+        "ON schedule_days (day)"
+    )
+
+
+# Append new steps to the end; never renumber or edit an applied step.
+MIGRATIONS: list[tuple[int, str, MigrationStep]] = [
+    (1, "base schema", _base_schema),
+    (2, "banned_users.username_lc", _banned_username_lc),
+    (3, "secondary indexes", _secondary_indexes),
+    (4, "users.username_lc", _users_username_lc),
+    (5, "outbox", _outbox),
+    (6, "schedule_days", _schedule_days),
+    (7, "schedule_days.notified_fingerprint", _schedule_fingerprints),
+    (8, "schedule_days nullable page columns", _schedule_days_nullable_page),
+]
+
+
+async def get_schema_version(db: aiosqlite.Connection) -> int:
+    cursor = await db.execute("SELECT MAX(version) FROM schema_version")
+    row = await cursor.fetchone()
+    return int(row[0]) if row and row[0] is not None else 0
+
+
+async def run_migrations(db: aiosqlite.Connection) -> int:
+    await db.execute(
+        """
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TEXT NOT NULL
+        )
+        """
+    )
+    await db.commit()
+    current = await get_schema_version(db)
+    for version, name, step in MIGRATIONS:
+        if version <= current:
+            continue
+        await db.execute("BEGIN")
+        try:
+            await step(db)
+            await db.execute(
+                "INSERT INTO schema_version (version, name, applied_at) VALUES (?, ?, ?)",
+                (version, name, dt.datetime.utcnow().isoformat()),
+            )
+            await db.commit()
+        except Exception:
+            await db.rollback()
+            logging.error("schema migration %s (%s) failed", version, name)
+            raise
+        logging.info("applied schema migration %s (%s)", version, name)
+        current = version
+    return current
@@ -0,0 +1,331 @@
+import asyncio
+import logging
+import time
+from typing import Any
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, TelegramRetryAfter
+
+from app.keyboards.inline import broadcast_cancel_inline_keyboard
+
+
+class TokenBucket:
+    """Token bucket refilled at ``rate`` tokens per second."""
+
+    def __init__(self, rate: float, capacity: float | None = None) -> None:
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._refill(now)
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def pause(self, seconds: float) -> None:
+        """Stop handing out tokens for ``seconds`` (Telegram flood wait)."""
+        now = time.monotonic()
+        self._paused_until = max(self._paused_until, now + seconds)
+        self._tokens = 0
+        self._updated = now
+
+
+class ChatLimiter:
+    """Keeps at least ``interval`` seconds between messages to one chat."""
+
+    def __init__(self, interval: float) -> None:
+        self.interval = interval
+        self._next: dict[int, float] = {}
+
+    async def wait(self, chat_id: int) -> None:
+        now = time.monotonic()
+        slot = max(now, self._next.get(chat_id, 0.0))
+        self._next[chat_id] = slot + self.interval
+        if len(self._next) > 10000:
+            for key in [k for k, v in self._next.items() if v < now]:
+                del self._next[key]
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+
+SEND_METHODS = frozenset({"send_message", "copy_message"})
+
+
+def _format_eta(seconds: float) -> str:
+    seconds = int(seconds)
+    if seconds < 60:
+        return f"{seconds} сек"
+    minutes, seconds = divmod(seconds, 60)
+    if minutes < 60:
+        return f"{minutes} мин {seconds} сек"
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours} ч {minutes} мин"
+
+
+def _format_progress(job: dict[str, Any], counts: dict[str, int], eta: float | None) -> str:
+    sent = counts.get("sent", 0)
+    failed = counts.get("failed", 0)
+    if job["status"] == "cancelled":
+        return (
+            f"📢 Рассылка #{job['id']} отменена.\n\n"
+            f"Успешно отправлено: <b>{sent}</b>\n"
+            f"Ошибок при отправке: <b>{failed}</b>\n"
+            f"Не отправлено: <b>{counts.get('cancelled', 0)}</b>"
+        )
+    if job["status"] != "active":
+        return (
+            f"📢 Рассылка завершена.\n\n"
+            f"Успешно отправлено: <b>{sent}</b>\n"
+            f"Ошибок при отправке: <b>{failed}</b>"
+        )
+    remaining = counts.get("pending", 0) + counts.get("sending", 0)
+    lines = [
+        f"📢 Рассылка #{job['id']}",
+        "",
+        f"Отправлено: <b>{sent}</b> из <b>{job.get('total', 0)}</b>",
+        f"Ошибок: <b>{failed}</b>",
+        f"Осталось: <b>{remaining}</b>",
+    ]
+    if eta is not None:
+        lines.append(f"⏱ Примерно: <b>{_format_eta(eta)}</b>")
+    return "\n".join(lines)
+
+
+class NotificationDispatcher:
+    """Drains the SQLite outbox under Telegram's rate limits.
+
+    Producers call ``enqueue`` (or ``submit`` for plain text), which stores a
+    job with its recipients and returns at once. A feeder moves due rows into
+    a small in-memory queue, ``concurrency`` workers send them through a
+    global token bucket and a per-chat limiter, and a reporter keeps the
+    job's progress message up to date. A row is claimed right before the API
+    call, so after a crash untouched rows resume and in-flight ones are not
+    sent twice.
+    """
+
+    def __init__(
+        self,
+        bot: Bot,
+        db,
+        rate: float = 25.0,
+        per_chat_interval: float = 1.0,
+        concurrency: int = 8,
+        max_attempts: int = 3,
+        retry_delay: float = 30.0,
+        report_interval: float = 3.0,
+    ) -> None:
+        self.bot = bot
+        self.db = db
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.report_interval = report_interval
+        self.bucket = TokenBucket(rate)
+        self.chats = ChatLimiter(per_chat_interval)
+        self._queue: asyncio.Queue[dict[str, Any]] = asyncio.Queue(maxsize=concurrency * 2)
+        self._inflight: set[int] = set()
+        self._jobs: dict[int, dict[str, Any]] = {}
+        self._dirty_jobs: set[int] = set()
+        self._job_started: dict[int, tuple[float, int]] = {}
+        self._wakeup = asyncio.Event()
+        self._tasks: list[asyncio.Task] = []
+
+    async def start(self) -> None:
+        if self._tasks:
+            return
+        interrupted = await self.db.recover_outbox()
+        if interrupted:
+            logging.error("outbox: %s messages were in flight at shutdown, not resending", interrupted)
+        self._dirty_jobs.update(await self.db.get_active_outbox_job_ids())
+        self._tasks = [asyncio.create_task(self._feeder()), asyncio.create_task(self._reporter())]
+        self._tasks += [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+
+    async def close(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+
+    async def enqueue(
+        self,
+        kind: str,
+        payload: dict[str, Any],
+        recipients: list[int],
+        created_by: int | None = None,
+        progress_chat_id: int | None = None,
+        progress_message_id: int | None = None,
+    ) -> int:
+        if payload.get("method") not in SEND_METHODS:
+            raise ValueError(f"unsupported outbox method: {payload.get('method')}")
+        job_id = await self.db.create_outbox_job(
+            kind,
+            payload,
+            recipients,
+            created_by=created_by,
+            progress_chat_id=progress_chat_id,
+            progress_message_id=progress_message_id,
+        )
+        self._dirty_jobs.add(job_id)
+        self._wakeup.set()
+        return job_id
+
+    async def submit(self, users: list[dict[str, Any]], text: str, **kwargs: Any) -> int:
+        recipients = await self.db.exclude_banned(users)
+        ids = list(dict.fromkeys(u["tg_id"] for u in recipients if u.get("tg_id")))
+        if ids:
+            await self.enqueue("schedule", {"method": "send_message", "params": {"text": text, **kwargs}}, ids)
+        return len(ids)
+
+    async def _job(self, job_id: int) -> dict[str, Any] | None:
+        job = self._jobs.get(job_id)
+        if job is None:
+            job = await self.db.get_outbox_job(job_id)
+            if job is not None:
+                self._jobs[job_id] = job
+        return job
+
+    async def _feeder(self) -> None:
+        while True:
+            try:
+                items = await self.db.get_due_outbox_items(self.concurrency * 2, self._inflight)
+            except Exception as e:
+                logging.error("outbox: feeder failed: %s", e)
+                items = []
+            if not items:
+                next_at = None
+                try:
+                    next_at = await self.db.get_next_outbox_attempt_at()
+                except Exception:
+                    pass
+                timeout = 5.0 if next_at is None else min(5.0, max(0.5, next_at - time.time()))
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+                continue
+            for item in items:
+                self._inflight.add(item["id"])
+                await self._queue.put(item)
+
+    async def _worker(self) -> None:
+        while True:
+            item = await self._queue.get()
+            try:
+                await self._process(item)
+            except Exception as e:
+                logging.error("outbox: delivery to %s failed: %s", item["tg_id"], e)
+            finally:
+                self._inflight.discard(item["id"])
+                self._dirty_jobs.add(item["job_id"])
+                self._wakeup.set()
+                self._queue.task_done()
+
+    async def _process(self, item: dict[str, Any]) -> None:
+        tg_id = item["tg_id"]
+        job = await self._job(item["job_id"])
+        await self.chats.wait(tg_id)
+        await self.bucket.acquire()
+        if not await self.db.claim_outbox_item(item["id"]):
+            return
+        if job is None:
+            await self.db.finish_outbox_item(item["id"], "failed", "job missing")
+            return
+        payload = job["payload"]
+        try:
+            method = getattr(self.bot, payload["method"])
+            await method(chat_id=tg_id, **payload.get("params", {}))
+        except TelegramRetryAfter as e:
+            # A flood wait is not the message's fault: pause and retry it.
+            self.bucket.pause(e.retry_after)
+            await self.db.retry_outbox_item(item["id"], time.time() + e.retry_after, str(e), count_attempt=False)
+        except (TelegramForbiddenError, TelegramBadRequest) as e:
+            await self.db.finish_outbox_item(item["id"], "failed", str(e))
+            await self.db.set_user_blocked(tg_id, True)
+        except Exception as e:
+            attempts = item["attempts"] + 1
+            if attempts >= self.max_attempts:
+                await self.db.finish_outbox_item(item["id"], "failed", str(e))
+            else:
+                delay = self.retry_delay * 2 ** (attempts - 1)
+                await self.db.retry_outbox_item(item["id"], time.time() + delay, str(e))
+        else:
+            await self.db.finish_outbox_item(item["id"], "sent")
+
+    async def _reporter(self) -> None:
+        while True:
+            await asyncio.sleep(self.report_interval)
+            dirty = list(self._dirty_jobs)
+            self._dirty_jobs.clear()
+            for job_id in dirty:
+                try:
+                    await self._report(job_id)
+                except Exception as e:
+                    logging.error("outbox: progress report for job %s failed: %s", job_id, e)
+
+    def _eta(self, job_id: int, counts: dict[str, int]) -> float | None:
+        finished = counts.get("sent", 0) + counts.get("failed", 0)
+        remaining = counts.get("pending", 0) + counts.get("sending", 0)
+        now = time.monotonic()
+        started = self._job_started.setdefault(job_id, (now, finished))
+        elapsed = now - started[0]
+        done = finished - started[1]
+        if done > 0 and elapsed > 0:
+            rate = done / elapsed
+        else:
+            rate = self.bucket.rate
+        return remaining / rate if rate > 0 else None
+
+    async def cancel(self, job_id: int) -> bool:
+        if not await self.db.cancel_outbox_job(job_id):
+            return False
+        self._jobs.pop(job_id, None)
+        await self._report(job_id)
+        return True
+
+    async def _report(self, job_id: int) -> None:
+        job = await self._job(job_id)
+        if job is None:
+            return
+        counts = await self.db.get_outbox_job_counts(job_id)
+        if job["status"] == "active" and not counts.get("pending") and not counts.get("sending"):
+            await self.db.finish_outbox_job(job_id)
+            job["status"] = "done"
+        active = job["status"] == "active"
+        eta = self._eta(job_id, counts) if active else None
+        if not active:
+            self._jobs.pop(job_id, None)
+            self._job_started.pop(job_id, None)
+        chat_id = job.get("progress_chat_id")
+        message_id = job.get("progress_message_id")
+        if not chat_id or not message_id:
+            return
+        try:
+            await self.bot.edit_message_text(
+                text=_format_progress(job, counts, eta),
+                chat_id=chat_id,
+                message_id=message_id,
+                reply_markup=broadcast_cancel_inline_keyboard(job_id) if active else None,
+            )
+        except TelegramBadRequest:
+            # Usually "message is not modified".
+            pass
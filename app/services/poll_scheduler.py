@@ -0,0 +1,112 @@
+import datetime as dt
+import heapq
+import time
+from collections.abc import Iterable
+
+# Days that have classes (Mon-Sat); the evening before one is when the
+# college usually publishes changes.
+SCHOOL_DAYS = frozenset(range(0, 6))
+
+
+class PollScheduler:
+    """Per-page next-check deadlines kept in a priority queue.
+
+    A page that keeps coming back unchanged is polled exponentially less
+    often, up to ``max_interval`` (``night_interval`` at night). Inside
+    publishing windows and for ``hot_period`` seconds after a change the
+    interval is pinned to ``min_interval``.
+    """
+
+    def __init__(
+        self,
+        tz: dt.tzinfo,
+        min_interval: float = 30,
+        max_interval: float = 600,
+        night_interval: float = 1800,
+        hot_period: float = 1200,
+        evening_window: tuple[int, int] = (15, 22),
+        morning_window: tuple[int, int] = (7, 9),
+        night_window: tuple[int, int] = (0, 6),
+    ) -> None:
+        self.tz = tz
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.night_interval = night_interval
+        self.hot_period = hot_period
+        self.evening_window = evening_window
+        self.morning_window = morning_window
+        self.night_window = night_window
+        self._heap: list[tuple[float, str]] = []
+        self._deadline: dict[str, float] = {}
+        self._interval: dict[str, float] = {}
+        self._hot_until: dict[str, float] = {}
+
+    def sync(self, keys: Iterable[str]) -> None:
+        keys = set(keys)
+        now = time.monotonic()
+        for key in keys - self._deadline.keys():
+            self._schedule(key, now)
+            self._interval[key] = self.min_interval
+        for key in self._deadline.keys() - keys:
+            # Stale heap entries are skipped in pop_due().
+            del self._deadline[key]
+            self._interval.pop(key, None)
+            self._hot_until.pop(key, None)
+
+    def _schedule(self, key: str, deadline: float) -> None:
+        self._deadline[key] = deadline
+        heapq.heappush(self._heap, (deadline, key))
+
+    def pop_due(self) -> list[str]:
+        now = time.monotonic()
+        due: list[str] = []
+        while self._heap and self._heap[0][0] <= now:
+            deadline, key = heapq.heappop(self._heap)
+            if self._deadline.get(key) != deadline:
+                continue
+            del self._deadline[key]
+            due.append(key)
+        return due
+
+    def seconds_until_next(self) -> float | None:
+        while self._heap:
+            deadline, key = self._heap[0]
+            if self._deadline.get(key) == deadline:
+                return max(0.0, deadline - time.monotonic())
+            heapq.heappop(self._heap)
+        return None
+
+    def in_publishing_window(self, when: dt.datetime) -> bool:
+        hour = when.hour
+        start, end = self.evening_window
+        tomorrow = (when.weekday() + 1) % 7
+        if tomorrow in SCHOOL_DAYS and start <= hour < end:
+            return True
+        start, end = self.morning_window
+        return when.weekday() in SCHOOL_DAYS and start <= hour < end
+
+    def _cap(self, when: dt.datetime) -> float:
+        if self.in_publishing_window(when):
+            return self.min_interval
+        start, end = self.night_window
+        if start <= when.hour < end:
+            return self.night_interval
+        return self.max_interval
+
+    def record(self, key: str, changed: bool) -> float:
+        """Schedule the next check of ``key`` after a poll and return the delay."""
+        if key not in self._interval:
+            return 0.0
+        now = time.monotonic()
+        if changed:
+            self._hot_until[key] = now + self.hot_period
+            interval = self.min_interval
+        elif self._hot_until.get(key, 0) > now:
+            interval = self.min_interval
+        else:
+            self._hot_until.pop(key, None)
+            interval = self._interval.get(key, self.min_interval) * 2
+        interval = max(self.min_interval, min(interval, self._cap(dt.datetime.now(self.tz))))
+        self._interval[key] = interval
+        self._schedule(key, now + interval)
+        return interval
@@ -0,0 +1,99 @@
+import hashlib
+import json
+from dataclasses import dataclass
+
+from app.services.schedule_model import DaySchedule, Lesson
+
+ADDED = "added"
+REMOVED = "removed"
+CHANGED = "changed"
+MOVED = "moved"
+
+# Subgroup 0 is the whole group.
+_WHOLE = 0
+
+
+@dataclass(frozen=True)
+class PairChange:
+    kind: str
+    pair: int
+    subgroup: int
+    old: Lesson | None = None
+    new: Lesson | None = None
+    # Where a moved lesson went.
+    to_pair: int | None = None
+
+
+def _slots(day: DaySchedule, num: int, split: bool) -> dict[int, Lesson | None]:
+    first, second = day.pairs.get(num, (None, None))
+    if not split:
+        return {_WHOLE: first}
+    return {1: first, 2: second}
+
+
+def _is_split(day: DaySchedule, num: int) -> bool:
+    first, second = day.pairs.get(num, (None, None))
+    return not DaySchedule.is_merged(first, second) and (first is not None or second is not None)
+
+
+def diff_days(old: DaySchedule, new: DaySchedule) -> list[PairChange]:
+    """Per pair and subgroup changes from ``old`` to ``new``.
+
+    Days with the same digest are equal, so the common case costs one
+    comparison of cached hashes. A pair is compared as a whole while it is
+    a whole-group pair on both sides, otherwise subgroup by subgroup. A
+    lesson that disappears from one pair and shows up in another pair of
+    the same subgroup is reported once, as moved.
+    """
+    if old.digest == new.digest:
+        return []
+    removed: dict[tuple[int, int], Lesson] = {}
+    added: dict[tuple[int, int], Lesson] = {}
+    for num in sorted(set(old.pairs) | set(new.pairs)):
+        if old.pairs.get(num) == new.pairs.get(num):
+            continue
+        split = _is_split(old, num) or _is_split(new, num)
+        before = _slots(old, num, split)
+        after = _slots(new, num, split)
+        for subgroup, lesson in before.items():
+            if lesson != after[subgroup]:
+                if lesson:
+                    removed[(num, subgroup)] = lesson
+                if after[subgroup]:
+                    added[(num, subgroup)] = after[subgroup]
+
+    changes: list[PairChange] = []
+    for (num, subgroup), lesson in list(removed.items()):
+        targets = [slot for slot, other in added.items() if slot[1] == subgroup and other == lesson]
+        if not targets:
+            continue
+        target = min(targets, key=lambda slot: abs(slot[0] - num))
+        del removed[(num, subgroup)]
+        del added[target]
+        changes.append(PairChange(MOVED, num, subgroup, old=lesson, new=lesson, to_pair=target[0]))
+    for slot, lesson in removed.items():
+        if slot in added:
+            changes.append(PairChange(CHANGED, *slot, old=lesson, new=added.pop(slot)))
+        else:
+            changes.append(PairChange(REMOVED, *slot, old=lesson))
+    for slot, lesson in added.items():
+        changes.append(PairChange(ADDED, *slot, new=lesson))
+    changes.sort(key=lambda c: (c.pair, c.subgroup))
+    return changes
+
+
+def is_false_cancel(old: DaySchedule, new: DaySchedule) -> bool:
+    """The page briefly shows a day without lessons while it is being edited."""
+    return any(old.lessons()) and not any(new.lessons())
+
+
+def fingerprint(changes: list[PairChange]) -> str:
+    raw = json.dumps(
+        [
+            [c.kind, c.pair, c.subgroup, c.to_pair, c.old.to_json() if c.old else None, c.new.to_json() if c.new else None]
+            for c in changes
+        ],
+        ensure_ascii=False,
+        separators=(",", ":"),
+    )
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
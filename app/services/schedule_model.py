@@ -0,0 +1,269 @@
+import functools
+import hashlib
+import json
+import re
+import sys
+from typing import Any, Iterator
+
+_NO_LESSON = "НЕТ"
+_MARKS = ("①", "②")
+_LINE_RE = re.compile(r"^\s*(\d+)\s*пара\s*:\s*(.*)$", re.IGNORECASE)
+_BULLET_RE = re.compile(r"^\s*([①②•\-])\s*")
+_NO_RE = re.compile(r"^(нет|нет пар|—|-)$", re.IGNORECASE)
+# "Иванов И.И." / "Иванов И. И." — tells a teacher from a room in old two-part titles.
+_TEACHER_RE = re.compile(r"\w+\s+\w\.\s*(\w\.)?$")
+
+
+def _intern(value: Any) -> str:
+    return sys.intern(str(value or "").strip())
+
+
+class Lesson:
+    """One cell of the timetable.
+
+    Subjects, rooms and teachers repeat across days, weeks and groups, so
+    their strings are interned and ``Lesson.of`` hands out one shared object
+    per distinct lesson. ``title`` is the "subject | room | teacher" text
+    shown to users, built once.
+    """
+
+    __slots__ = ("subject", "room", "teacher", "title")
+
+    def __init__(self, subject: str = "", room: str = "", teacher: str = "") -> None:
+        self.subject = _intern(subject)
+        self.room = _intern(room)
+        self.teacher = _intern(teacher)
+        self.title = " | ".join(p for p in (self.subject, self.room, self.teacher) if p)
+
+    @classmethod
+    def of(cls, subject: str = "", room: str = "", teacher: str = "") -> "Lesson":
+        return _shared_lesson(str(subject or "").strip(), str(room or "").strip(), str(teacher or "").strip())
+
+    @classmethod
+    def from_title(cls, title: str | None) -> "Lesson | None":
+        """Best-effort inverse of ``title`` for data stored before the model existed."""
+        parts = [p.strip() for p in str(title or "").split("|")]
+        parts = [p for p in parts if p]
+        if not parts:
+            return None
+        if len(parts) == 2 and _TEACHER_RE.match(parts[1]):
+            return cls.of(parts[0], "", parts[1])
+        if len(parts) > 3:
+            parts = parts[:2] + [" | ".join(parts[2:])]
+        return cls.of(*parts)
+
+    def to_json(self) -> list[str]:
+        return [self.subject, self.room, self.teacher]
+
+    @classmethod
+    def from_json(cls, data: Any) -> "Lesson | None":
+        if not data:
+            return None
+        if isinstance(data, str):
+            return cls.from_title(data)
+        return cls.of(*list(data)[:3])
+
+    def __bool__(self) -> bool:
+        return bool(self.subject or self.room or self.teacher)
+
+    def __eq__(self, other: object) -> bool:
+        if self is other:
+            return True
+        if not isinstance(other, Lesson):
+            return NotImplemented
+        return (self.subject, self.room, self.teacher) == (other.subject, other.room, other.teacher)
+
+    def __hash__(self) -> int:
+        return hash((self.subject, self.room, self.teacher))
+
+    def __repr__(self) -> str:
+        return f"Lesson({self.subject!r}, {self.room!r}, {self.teacher!r})"
+
+
+@functools.lru_cache(maxsize=8192)
+def _shared_lesson(subject: str, room: str, teacher: str) -> Lesson:
+    return Lesson(subject, room, teacher)
+
+
+class DaySchedule:
+    """A parsed day: ``pairs`` maps a pair number to the lessons of the first
+    and second subgroup (``None`` when a subgroup has nothing). A pair taken
+    by the whole group has the same lesson on both sides.
+
+    Parsed days are shared between callers and must not be mutated.
+    """
+
+    __slots__ = ("day", "pairs", "_encoded")
+
+    def __init__(self, day: str = "", pairs: dict[int, tuple[Lesson | None, Lesson | None]] | None = None) -> None:
+        self.day = _intern(day)
+        self.pairs = pairs if pairs is not None else {}
+        self._encoded: tuple[str, str] | None = None
+
+    @staticmethod
+    def is_merged(first: Lesson | None, second: Lesson | None) -> bool:
+        return first is not None and first == second
+
+    def items(self) -> Iterator[tuple[int, Lesson | None, Lesson | None]]:
+        for num in sorted(self.pairs):
+            first, second = self.pairs[num]
+            yield num, first, second
+
+    def max_pair(self) -> int:
+        return max(max(self.pairs, default=0), 8)
+
+    def cells(self, pair_num: int) -> tuple[str, str]:
+        """Titles of the two subgroup columns; a whole-group pair fills both."""
+        first, second = self.pairs.get(pair_num, (None, None))
+        return (first.title if first else ""), (second.title if second else "")
+
+    def lessons(self) -> Iterator[Lesson]:
+        """Every distinct lesson slot of the day (a whole-group pair once)."""
+        for _, first, second in self.items():
+            if first:
+                yield first
+            if second and not self.is_merged(first, second):
+                yield second
+
+    def subjects(self) -> set[str]:
+        return {lesson.subject for lesson in self.lessons() if lesson.subject}
+
+    def slots(self) -> dict[int, list[str]]:
+        """Pair number -> lesson titles, as listed for the day (8 pairs at least)."""
+        out: dict[int, list[str]] = {}
+        for num in range(1, self.max_pair() + 1):
+            first, second = self.pairs.get(num, (None, None))
+            if self.is_merged(first, second):
+                out[num] = [first.title]
+            else:
+                out[num] = [lesson.title for lesson in (first, second) if lesson]
+        return out
+
+    def lesson_lines(self, max_pairs: int = 8) -> list[str]:
+        """The day as text lines: "N пара: …", with ①/② for subgroups."""
+        lines = []
+        for num in range(1, max_pairs + 1):
+            first, second = self.pairs.get(num, (None, None))
+            if self.is_merged(first, second):
+                lines.append(f"{num} пара: {first.title}")
+            elif first and second:
+                lines.append(f"{num} пара:")
+                lines.append(f"① {first.title}")
+                lines.append(f"② {second.title}")
+            elif first:
+                lines.append(f"{num} пара: ① {first.title}")
+            elif second:
+                lines.append(f"{num} пара: ② {second.title}")
+            else:
+                lines.append(f"{num} пара: {_NO_LESSON}")
+        return lines
+
+    def to_json(self) -> dict[str, Any]:
+        """Compact form: ``[num, lesson]`` for whole-group pairs,
+        ``[num, first, second]`` otherwise, a lesson being ``[subject, room, teacher]``."""
+        pairs = []
+        for num, first, second in self.items():
+            if self.is_merged(first, second):
+                pairs.append([num, first.to_json()])
+            else:
+                pairs.append([num, first.to_json() if first else None, second.to_json() if second else None])
+        return {"day": self.day, "pairs": pairs}
+
+    def encode(self) -> tuple[str, str]:
+        """Canonical JSON of ``to_json`` and its sha1; computed once per day."""
+        if self._encoded is None:
+            data = json.dumps(self.to_json(), ensure_ascii=False, separators=(",", ":"), sort_keys=True)
+            self._encoded = (data, hashlib.sha1(data.encode("utf-8")).hexdigest())
+        return self._encoded
+
+    @property
+    def digest(self) -> str:
+        return self.encode()[1]
+
+    @classmethod
+    def from_json(cls, data: Any) -> "DaySchedule":
+        if isinstance(data, DaySchedule):
+            return data
+        if not isinstance(data, dict):
+            return cls()
+        pairs = data.get("pairs")
+        if isinstance(pairs, list):
+            parsed: dict[int, tuple[Lesson | None, Lesson | None]] = {}
+            for entry in pairs:
+                num = int(entry[0])
+                first = Lesson.from_json(entry[1])
+                second = first if len(entry) == 2 else Lesson.from_json(entry[2])
+                parsed[num] = (first, second)
+            return cls(data.get("day", ""), parsed)
+        return cls._from_legacy(data)
+
+    @classmethod
+    def _from_legacy(cls, data: dict[str, Any]) -> "DaySchedule":
+        """Days stored as pairs/pairs_cols/merge maps or just rendered lines."""
+        def _by_num(name: str) -> dict[int, Any]:
+            raw = data.get(name)
+            if not isinstance(raw, dict):
+                return {}
+            return {int(k): v for k, v in raw.items() if str(k).strip().isdigit()}
+
+        merge, cols, plain = _by_num("merge"), _by_num("pairs_cols"), _by_num("pairs")
+        pairs: dict[int, tuple[Lesson | None, Lesson | None]] = {}
+        for num in sorted(set(merge) | set(cols) | set(plain)):
+            if merge.get(num):
+                lesson = Lesson.from_title(merge[num])
+                pairs[num] = (lesson, lesson)
+                continue
+            items = cols.get(num) or plain.get(num) or []
+            if not isinstance(items, list):
+                items = [items]
+            if num not in cols and len(items) == 1:
+                lesson = Lesson.from_title(items[0])
+                pairs[num] = (lesson, lesson)
+                continue
+            first = Lesson.from_title(items[0]) if len(items) > 0 else None
+            second = Lesson.from_title(items[1]) if len(items) > 1 else None
+            if first or second:
+                pairs[num] = (first, second)
+        if not pairs and isinstance(data.get("lessons"), list):
+            pairs = _parse_lines(data["lessons"])
+        return cls(data.get("day", ""), pairs)
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, DaySchedule):
+            return NotImplemented
+        return self.day == other.day and self.pairs == other.pairs
+
+    __hash__ = None
+
+    def __repr__(self) -> str:
+        return f"DaySchedule({self.day!r}, {self.pairs!r})"
+
+
+def _parse_lines(lines: list[Any]) -> dict[int, tuple[Lesson | None, Lesson | None]]:
+    """Rebuild pairs from "N пара: …" lines (hand-written overlays, old baselines)."""
+    pairs: dict[int, tuple[Lesson | None, Lesson | None]] = {}
+    num = None
+    for raw in lines:
+        line = re.sub(r"\s+", " ", str(raw or "").replace("\xa0", " ")).strip()
+        m = _LINE_RE.match(line)
+        if m:
+            num = int(m.group(1))
+            line = m.group(2).strip()
+        if num is None or not line or _NO_RE.fullmatch(line):
+            continue
+        first, second = pairs.get(num, (None, None))
+        bullet = _BULLET_RE.match(line)
+        mark = bullet.group(1) if bullet else None
+        lesson = Lesson.from_title(_BULLET_RE.sub("", line))
+        if mark == _MARKS[0]:
+            first = lesson
+        elif mark == _MARKS[1]:
+            second = lesson
+        elif first is None and second is None:
+            first = second = lesson
+        elif first is None:
+            first = lesson
+        else:
+            second = lesson
+        pairs[num] = (first, second)
+    return pairs
@@ -1,20 +1,27 @@
 import asyncio
 import datetime as dt
+import hashlib
 import json
 import logging
 import re
+from collections import OrderedDict
 from html import escape
 from pathlib import Path
-from uuid import uuid4
 
-import requests
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, UnicodeDammit
+
+from app.core.events import SCHEDULE_CHANGED
+from app.services.banner_cache import BannerCache, CachedBanner
+from app.services.banner_renderer import BannerRenderer
+from app.services.banner_styles import style_palette
+from app.services.http_fetcher import PageFetcher
+from app.services.schedule_model import DaySchedule, Lesson
+from app.services.single_flight import SingleFlight
 
 try:
-    from weasyprint import HTML, CSS
+    from lxml import etree as lxml_etree
 except ImportError:  # pragma: no cover - optional dependency
-    HTML = None
-    CSS = None
+    lxml_etree = None
 
 
 def week_bounds_mon_sun(d):
@@ -43,69 +50,192 @@ def _clean_text(s):
     return re.sub(r"\s+", " ", s).strip()
 
 
-def _mk_full_title(cell):
+def _make_lesson(subj_raw, room, teacher):
+    subj = re.sub(r"\(\s*\)", "", subj_raw).strip()
+    return Lesson.of(subj, room, teacher)
+
+
+def _mk_lesson(cell):
     subj_tag = cell.find("a", class_="z1")
     room_tag = cell.find("a", class_="z2")
     teacher_tag = cell.find(attrs={"class": lambda x: x and ("z3" in x)})
-    subj_raw = subj_tag.get_text(strip=True) if subj_tag else cell.get_text(strip=True)
-    subj = re.sub(r"\(\s*\)", "", subj_raw).strip()
-    parts = [
-        p
-        for p in [
-            subj,
-            room_tag.get_text(strip=True) if room_tag else "",
-            teacher_tag.get_text(strip=True) if teacher_tag else "",
-        ]
-        if p
-    ]
-    return " | ".join(parts)
+    return _make_lesson(
+        subj_tag.get_text(strip=True) if subj_tag else cell.get_text(strip=True),
+        room_tag.get_text(strip=True) if room_tag else "",
+        teacher_tag.get_text(strip=True) if teacher_tag else "",
+    )
 
 
-def fetch_page(url):
-    headers = {
-        "User-Agent": "Mozilla/5.0 (X11; Linux x86_64; rv:109.0) Gecko/20100101 Firefox/117.0",
-        "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
-    }
-    r = requests.get(url, headers=headers, timeout=15)
-    if r.status_code != 200:
-        raise RuntimeError(f"HTTP {r.status_code}")
-    return r.content
+class _SoupTableReader:
+    """Reference table reader: BeautifulSoup with the stdlib ``html.parser``."""
 
+    name = "html.parser"
 
-def parse_schedule(url):
-    try:
-        html = fetch_page(url)
-        soup = BeautifulSoup(html, "html.parser")
+    def rows(self, markup):
+        soup = BeautifulSoup(markup, "html.parser")
         table = soup.find("table", class_="output-table") or soup.find("table")
         if not table:
-            return {}
-        rows = table.find_all("tr")
+            return []
+        return table.find_all("tr")
+
+    def date_text(self, row):
+        cell = row.find("td", attrs={"rowspan": True})
+        return cell.get_text(separator="\n") if cell else None
+
+    def cells(self, row):
+        return row.find_all("td")
+
+    def has_class(self, cell, name):
+        return name in (cell.get("class") or [])
+
+    def colspan(self, cell):
+        return cell["colspan"] if cell.has_attr("colspan") else None
+
+    def text(self, cell):
+        return cell.get_text()
+
+    def lesson(self, cell):
+        return _mk_lesson(cell)
+
+
+def _lxml_text(el, strip=False, separator=""):
+    if not strip:
+        return separator.join(el.itertext())
+    return separator.join(s for s in (t.strip() for t in el.itertext()) if s)
+
+
+def _lxml_classes(el):
+    return (el.get("class") or "").split()
+
+
+class _LxmlTableReader:
+    """Same extraction as ``_SoupTableReader`` on top of libxml2.
+
+    Mirrors BeautifulSoup's text semantics: comments and the bodies of
+    script/style/template are not text, ``strip=True`` strips every string
+    separately, and class matching works on whitespace-separated tokens.
+    """
+
+    name = "lxml"
+
+    def rows(self, markup):
+        if not markup.strip():
+            return []
+        # Parsers are not shared: parse_schedule_html runs in worker threads.
+        parser = lxml_etree.HTMLParser(encoding="utf-8")
+        root = lxml_etree.fromstring(markup.encode("utf-8"), parser=parser)
+        if root is None:
+            return []
+        lxml_etree.strip_elements(root, "script", "style", "template", with_tail=False)
+        table = None
+        for el in root.iter("table"):
+            if "output-table" in _lxml_classes(el):
+                table = el
+                break
+            if table is None:
+                table = el
+        if table is None:
+            return []
+        return list(table.iter("tr"))
+
+    def date_text(self, row):
+        for cell in row.iter("td"):
+            if cell.get("rowspan") is not None:
+                return _lxml_text(cell, separator="\n")
+        return None
+
+    def cells(self, row):
+        return list(row.iter("td"))
+
+    def has_class(self, cell, name):
+        return name in _lxml_classes(cell)
+
+    def colspan(self, cell):
+        return cell.get("colspan")
+
+    def text(self, cell):
+        return _lxml_text(cell)
+
+    def lesson(self, cell):
+        subj_tag = room_tag = teacher_tag = None
+        for el in cell.iterdescendants():
+            if not isinstance(el.tag, str):
+                continue
+            cls = el.get("class") or ""
+            if el.tag == "a":
+                tokens = cls.split()
+                if subj_tag is None and "z1" in tokens:
+                    subj_tag = el
+                if room_tag is None and "z2" in tokens:
+                    room_tag = el
+            if teacher_tag is None and "z3" in cls:
+                teacher_tag = el
+        return _make_lesson(
+            _lxml_text(subj_tag if subj_tag is not None else cell, strip=True),
+            _lxml_text(room_tag, strip=True) if room_tag is not None else "",
+            _lxml_text(teacher_tag, strip=True) if teacher_tag is not None else "",
+        )
+
+
+_TABLE_READERS = {"html.parser": _SoupTableReader()}
+if lxml_etree is not None:
+    _TABLE_READERS["lxml"] = _LxmlTableReader()
+
+PARSER_BACKEND = "lxml" if "lxml" in _TABLE_READERS else "html.parser"
+
+
+def _decode_markup(html):
+    if isinstance(html, str):
+        return html
+    # Decode exactly like BeautifulSoup does so every backend sees the same text.
+    return UnicodeDammit(html, is_html=True).unicode_markup
+
+
+def _table_reader(markup, backend):
+    reader = _TABLE_READERS.get(backend or PARSER_BACKEND, _TABLE_READERS["html.parser"])
+    if reader.name == "html.parser":
+        return reader
+    if markup is None or "\r" in markup:
+        # libxml2 folds CR/CRLF into LF inside text, html.parser keeps them.
+        return _TABLE_READERS["html.parser"]
+    lowered = markup.lower()
+    if lowered.count("<td") != lowered.count("</td") or lowered.count("<tr") != lowered.count("</tr"):
+        # html.parser nests unclosed cells/rows while libxml2 closes them,
+        # which changes what find_all("td") sees for a row.
+        return _TABLE_READERS["html.parser"]
+    return reader
+
+
+def parse_schedule_html(html, backend=None):
+    try:
+        markup = _decode_markup(html)
+        reader = _table_reader(markup, backend)
+        rows = reader.rows(markup if markup is not None else html)
         schedule = {}
         i = 0
         n = len(rows)
         while i < n:
             row = rows[i]
-            date_cell = row.find("td", attrs={"rowspan": True})
-            if not date_cell:
+            date_text = reader.date_text(row)
+            if date_text is None:
                 i += 1
                 continue
-            date_text = date_cell.get_text(separator="\n").strip()
-            m = _DATE_RE.search(date_text)
+            m = _DATE_RE.search(date_text.strip())
             if not m:
                 i += 1
                 continue
             date = m.group(1)
             dayname = (m.group(2) or "").strip()
-            schedule.setdefault(date, {"day": dayname, "pairs": {}, "pairs_cols": {}, "merge": {}})
+            pairs = schedule.setdefault(date, DaySchedule(dayname)).pairs
             day_rows = rows[i : i + 8]
             i += 8
             for dr in day_rows:
-                tds = dr.find_all("td")
+                tds = reader.cells(dr)
                 pair_num = None
                 pair_idx = -1
                 for idx, td in enumerate(tds):
-                    if "hd" in (td.get("class") or []):
-                        text = _clean_text(td.get_text())
+                    if reader.has_class(td, "hd"):
+                        text = _clean_text(reader.text(td))
                         if text.isdigit():
                             pair_num = int(text)
                             pair_idx = idx
@@ -117,14 +247,15 @@ def parse_schedule(url):
                 col = 0
                 for cell in cells:
                     span = 1
-                    if cell.has_attr("colspan"):
+                    colspan = reader.colspan(cell)
+                    if colspan is not None:
                         try:
-                            span = int(cell["colspan"])
+                            span = int(colspan)
                         except Exception:
                             span = 1
                     content = None
-                    if "ur" in (cell.get("class") or []):
-                        content = _mk_full_title(cell)
+                    if reader.has_class(cell, "ur"):
+                        content = reader.lesson(cell)
                     for k in range(span):
                         if col + k < 5:
                             groups[col + k] = content
@@ -139,53 +270,10 @@ def parse_schedule(url):
                 if all(g is None for g in groups):
                     continue
                 if common:
-                    schedule[date]["merge"][pair_num] = common
-                    schedule[date]["pairs"][pair_num] = [common]
-                else:
-                    if first and second:
-                        if first == second:
-                            schedule[date]["merge"][pair_num] = first
-                            schedule[date]["pairs"][pair_num] = [first]
-                        else:
-                            schedule[date]["pairs_cols"][pair_num] = [first, second]
-                            schedule[date]["pairs"][pair_num] = [first, second]
-                    elif first:
-                        schedule[date]["pairs_cols"][pair_num] = [first, ""]
-                        schedule[date]["pairs"][pair_num] = [first]
-                    elif second:
-                        schedule[date]["pairs_cols"][pair_num] = ["", second]
-                        schedule[date]["pairs"][pair_num] = [second]
-        for d, info in schedule.items():
-            lines = []
-            for i_pair in range(1, 9):
-                if i_pair in info.get("merge", {}):
-                    lines.append(f"{i_pair} пара: {info['merge'][i_pair]}")
-                    continue
-                cols = info.get("pairs_cols", {}).get(i_pair, None)
-                if not cols:
-                    items = info.get("pairs", {}).get(i_pair, [])
-                    if not items:
-                        lines.append(f"{i_pair} пара: НЕТ")
-                    elif len(items) == 1:
-                        lines.append(f"{i_pair} пара: {items[0]}")
-                    else:
-                        lines.append(f"{i_pair} пара:")
-                        lines.append(f"① {items[0]}")
-                        lines.append(f"② {items[1]}")
-                    continue
-                c1 = cols[0] if len(cols) > 0 else ""
-                c2 = cols[1] if len(cols) > 1 else ""
-                if not c1 and not c2:
-                    lines.append(f"{i_pair} пара: НЕТ")
-                elif c1 and c2:
-                    lines.append(f"{i_pair} пара:")
-                    lines.append(f"① {c1}")
-                    lines.append(f"② {c2}")
-                elif c1:
-                    lines.append(f"{i_pair} пара: ① {c1}")
-                else:
-                    lines.append(f"{i_pair} пара: ② {c2}")
-            info["lessons"] = lines
+                    pairs[pair_num] = (common, common)
+                elif first or second:
+                    # Equal subgroup cells mean the whole group, like a common cell.
+                    pairs[pair_num] = (first or None, second or None)
         return schedule
     except Exception as e:
         logging.error("parse error: %s", e)
@@ -217,20 +305,29 @@ def day_name_ru(weekday):
 def normalize_day(dstr, info, max_pairs=8, subgroup=None, multiline=False):
     d = dt.datetime.strptime(dstr, "%d.%m.%Y").date()
     name = day_name_ru(d.weekday())
-    return f"{name} • {dstr}", info.get("lessons", ["Пар нету🤗"])
+    return f"{name} • {dstr}", info.lesson_lines() if info else ["Пар нету🤗"]
 
 
 def make_blocks(schedule, max_pairs=8, subgroup=None, multiline=False):
     blocks = []
     for d in sort_dates_all(schedule):
         header, lst = normalize_day(
-            d, schedule.get(d, {}), max_pairs=max_pairs, subgroup=subgroup, multiline=multiline
+            d, schedule.get(d), max_pairs=max_pairs, subgroup=subgroup, multiline=multiline
         )
         blocks.append((header, lst))
     return blocks
 
 class ScheduleService:
-    def __init__(self, url_path: Path, times_path: Path, banner_dir: Path | None = None):
+    def __init__(
+        self,
+        url_path: Path,
+        times_path: Path,
+        banner_dir: Path | None = None,
+        renderer: BannerRenderer | None = None,
+        db=None,
+        events=None,
+        max_cached_weeks: int = 1024,
+    ):
         url_path.parent.mkdir(parents=True, exist_ok=True)
         try:
             with url_path.open(encoding="utf-8") as f:
@@ -240,13 +337,65 @@ class ScheduleService:
                 json.dump({}, f, ensure_ascii=False, indent=2)
             data = {}
         self.url_map: dict[str, str] = data if isinstance(data, dict) else {}
+        # Legacy per-week JSON files; the schedule now lives in the database.
         self.schedule_dir = url_path.parent / "schedule"
-        self.schedule_dir.mkdir(parents=True, exist_ok=True)
         self.times_path = times_path
         self._times_cache: dict | None = None
         self.banner_dir = (banner_dir or url_path.parent / "schedule_banners")
         self.banner_dir.mkdir(parents=True, exist_ok=True)
         self.custom_background_path = self.banner_dir / "custom_background.jpg"
+        self.banner_cache = BannerCache(self.banner_dir / "cache")
+        self.renderer = renderer or BannerRenderer(workers=0)
+        self.fetcher = PageFetcher()
+        # url -> (content hash, parsed schedule) of the last successful parse.
+        self._parsed_pages: dict[str, tuple[str, dict]] = {}
+        self.parse_stats = {"not_modified": 0, "hash_hits": 0, "misses": 0}
+        # schedule_days rows (see Database) are the source of truth; weeks
+        # read from it are kept in an LRU as (group, monday) -> days.
+        self.db = db
+        self.max_cached_weeks = max_cached_weeks
+        self._week_data: OrderedDict[tuple[str, dt.date], dict] = OrderedDict()
+        self._week_inflight = SingleFlight()
+        self.events = events
+
+    async def close(self) -> None:
+        await self.fetcher.close()
+        await self.renderer.close()
+
+    async def fetch_schedule(self, url: str) -> dict:
+        """Download and parse a schedule page.
+
+        The parse is skipped when the server answers 304 or when the body
+        hashes the same as the last parsed copy of this URL.
+        """
+        try:
+            result = await self.fetcher.fetch(url, conditional=url in self._parsed_pages)
+            if result.not_modified:
+                cached = self._parsed_pages.get(url)
+                if cached is not None:
+                    self.parse_stats["not_modified"] += 1
+                    return dict(cached[1])
+                # A concurrent fetch of this URL dropped its parse meanwhile;
+                # without it a 304 is useless, so ask for the full page.
+                self.fetcher.forget(url)
+                result = await self.fetcher.fetch(url, conditional=False)
+        except Exception as e:
+            logging.error("parse error: %s", e)
+            return {}
+        digest = hashlib.sha1(result.content).hexdigest()
+        cached = self._parsed_pages.get(url)
+        if cached is not None and cached[0] == digest:
+            self.parse_stats["hash_hits"] += 1
+            return dict(cached[1])
+        self.parse_stats["misses"] += 1
+        schedule = await asyncio.to_thread(parse_schedule_html, result.content)
+        if schedule:
+            self._parsed_pages[url] = (digest, schedule)
+        else:
+            self._parsed_pages.pop(url, None)
+            self.fetcher.forget(url)
+        # Parsed days are never mutated, so copying the mapping is enough.
+        return dict(schedule)
 
     def get_url_for_group(self, group_code: str) -> str | None:
         return self.url_map.get(group_code)
@@ -305,62 +454,12 @@ class ScheduleService:
         filtered = self._filter_lessons(lessons)
         return filtered[:max_pairs]
 
-    def _pair_cells(self, info: dict, pair_num: int) -> tuple[str, str]:
-        merge = info.get("merge", {}).get(pair_num)
-        if merge:
-            return merge, merge
-        cols = info.get("pairs_cols", {}).get(pair_num)
-        if cols:
-            first = cols[0] if len(cols) > 0 else ""
-            second = cols[1] if len(cols) > 1 else ""
-            return first or "", second or ""
-        pairs = info.get("pairs", {}).get(pair_num, [])
-        if not pairs:
-            return "", ""
-        if len(pairs) == 1:
-            return pairs[0], pairs[0]
-        return pairs[0] or "", pairs[1] or ""
-
-    def _max_pairs_for_day(self, info: dict) -> int:
-        numbers = set()
-        for key in ("pairs", "pairs_cols", "merge"):
-            numbers.update((info.get(key, {}) or {}).keys())
-        if not numbers:
-            return 8
-        return max(max(numbers), 8)
-
     def _style_palette(self, style: str) -> dict:
-        palette = {
-            "Обычный": {
-                "header": "#ffffff",
-                "accent": "#8ab4f8",
-                "bg_overlay": "rgba(0, 0, 0, 0.45)",
-                "cell": "rgba(255, 255, 255, 0.08)",
-                "border": "rgba(255, 255, 255, 0.25)",
-                "title_shadow": "0 4px 12px rgba(0, 0, 0, 0.45)",
-            },
-            "Новогодний": {
-                "header": "#fefefe",
-                "accent": "#f04f54",
-                "bg_overlay": "rgba(0, 0, 0, 0.55)",
-                "cell": "rgba(255, 255, 255, 0.1)",
-                "border": "rgba(240, 79, 84, 0.45)",
-                "title_shadow": "0 6px 16px rgba(240, 79, 84, 0.45)",
-            },
-            "Премиальный": {
-                "header": "#f5e6c4",
-                "accent": "#d4af37",
-                "bg_overlay": "rgba(0, 0, 0, 0.55)",
-                "cell": "rgba(245, 230, 196, 0.08)",
-                "border": "rgba(212, 175, 55, 0.5)",
-                "title_shadow": "0 6px 16px rgba(212, 175, 55, 0.4)",
-            },
-        }
-        return palette.get(style, palette["Обычный"])
+        return style_palette(style)
 
     def _build_day_rows(
         self,
-        info: dict,
+        info: DaySchedule,
         group_code: str,
         date_obj: dt.date,
         max_pairs: int,
@@ -369,7 +468,7 @@ class ScheduleService:
         rows: list[dict[str, str]] = []
         for pair_num in range(1, max_pairs + 1):
             time_label = times[pair_num - 1] if pair_num - 1 < len(times) else "—"
-            c1, c2 = self._pair_cells(info, pair_num)
+            c1, c2 = info.cells(pair_num)
             rows.append(
                 {
                     "pair": str(pair_num),
@@ -380,19 +479,13 @@ class ScheduleService:
             )
         return rows
 
-    def _build_banner_html(
-        self,
-        title: str,
-        rows: list[dict[str, str]],
-        palette: dict,
-        background_path: Path | None,
-    ) -> str:
+    def _banner_css(self, palette: dict, background_path: Path | None, width: int) -> str:
         bg_style = ""
         if background_path and background_path.exists():
             bg_style = f"background-image: linear-gradient({palette['bg_overlay']}, {palette['bg_overlay']}), url('{background_path.as_uri()}');"
         else:
             bg_style = "background: linear-gradient(135deg, #1a2a6c, #16222a);"
-        css = f"""
+        return f"""
         body {{
             margin: 0;
             padding: 0;
@@ -400,7 +493,7 @@ class ScheduleService:
             color: {palette['header']};
         }}
         .banner {{
-            width: 1280px;
+            width: {width}px;
             padding: 28px 32px;
             box-sizing: border-box;
             background-size: cover;
@@ -420,28 +513,46 @@ class ScheduleService:
             margin: 0 0 14px 0;
             text-shadow: {palette['title_shadow']};
         }}
-        table {{
+        table.day {{
             width: 100%;
             border-collapse: collapse;
             font-size: 16px;
         }}
-        th {{
+        table.day th {{
             text-align: left;
             padding: 10px 12px;
             background: {palette['cell']};
             border: 1px solid {palette['border']};
         }}
-        td {{
+        table.day td {{
             padding: 10px 12px;
             background: {palette['cell']};
             border: 1px solid {palette['border']};
         }}
-        th:first-child, td:first-child {{ width: 8%; text-align: center; }}
-        th:nth-child(2), td:nth-child(2) {{ width: 22%; }}
-        th:nth-child(3), td:nth-child(3) {{ width: 35%; }}
-        th:nth-child(4), td:nth-child(4) {{ width: 35%; }}
+        table.day th:first-child, table.day td:first-child {{ width: 8%; text-align: center; }}
+        table.day th:nth-child(2), table.day td:nth-child(2) {{ width: 22%; }}
+        table.day th:nth-child(3), table.day td:nth-child(3) {{ width: 35%; }}
+        table.day th:nth-child(4), table.day td:nth-child(4) {{ width: 35%; }}
         .accent {{ color: {palette['accent']}; }}
+        table.week {{
+            width: 100%;
+            border-collapse: separate;
+            border-spacing: 18px;
+            margin: -18px;
+        }}
+        table.week > tbody > tr > td {{
+            width: 50%;
+            vertical-align: top;
+        }}
+        .day-title {{
+            font-size: 22px;
+            font-weight: 700;
+            margin: 0 0 10px 0;
+            text-shadow: {palette['title_shadow']};
+        }}
         """
+
+    def _day_table_html(self, rows: list[dict[str, str]]) -> str:
         rows_html = "\n".join(
             [
                 f"<tr><td>{r['pair']}</td><td>{r['time']}</td><td>{escape(r['sub1'])}</td><td>{escape(r['sub2'])}</td></tr>"
@@ -449,13 +560,7 @@ class ScheduleService:
             ]
         )
         return f"""
-        <html>
-            <head><style>{css}</style></head>
-            <body>
-                <div class=\"banner\">
-                    <div class=\"overlay\">
-                        <div class=\"title\">{title}</div>
-                        <table>
+                        <table class=\"day\">
                             <thead>
                                 <tr>
                                     <th>#</th>
@@ -468,52 +573,96 @@ class ScheduleService:
                                 {rows_html}
                             </tbody>
                         </table>
+        """
+
+    def _build_banner_html(
+        self,
+        title: str,
+        rows: list[dict[str, str]],
+        palette: dict,
+        background_path: Path | None,
+    ) -> str:
+        css = self._banner_css(palette, background_path, 1280)
+        return f"""
+        <html>
+            <head><style>{css}</style></head>
+            <body>
+                <div class=\"banner\">
+                    <div class=\"overlay\">
+                        <div class=\"title\">{title}</div>
+                        {self._day_table_html(rows)}
                     </div>
                 </div>
             </body>
         </html>
         """
 
-    def _render_html_to_png(self, html: str, out_path: Path) -> None:
-        if HTML is None:
-            return
-        html_doc = HTML(string=html, base_url=str(self.banner_dir))
-        stylesheets = [CSS(string="body { background: transparent; }")]
-
-        # Newer versions of WeasyPrint ship write_png on the HTML instance, but
-        # some distributions package builds without this helper. Gracefully fall
-        # back to rendering the document and trying alternative outputs instead
-        # of crashing the bot with AttributeError.
-        if hasattr(html_doc, "write_png"):
-            html_doc.write_png(target=str(out_path), stylesheets=stylesheets)
-            return
+    def _build_week_banner_html(
+        self,
+        title: str,
+        days: list[tuple[str, list[dict[str, str]]]],
+        palette: dict,
+        background_path: Path | None,
+    ) -> str:
+        # Two days per row: Mon/Tue, Wed/Thu, Fri/Sat.
+        cells = [
+            f"<td><div class=\"day-title\">{day_title}</div>{self._day_table_html(rows)}</td>"
+            for day_title, rows in days
+        ]
+        if len(cells) % 2:
+            cells.append("<td></td>")
+        week_rows = "\n".join(f"<tr>{cells[i]}{cells[i + 1]}</tr>" for i in range(0, len(cells), 2))
+        css = self._banner_css(palette, background_path, 2400)
+        return f"""
+        <html>
+            <head><style>{css}</style></head>
+            <body>
+                <div class=\"banner\">
+                    <div class=\"overlay\">
+                        <div class=\"title\">{title}</div>
+                        <table class=\"week\">
+                            <tbody>
+                                {week_rows}
+                            </tbody>
+                        </table>
+                    </div>
+                </div>
+            </body>
+        </html>
+        """
 
+    def _background_mtime(self) -> float | None:
         try:
-            document = html_doc.render(stylesheets=stylesheets)
-        except Exception as e:  # pragma: no cover - optional dependency issues
-            logging.error("failed to render banner html: %s", e)
-            return
-
-        if hasattr(document, "write_png"):
-            document.write_png(target=str(out_path))
-            return
+            return self.custom_background_path.stat().st_mtime
+        except OSError:
+            return None
 
-        try:
-            from pdf2image import convert_from_bytes
-        except Exception as e:  # pragma: no cover - optional dependency issues
-            logging.error(
-                "PNG export is unavailable; install WeasyPrint with PNG support or pdf2image: %s",
-                e,
-            )
+    async def _render_banner(
+        self,
+        out_path: Path,
+        title: str,
+        style: str,
+        days: list[tuple[str | None, list[dict[str, str]]]],
+    ) -> None:
+        """Render a day (``[(None, rows)]``) or week banner with the configured backend."""
+        palette = self._style_palette(style)
+        week = days[0][0] is not None
+        if self.renderer.backend == "pillow":
+            background = self.custom_background_path
+            spec = {
+                "title": title,
+                "days": days,
+                "palette": palette,
+                "background": str(background) if background.exists() else None,
+                "width": 2400 if week else 1280,
+            }
+            await self.renderer.draw(spec, out_path)
             return
-
-        try:
-            pdf_bytes = document.write_pdf()
-            images = convert_from_bytes(pdf_bytes)
-            if images:
-                images[0].save(out_path, format="PNG")
-        except Exception as e:  # pragma: no cover - optional dependency issues
-            logging.error("failed to convert banner pdf to png: %s", e)
+        if week:
+            html = self._build_week_banner_html(title, days, palette, self.custom_background_path)
+        else:
+            html = self._build_banner_html(title, days[0][1], palette, self.custom_background_path)
+        await self.renderer.render(html, out_path, self.banner_dir)
 
     async def generate_day_banner(
         self,
@@ -522,117 +671,135 @@ class ScheduleService:
         date_obj: dt.date,
         style: str,
         title_prefix: str | None = None,
-    ) -> Path | None:
-        if HTML is None:
+    ) -> CachedBanner | None:
+        if not self.renderer.available:
             return None
         date_str = date_obj.strftime("%d.%m.%Y")
-        info = schedule.get(date_str, {})
+        info = schedule.get(date_str)
         if not info:
             return None
-        max_pairs = self._max_pairs_for_day(info)
-        rows = self._build_day_rows(info, group_code, date_obj, max_pairs)
-        palette = self._style_palette(style)
+        rows = self._build_day_rows(info, group_code, date_obj, info.max_pair())
         title_left = title_prefix or day_name_ru(date_obj.weekday())
         title = f"{title_left} • {date_str}"
-        html = self._build_banner_html(title, rows, palette, self.custom_background_path)
-        out_path = self.banner_dir / f"banner_{uuid4().hex}.png"
-        await asyncio.to_thread(self._render_html_to_png, html, out_path)
-        if out_path.exists():
-            return out_path
-        return None
+        # The rows already carry the lesson times and cell texts, so they are
+        # the day's content hash; the title covers "Сегодня"/"Завтра".
+        key = self.banner_cache.make_key(
+            self.renderer.backend, group_code, date_str, style, title, rows, self._background_mtime()
+        )
+
+        async def _render(out_path: Path) -> None:
+            await self._render_banner(out_path, title, style, [(None, rows)])
+
+        return await self.banner_cache.get_or_render(key, _render, date_obj, group=group_code)
 
-    async def generate_week_banners(
+    async def generate_week_banner(
         self, schedule: dict, group_code: str, base_date: dt.date, style: str
-    ) -> list[Path]:
-        if HTML is None:
-            return []
+    ) -> CachedBanner | None:
+        """Render the whole Mon–Sat week as one picture (one render, one upload)."""
+        if not self.renderer.available:
+            return None
         monday, saturday = week_mon_sat_for_display(base_date)
+        days: list[tuple[str, list[dict[str, str]]]] = []
         current = monday
-        result: list[Path] = []
         while current <= saturday:
-            banner = await self.generate_day_banner(
-                schedule,
-                group_code,
-                current,
-                style,
-                day_name_ru(current.weekday()),
-            )
-            if banner:
-                result.append(banner)
+            date_str = current.strftime("%d.%m.%Y")
+            info = schedule.get(date_str)
+            if info:
+                rows = self._build_day_rows(info, group_code, current, info.max_pair())
+                days.append((f"{day_name_ru(current.weekday())} • {date_str}", rows))
             current += dt.timedelta(days=1)
-        return result
+        if not days:
+            return None
+        title = f"{group_code} • {monday.strftime('%d.%m')}–{saturday.strftime('%d.%m.%Y')}"
+        key = self.banner_cache.make_key(
+            self.renderer.backend, "week", group_code, style, title, days, self._background_mtime()
+        )
 
-    def _schedule_filename(self, group_code: str, monday: dt.date, saturday: dt.date) -> Path:
-        name = f"{group_code}_{monday.strftime('%d.%m.%y')}-{saturday.strftime('%d.%m.%y')}.json"
-        return self.schedule_dir / name
+        async def _render(out_path: Path) -> None:
+            await self._render_banner(out_path, title, style, days)
+
+        return await self.banner_cache.get_or_render(key, _render, saturday, group=group_code, since=monday)
+
+    @staticmethod
+    def _week_range(date_obj: dt.date) -> tuple[dt.date, dt.date, dt.date]:
+        """Display week of ``date_obj`` plus the Sunday before it (asked for on Sundays)."""
+        monday, saturday = week_mon_sat_for_display(date_obj)
+        return monday, monday - dt.timedelta(days=1), saturday
+
+    async def _load_cached_schedule(self, group_code: str, target_date: dt.date) -> dict | None:
+        monday, start, end = self._week_range(target_date)
+        key = (group_code, monday)
+        schedule = self._week_data.get(key)
+        if schedule is not None:
+            self._week_data.move_to_end(key)
+            return schedule
+        if self.db is None:
+            return None
+        try:
+            schedule = await self.db.get_schedule_days(group_code, start, end)
+        except Exception as e:
+            logging.error("failed to load cached schedule for %s: %s", group_code, e)
+            return None
+        if not schedule:
+            return None
+        self._remember_week(key, schedule)
+        return schedule
 
-    def _cleanup_old_files(self, current_date: dt.date) -> None:
-        monday_current, saturday_current = week_mon_sat_for_display(current_date)
-        for path in self.schedule_dir.glob("*.json"):
-            stem = path.stem
-            if "_" not in stem:
-                continue
+    def _remember_week(self, key: tuple[str, dt.date], schedule: dict) -> None:
+        self._week_data[key] = schedule
+        self._week_data.move_to_end(key)
+        while len(self._week_data) > self.max_cached_weeks:
+            self._week_data.popitem(last=False)
+
+    async def store_schedule(self, group_code: str, base_date: dt.date, schedule: dict) -> list[dt.date]:
+        """Upsert the days of a freshly fetched page and publish schedule_changed
+        for the days whose content differs from what was stored; returns them."""
+        if not schedule:
+            return []
+        monday = self._week_range(base_date)[0]
+        if self.db is not None:
             try:
-                _, range_part = stem.rsplit("_", 1)
-                start_str, end_str = range_part.split("-", 1)
-                start_date = dt.datetime.strptime(start_str, "%d.%m.%y").date()
-                end_date = dt.datetime.strptime(end_str, "%d.%m.%y").date()
-            except Exception:
-                continue
-            if end_date < monday_current:
-                try:
-                    path.unlink()
-                except OSError as e:
-                    logging.error("failed to delete old schedule file %s: %s", path, e)
-
-    def _load_cached_schedule(self, group_code: str, target_date: dt.date) -> dict | None:
-        for path in self.schedule_dir.glob(f"{group_code}_*.json"):
-            stem = path.stem
+                changed = await self.db.upsert_schedule_days(group_code, schedule)
+            except Exception as e:
+                logging.error("failed to save schedule for %s: %s", group_code, e)
+                changed = []
+        else:
+            changed = list(schedule)
+        dates = []
+        for date_str in changed:
             try:
-                _, range_part = stem.rsplit("_", 1)
-                start_str, end_str = range_part.split("-", 1)
-                start_date = dt.datetime.strptime(start_str, "%d.%m.%y").date()
-                end_date = dt.datetime.strptime(end_str, "%d.%m.%y").date()
-            except Exception:
+                dates.append(dt.datetime.strptime(date_str, "%d.%m.%Y").date())
+            except ValueError:
                 continue
-            if start_date <= target_date <= end_date:
-                try:
-                    with path.open(encoding="utf-8") as f:
-                        data = json.load(f)
-                    schedule = data.get("schedule")
-                    if isinstance(schedule, dict):
-                        return schedule
-                except Exception as e:
-                    logging.error("failed to load cached schedule %s: %s", path, e)
-        return None
-
-    def _save_schedule(self, group_code: str, base_date: dt.date, schedule: dict) -> None:
-        monday, saturday = week_mon_sat_for_display(base_date)
-        path = self._schedule_filename(group_code, monday, saturday)
-        data = {
-            "group": group_code,
-            "monday": monday.strftime("%d.%m.%Y"),
-            "saturday": saturday.strftime("%d.%m.%Y"),
-            "schedule": schedule,
-        }
-        try:
-            with path.open("w", encoding="utf-8") as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
-        except Exception as e:
-            logging.error("failed to save schedule %s: %s", path, e)
+        if dates:
+            for key in [k for k in self._week_data if k[0] == group_code]:
+                del self._week_data[key]
+        if self.db is None:
+            self._remember_week((group_code, monday), schedule)
+        if dates and self.events is not None:
+            await self.events.publish(SCHEDULE_CHANGED, group=group_code, dates=sorted(dates))
+        return sorted(dates)
+
+    def on_schedule_changed(self, group: str, dates: list[dt.date], **_) -> None:
+        """schedule_changed handler: drop the banners showing the changed days."""
+        self.banner_cache.evict(group, dates)
 
     async def _fetch_schedule_for_group(self, group_code: str, base_date: dt.date) -> dict:
-        self._cleanup_old_files(base_date)
-        cached = self._load_cached_schedule(group_code, base_date)
+        cached = await self._load_cached_schedule(group_code, base_date)
         if cached is not None:
             return cached
         url = self.get_url_for_group(group_code)
         if not url:
             return {}
-        schedule = await asyncio.to_thread(parse_schedule, url)
-        if schedule:
-            self._save_schedule(group_code, base_date, schedule)
-        return schedule
+        key = (group_code, self._week_range(base_date)[0])
+
+        async def _fetch() -> dict:
+            schedule = await self.fetch_schedule(url)
+            await self.store_schedule(group_code, base_date, schedule)
+            return schedule
+
+        # Everyone asking for the same week waits on the one download.
+        return await self._week_inflight.run(key, _fetch)
 
     async def get_week_schedule(self, group_code: str, base_date: dt.date) -> dict:
         """Return cached or freshly fetched schedule for the requested week."""
@@ -642,7 +809,7 @@ class ScheduleService:
         if not schedule:
             return f"Не удалось получить расписание для группы <b>{group_code}</b>."
         date_str = date_obj.strftime("%d.%m.%Y")
-        info = schedule.get(date_str, {})
+        info = schedule.get(date_str)
         header, lessons = normalize_day(date_str, info)
         header_text = f"<b>{header}</b>\n"
         lessons_text = "\n".join(lessons)
@@ -656,7 +823,7 @@ class ScheduleService:
         current = monday
         while current <= saturday:
             date_str = current.strftime("%d.%m.%Y")
-            info = schedule.get(date_str, {})
+            info = schedule.get(date_str)
             header, lessons = normalize_day(date_str, info)
             lessons_text = "\n".join(lessons)
             block_text = f"<b>{header}</b>\n<blockquote>{lessons_text}</blockquote>"
@@ -676,23 +843,7 @@ class ScheduleService:
 
     async def get_unique_subjects_for_week(self, group_code: str, base_date: dt.date) -> list[str]:
         schedule = await self._fetch_schedule_for_group(group_code, base_date)
-        subjects = set()
+        subjects: set[str] = set()
         for info in schedule.values():
-            pairs_dict = info.get("pairs", {})
-            merge_dict = info.get("merge", {})
-            for p_list in pairs_dict.values():
-                for raw in p_list:
-                    if raw:
-                        parts = raw.split("|")
-                        if parts:
-                            subj = parts[0].strip()
-                            if subj:
-                                subjects.add(subj)
-            for raw in merge_dict.values():
-                if raw:
-                    parts = raw.split("|")
-                    if parts:
-                        subj = parts[0].strip()
-                        if subj:
-                            subjects.add(subj)
-        return sorted(list(subjects))
+            subjects.update(info.subjects())
+        return sorted(subjects)
@@ -2,151 +2,86 @@ import asyncio
 import datetime as dt
 import json
 import logging
-import re
 from pathlib import Path
 from typing import Any
 
-from aiogram import Bot
-
 from app.core.context import get_context
-from app.services.schedule_service import week_bounds_mon_sun, parse_schedule, normalize_day, day_name_ru
-
-_HEADER_RE = re.compile(r"^\s*(\d+)\s*пара\s*:\s*(.*)$", re.IGNORECASE)
-_BULLET_RE = re.compile(r"^\s*[①②•\-]\s*")
-_NO_RE = re.compile(r"^(нет|нет пар|—|-)$", re.IGNORECASE)
+from app.services.poll_scheduler import PollScheduler
+from app.services.schedule_diff import ADDED, MOVED, REMOVED, PairChange, diff_days, fingerprint, is_false_cancel
+from app.services.schedule_model import DaySchedule
+from app.services.schedule_service import day_name_ru
 
 BASE_DIR = Path(__file__).resolve().parents[2]
 TMP_DIR = BASE_DIR / "config"
 TMP_DIR.mkdir(parents=True, exist_ok=True)
+# Pre-schedule_days change fingerprints, deleted on start.
 STATE_PATH = TMP_DIR / "watchdog_state.json"
+# Legacy per-week baselines, imported into schedule_days on start.
 SCHEDULE_CACHE_DIR = TMP_DIR / "watchdog_schedule"
 OVERLAY_PATH = TMP_DIR / "schedule_overlay.json"
-SCHEDULE_CACHE_DIR.mkdir(parents=True, exist_ok=True)
 
+FETCH_CONCURRENCY = 8
+# Telegram rejects messages over 4096 characters.
+MAX_MESSAGE_LEN = 4000
+MAX_IDLE = 30
 
-def _clean(s: str | None) -> str:
-    return re.sub(r"\s+", " ", (s or "").replace("\xa0", " ")).strip()
 
+_SUBGROUP_MARKS = {1: " ①", 2: " ②"}
 
-def _normalize_day_lines(dstr: str, info: Any) -> list[str]:
-    _, lines = normalize_day(dstr, info, max_pairs=8, subgroup=None, multiline=False)
-    return lines or []
 
-
-def _parse_slots(lines: list[str] | None) -> dict[int, list[str]]:
-    slots: dict[int, list[str]] = {}
-    j = 0
-    n = len(lines or [])
-    while j < n:
-        raw = lines[j] if lines[j] is not None else ""
-        line = _clean(str(raw))
-        m = _HEADER_RE.match(line)
-        if not m:
-            j += 1
-            continue
-        num = int(m.group(1))
-        tail = _clean(m.group(2))
-        items: list[str] = []
-        if tail and not _NO_RE.fullmatch(tail):
-            items.append(_BULLET_RE.sub("", tail))
-        k = j + 1
-        while k < n:
-            raw_next = lines[k] if lines[k] is not None else ""
-            nxt = _clean(str(raw_next))
-            if _HEADER_RE.match(nxt):
-                break
-            if nxt and not _NO_RE.fullmatch(nxt):
-                items.append(_BULLET_RE.sub("", nxt))
-            k += 1
-        slots[num] = [x for x in items if x]
-        j = k
-    return slots
+def _describe(change: PairChange) -> str:
+    mark = _SUBGROUP_MARKS.get(change.subgroup, "")
+    if change.kind == MOVED:
+        return f"• {change.pair} → {change.to_pair} пара{mark}: перенесена «{change.old.title}»"
+    if change.kind == REMOVED:
+        return f"• {change.pair} пара{mark}: отменена «{change.old.title}»"
+    if change.kind == ADDED:
+        return f"• {change.pair} пара{mark}: добавлена «{change.new.title}»"
+    return f"• {change.pair} пара{mark}: изменена «{change.old.title}» → «{change.new.title}»"
 
 
-def _norm_join(arr: list[str] | None) -> str:
-    return _clean(" | ".join([_clean(x) for x in (arr or []) if _clean(x)]))
-
-
-def _build_changes(
-    old_slots: dict[int, list[str]],
-    new_slots: dict[int, list[str]],
-) -> tuple[list[tuple[int, str]], list[tuple[int, str]], list[tuple[int, str, str]]]:
-    all_keys = set(old_slots.keys()) | set(new_slots.keys())
-    removed: list[tuple[int, str]] = []
-    added: list[tuple[int, str]] = []
-    changed: list[tuple[int, str, str]] = []
-    for k in sorted(all_keys):
-        o = old_slots.get(k) or []
-        n = new_slots.get(k) or []
-        o_s = _norm_join(o)
-        n_s = _norm_join(n)
-        if not o_s and not n_s:
-            continue
-        if o_s and not n_s:
-            removed.append((k, o_s))
-        elif not o_s and n_s:
-            added.append((k, n_s))
-        elif o_s != n_s:
-            changed.append((k, o_s, n_s))
-    return removed, added, changed
-
-
-def _format_message(
+def _format_digest(
     group: str,
     now_dt: dt.datetime,
-    ddate: dt.date,
-    dstr: str,
-    removed: list[tuple[int, str]],
-    added: list[tuple[int, str]],
-    changed: list[tuple[int, str, str]],
-) -> str:
+    days: list[tuple[dt.date, list[PairChange]]],
+    published: list[tuple[dt.date, DaySchedule]] | None = None,
+) -> list[str]:
+    """One message with every changed or newly published day, split at day
+    boundaries if too long."""
     head: list[str] = []
     head.append("Группа: " + str(group))
     head.append("")
     head.append("🗓️ Обновление расписания")
     head.append("⏰ " + now_dt.strftime("%d.%m.%Y %H:%M"))
-    head.append("")
-    head.append(day_name_ru(ddate.weekday()) + " • " + dstr)
-    body: list[str] = []
-    for k, o in removed:
-        body.append(f"• {k} пара: отменена «{o}»")
-    for k, n in added:
-        body.append(f"• {k} пара: добавлена «{n}»")
-    for k, o, n in changed:
-        body.append(f"• {k} пара: изменена «{o}» → «{n}»")
-    if not body:
-        body.append("• Изменений нет")
-    return "\n".join(head + body)
-
-
-def _load_state() -> dict[str, str]:
-    if not STATE_PATH.exists():
-        return {}
+    blocks: list[tuple[dt.date, list[str]]] = []
+    for ddate, changes in days:
+        title = day_name_ru(ddate.weekday()) + " • " + ddate.strftime("%d.%m.%Y")
+        blocks.append((ddate, ["", title] + [_describe(change) for change in changes]))
+    for ddate, day in published or []:
+        title = day_name_ru(ddate.weekday()) + " • " + ddate.strftime("%d.%m.%Y") + " • расписание опубликовано"
+        blocks.append((ddate, ["", title] + day.lesson_lines()))
+    messages: list[str] = []
+    current = list(head)
+    for _, block in sorted(blocks, key=lambda b: b[0]):
+        if len(current) > len(head) and len("\n".join(current + block)) > MAX_MESSAGE_LEN:
+            messages.append("\n".join(current))
+            current = list(head)
+        current += block
+    messages.append("\n".join(current))
+    return messages
+
+
+def drop_legacy_state() -> None:
+    """Fingerprints live in schedule_days now; the old file never matches them."""
     try:
-        with STATE_PATH.open("r", encoding="utf-8") as f:
-            data = json.load(f)
-        if isinstance(data, dict):
-            out: dict[str, str] = {}
-            for k, v in data.items():
-                if isinstance(k, str) and isinstance(v, str):
-                    out[k] = v
-            return out
-        return {}
-    except Exception:
-        return {}
-
-
-def _save_state(state: dict[str, str]) -> None:
-    try:
-        with STATE_PATH.open("w", encoding="utf-8") as f:
-            json.dump(state, f, ensure_ascii=False)
-    except Exception:
+        STATE_PATH.unlink()
+    except OSError:
         pass
 
 
-def _safe_parse(url: str) -> dict[str, Any]:
+async def _safe_parse(schedule_service, url: str) -> dict[str, Any]:
     try:
-        data = parse_schedule(url)
+        data = await schedule_service.fetch_schedule(url)
         if isinstance(data, dict):
             return data
         return {}
@@ -155,38 +90,33 @@ def _safe_parse(url: str) -> dict[str, Any]:
         return {}
 
 
-def _should_skip_false_cancel(old_slots: dict[int, list[str]], new_slots: dict[int, list[str]]) -> bool:
-    o_cnt = sum(1 for v in old_slots.values() if _norm_join(v))
-    n_cnt = sum(1 for v in new_slots.values() if _norm_join(v))
-    return o_cnt > 0 and n_cnt == 0
-
+async def import_legacy_weeks(db) -> int:
+    """Move baselines from watchdog_schedule/*.json into schedule_days once."""
+    if not SCHEDULE_CACHE_DIR.is_dir():
+        return 0
+    imported = 0
 
-def _week_path(group: str, monday: dt.date, sunday: dt.date) -> Path:
-    return SCHEDULE_CACHE_DIR / f"{group}_{monday.strftime('%Y%m%d')}_{sunday.strftime('%Y%m%d')}.json"
+    def _sunday(path: Path) -> str:
+        return path.stem.rsplit("_", 1)[-1]
 
-
-def _load_week(group: str, monday: dt.date, sunday: dt.date) -> dict[str, Any]:
-    path = _week_path(group, monday, sunday)
-    if not path.exists():
-        return {}
-    try:
-        with path.open("r", encoding="utf-8") as f:
-            data = json.load(f)
+    # Newest week first: a day already imported is not overwritten.
+    for path in sorted(SCHEDULE_CACHE_DIR.glob("*.json"), key=_sunday, reverse=True):
+        parts = path.stem.rsplit("_", 2)
+        if len(parts) != 3:
+            continue
+        try:
+            with path.open("r", encoding="utf-8") as f:
+                data = json.load(f)
+        except Exception:
+            data = None
         if isinstance(data, dict):
-            return data
-        return {}
-    except Exception:
-        return {}
-
-
-def _save_week(group: str, monday: dt.date, sunday: dt.date, data: dict[str, Any]) -> None:
-    path = _week_path(group, monday, sunday)
-    try:
-        path.parent.mkdir(parents=True, exist_ok=True)
-        with path.open("w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False)
-    except Exception:
-        pass
+            await db.set_notified_schedule_days(parts[0], data, replace=False)
+            imported += 1
+        try:
+            path.unlink()
+        except OSError:
+            pass
+    return imported
 
 
 def _load_overlay() -> dict[str, Any]:
@@ -202,75 +132,135 @@ def _load_overlay() -> dict[str, Any]:
         return {}
 
 
-async def schedule_watchdog_loop(bot: Bot, tz: dt.tzinfo) -> None:
-    state = _load_state()
+async def _fetch_pages(schedule_service, urls: list[str]) -> dict[str, dict[str, Any]]:
+    sem = asyncio.Semaphore(FETCH_CONCURRENCY)
+
+    async def _one(url: str) -> tuple[str, dict[str, Any]]:
+        async with sem:
+            return url, await _safe_parse(schedule_service, url)
+
+    results = await asyncio.gather(*(_one(url) for url in urls))
+    return dict(results)
+
+
+async def _check_group(
+    ctx,
+    g: str,
+    page: dict[str, Any],
+    overlay: dict[str, Any],
+    now: dt.datetime,
+) -> None:
+    """Diff every upcoming day of the page against what subscribers were told."""
+    today = now.date()
+    fresh: dict[dt.date, DaySchedule] = {}
+    # Overlay days are hand-written JSON in the stored day format.
+    for dstr, info in list(page.items()) + [(k, DaySchedule.from_json(v)) for k, v in overlay.items()]:
+        try:
+            d = dt.datetime.strptime(dstr, "%d.%m.%Y").date()
+        except ValueError:
+            continue
+        if d >= today:
+            fresh[d] = info
+    if not fresh:
+        return
+    # Stored hashes let unchanged days be skipped without loading them.
+    baselines = await ctx.db.get_notified_schedule_hashes(g, min(fresh), max(fresh))
+    report: list[tuple[dt.date, list[PairChange]]] = []
+    published: list[tuple[dt.date, DaySchedule]] = []
+    baseline: dict[str, DaySchedule] = {}
+    fingerprints: dict[str, str] = {}
+    for d in sorted(fresh):
+        new_info = fresh[d]
+        dstr = d.strftime("%d.%m.%Y")
+        notified_hash, notified_fingerprint = baselines.get(dstr, (None, None))
+        if notified_hash == new_info.digest:
+            continue
+        if notified_hash is None:
+            # A day seen for the first time is a publication, not a change;
+            # it is announced only while it is today or tomorrow.
+            if d <= today + dt.timedelta(days=1) and any(True for _ in new_info.lessons()):
+                published.append((d, new_info))
+            baseline[dstr] = new_info
+            continue
+        old_info = await ctx.db.get_notified_schedule_day(g, d) or DaySchedule()
+        changes = diff_days(old_info, new_info)
+        if not changes:
+            # Same lessons under another hash (day name, older row format):
+            # re-baseline quietly so the next check is a hash compare again.
+            baseline[dstr] = new_info
+            continue
+        if is_false_cancel(old_info, new_info):
+            continue
+        change_fingerprint = fingerprint(changes)
+        if notified_fingerprint == change_fingerprint:
+            continue
+        report.append((d, changes))
+        baseline[dstr] = new_info
+        fingerprints[dstr] = change_fingerprint
+    if report or published:
+        users = await ctx.db.get_users_for_schedule_notifications(g)
+        # Delivery drains in the background so detection keeps running.
+        for msg in _format_digest(g, now, report, published):
+            await ctx.notifier.submit(users, msg, disable_web_page_preview=True)
+    if baseline:
+        await ctx.db.set_notified_schedule_days(g, baseline, fingerprints=fingerprints)
+
+
+async def schedule_watchdog_loop(tz: dt.tzinfo) -> None:
+    imported = False
+    scheduler = PollScheduler(tz)
+    last_pages: dict[str, dict[str, Any]] = {}
     while True:
         try:
             ctx = get_context()
         except Exception:
             await asyncio.sleep(2)
             continue
+        if not imported:
+            try:
+                await import_legacy_weeks(ctx.db)
+            except Exception as e:
+                logging.error("watchdog: legacy import failed: %s", e)
+            drop_legacy_state()
+            imported = True
         try:
             schedule_service = ctx.schedule_service
             url_map = getattr(schedule_service, "url_map", {}) or {}
-            overlay_all = _load_overlay()
-            now = dt.datetime.now(tz)
-            targets = [now.date(), now.date() + dt.timedelta(days=1)]
+            # Polling is scheduled per page; groups sharing a page share its deadline.
+            groups_by_url: dict[str, list[str]] = {}
             for g, url in list(url_map.items()):
-                if not url:
-                    continue
-                for tgt in targets:
-                    cmonday, csunday = week_bounds_mon_sun(tgt)
-                    old_week = _load_week(g, cmonday, csunday) or {}
-                    fresh = await asyncio.to_thread(_safe_parse, url)
-                    overlay = overlay_all.get(g, {}) or {}
-                    for dstr, info in list(overlay.items()):
-                        try:
-                            d = dt.datetime.strptime(dstr, "%d.%m.%Y").date()
-                        except Exception:
-                            continue
-                        if cmonday <= d <= csunday:
-                            fresh[dstr] = info
-                    dstr = tgt.strftime("%d.%m.%Y")
-                    new_info = fresh.get(dstr)
-                    if new_info is None:
-                        continue
-                    old_info = old_week.get(dstr, {"day": "", "lessons": []})
-                    old_lines = _normalize_day_lines(dstr, old_info)
-                    new_lines = _normalize_day_lines(dstr, new_info)
-                    old_slots = _parse_slots(old_lines)
-                    new_slots = _parse_slots(new_lines)
-                    removed, added, changed = _build_changes(old_slots, new_slots)
-                    if not removed and not added and not changed:
-                        continue
-                    if _should_skip_false_cancel(old_slots, new_slots):
-                        continue
-                    fingerprint = json.dumps(
-                        {"rem": removed, "add": added, "chg": changed},
-                        ensure_ascii=False,
-                    )
-                    key = f"{g}:{dstr}"
-                    if state.get(key) == fingerprint:
-                        continue
-                    msg = _format_message(g, now, tgt, dstr, removed, added, changed)
-                    users = await ctx.db.get_users_for_schedule_notifications(g)
-                    for u in users:
-                        tg_id = u.get("tg_id")
-                        if not tg_id:
-                            continue
-                        username = u.get("username")
-                        banned = await ctx.db.is_user_banned(tg_id, username)
-                        if banned:
-                            continue
+                if url:
+                    groups_by_url.setdefault(url, []).append(g)
+            scheduler.sync(groups_by_url)
+            for url in list(last_pages):
+                if url not in groups_by_url:
+                    del last_pages[url]
+            due = scheduler.pop_due()
+            if due:
+                # One download and parse per page, shared by every group and date on it.
+                pages = await _fetch_pages(schedule_service, due)
+                overlay_all = _load_overlay()
+                now = dt.datetime.now(tz)
+                for url in due:
+                    page = pages.get(url) or {}
+                    previous = last_pages.get(url)
+                    # A failed fetch comes back empty and counts as "no change".
+                    changed = bool(page) and previous is not None and page != previous
+                    if page:
+                        last_pages[url] = page
+                    scheduler.record(url, changed)
+                    if page and (changed or previous is None):
+                        # Only days whose stored content differs are announced, so a
+                        # restart (no previous page) does not evict every banner.
+                        for g in groups_by_url.get(url, []):
+                            await schedule_service.store_schedule(g, now.date(), page)
+                    for g in groups_by_url.get(url, []):
                         try:
-                            await bot.send_message(tg_id, msg, disable_web_page_preview=True)
-                        except TypeError:
-                            await bot.send_message(tg_id, msg)
-                        except Exception:
-                            await ctx.db.set_user_blocked(tg_id, True)
-                    _save_week(g, cmonday, csunday, fresh)
-                    state[key] = fingerprint
-                    _save_state(state)
+                            await _check_group(ctx, g, page, overlay_all.get(g, {}) or {}, now)
+                        except Exception as e:
+                            logging.error("watchdog: group %s failed: %s", g, e)
         except Exception as e:
             logging.error("watchdog loop: %s", e)
-        await asyncio.sleep(30)
\ No newline at end of file
+        delay = scheduler.seconds_until_next()
+        # Wake up at least every MAX_IDLE seconds to pick up url_map changes.
+        await asyncio.sleep(min(MAX_IDLE, delay if delay is not None else MAX_IDLE) or 1)
@@ -0,0 +1,145 @@
+import datetime as dt
+import time
+from collections import OrderedDict
+from typing import Any
+
+DEFAULT_SCHEDULE_STYLE = "Обычный"
+
+
+class UserProfile:
+    __slots__ = (
+        "tg_id",
+        "id",
+        "username",
+        "first_name",
+        "last_name",
+        "tos_accepted",
+        "group_code",
+        "is_blocked",
+        "created_at",
+        "schedule_notify_enabled",
+        "schedule_style",
+        "premium_until",
+        "steward_group",
+    )
+
+    def __init__(self, tg_id: int) -> None:
+        self.tg_id = tg_id
+        self.id: int | None = None
+        self.username: str | None = None
+        self.first_name: str | None = None
+        self.last_name: str | None = None
+        self.tos_accepted = 0
+        self.group_code: str | None = None
+        self.is_blocked = 0
+        self.created_at: str | None = None
+        self.schedule_notify_enabled = True
+        self.schedule_style: str | None = None
+        self.premium_until: dt.datetime | None = None
+        self.steward_group: str | None = None
+
+    @classmethod
+    def from_row(cls, tg_id: int, row: Any) -> "UserProfile":
+        profile = cls(tg_id)
+        if row is None:
+            return profile
+        profile.id = row["id"]
+        profile.username = row["username"]
+        profile.first_name = row["first_name"]
+        profile.last_name = row["last_name"]
+        profile.tos_accepted = row["tos_accepted"] or 0
+        profile.group_code = row["group_code"]
+        profile.is_blocked = row["is_blocked"] or 0
+        profile.created_at = row["created_at"]
+        value = row["schedule_notify_enabled"]
+        profile.schedule_notify_enabled = True if value is None else bool(value)
+        profile.schedule_style = row["schedule_style"]
+        profile.premium_until = _parse_until(row["premium_until"])
+        profile.steward_group = row["steward_group"]
+        return profile
+
+    @property
+    def exists(self) -> bool:
+        return self.id is not None
+
+    def active_premium_until(self) -> dt.datetime | None:
+        until = self.premium_until
+        if until is None or until <= dt.datetime.utcnow():
+            return None
+        return until
+
+    def style_or_default(self) -> str:
+        return str(self.schedule_style) if self.schedule_style else DEFAULT_SCHEDULE_STYLE
+
+    def as_user_dict(self) -> dict[str, Any] | None:
+        if not self.exists:
+            return None
+        return {
+            "id": self.id,
+            "tg_id": self.tg_id,
+            "username": self.username,
+            "first_name": self.first_name,
+            "last_name": self.last_name,
+            "tos_accepted": self.tos_accepted,
+            "group_code": self.group_code,
+            "is_blocked": self.is_blocked,
+            "created_at": self.created_at,
+        }
+
+
+def _parse_until(value: str | None) -> dt.datetime | None:
+    if not value:
+        return None
+    try:
+        return dt.datetime.fromisoformat(value)
+    except Exception:
+        return None
+
+
+class UserProfileCache:
+    """LRU of recently seen profiles; entries also expire after ``ttl`` seconds."""
+
+    def __init__(self, maxsize: int = 10000, ttl: float = 600.0) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._items: OrderedDict[int, tuple[float, UserProfile]] = OrderedDict()
+
+    def get(self, tg_id: int) -> UserProfile | None:
+        item = self._items.get(tg_id)
+        if item is None:
+            return None
+        expires_at, profile = item
+        if expires_at < time.monotonic():
+            del self._items[tg_id]
+            return None
+        self._items.move_to_end(tg_id)
+        return profile
+
+    def put(self, profile: UserProfile) -> None:
+        self._items[profile.tg_id] = (time.monotonic() + self.ttl, profile)
+        self._items.move_to_end(profile.tg_id)
+        while len(self._items) > self.maxsize:
+            self._items.popitem(last=False)
+
+    def update(self, tg_id: int, **fields: Any) -> None:
+        profile = self.get(tg_id)
+        if profile is None:
+            return
+        for name, value in fields.items():
+            setattr(profile, name, value)
+
+    def update_user(self, tg_id: int, **fields: Any) -> None:
+        """Apply a ``users`` column change; missing users stay missing."""
+        profile = self.get(tg_id)
+        if profile is None:
+            return
+        if not profile.exists:
+            return
+        for name, value in fields.items():
+            setattr(profile, name, value)
+
+    def invalidate(self, tg_id: int) -> None:
+        self._items.pop(tg_id, None)
+
+    def clear(self) -> None:
+        self._items.clear()
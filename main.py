@@ -17,8 +17,11 @@ async def main():
     storage = SQLiteStorage(str(config.db_path))
     await storage.init()
     dp = Dispatcher(storage=storage)
-    await setup_bot(bot, dp, config)
-    await dp.start_polling(bot)
+    try:
+        await setup_bot(bot, dp, config)
+        await dp.start_polling(bot)
+    finally:
+        await storage.close()
 
 
 if __name__ == "__main__":
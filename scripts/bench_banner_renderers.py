@@ -0,0 +1,144 @@
+"""Render the same day and week banners with every backend and compare them.
+
+Each backend runs in a fresh interpreter that imports only that backend's
+modules, so its ``ru_maxrss`` is the peak RSS of that backend alone (imports
+and fonts included):
+
+    python scripts/bench_banner_renderers.py [--runs 10] [--background image.jpg]
+"""
+import argparse
+import json
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+# Not taken from banner_renderer: importing it loads WeasyPrint in every run.
+BACKENDS = ("weasyprint", "pillow")
+_TIMES = ["08:30–10:00", "10:10–11:40", "12:10–13:40", "13:50–15:20", "15:30–17:00", "17:10–18:40"]
+_DAYS = ["Понедельник", "Вторник", "Среда", "Четверг", "Пятница", "Суббота"]
+
+
+def _rows() -> list[dict[str, str]]:
+    rows = []
+    for num in range(1, 9):
+        if num % 3 == 0:
+            sub1 = sub2 = "Физическая культура | Спортзал | Хасанов Д.Р."
+        else:
+            sub1 = "МДК.01.01 Разработка программных модулей | 305 | Иванов И.И." if num % 2 else "—"
+            sub2 = "Информатика | 204 | Гайсина И.Р." if num < 6 else "—"
+        rows.append({"pair": str(num), "time": _TIMES[(num - 1) % len(_TIMES)], "sub1": sub1, "sub2": sub2})
+    return rows
+
+
+def _maxrss_mb() -> float:
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes.
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+def _bench(backend: str, runs: int, background: str | None) -> dict:
+    # Imports happen here so each subprocess loads only its own backend.
+    if backend == "pillow":
+        from app.services import banner_pillow
+        from app.services.banner_styles import style_palette
+
+        if banner_pillow.Image is None:
+            return {"backend": backend, "error": "Pillow is not installed"}
+    else:
+        from app.services import banner_renderer
+        from app.services.schedule_service import ScheduleService
+
+        if banner_renderer.HTML is None:
+            return {"backend": backend, "error": "weasyprint is not installed"}
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp_dir = Path(tmp)
+        rows = _rows()
+        week = [(f"{name} • {24 + i:02d}.11.2025", rows) for i, name in enumerate(_DAYS)]
+        jobs = {
+            "day": (("Понедельник • 24.11.2025", [(None, rows)]), 1280),
+            "week": (("ИС121 • 24.11–29.11.2025", week), 2400),
+        }
+
+        if backend == "pillow":
+            palette = style_palette("Обычный")
+        else:
+            service = ScheduleService(tmp_dir / "url.json", tmp_dir / "times.json", banner_dir=tmp_dir)
+            if background:
+                service.custom_background_path.write_bytes(Path(background).read_bytes())
+            palette = service._style_palette("Обычный")
+            bg_path = service.custom_background_path if background else None
+
+        started = time.perf_counter()
+        if backend == "pillow":
+            banner_pillow.configure_fonts()
+            banner_pillow.preload_fonts()
+        else:
+            banner_renderer.warm_up(backend)
+        result = {"backend": backend, "warm_up_ms": (time.perf_counter() - started) * 1000}
+        for name, ((title, days), width) in jobs.items():
+            out_path = tmp_dir / f"{name}.png"
+            if backend == "pillow":
+                spec = {"title": title, "days": days, "palette": palette, "background": background, "width": width}
+                render = lambda: banner_pillow.draw_banner(spec, str(out_path))  # noqa: E731
+            else:
+                if name == "week":
+                    html = service._build_week_banner_html(title, days, palette, bg_path)
+                else:
+                    html = service._build_banner_html(title, rows, palette, bg_path)
+                render = lambda: banner_renderer.render_html_to_png(html, str(out_path), str(tmp_dir))  # noqa: E731
+            timings = []
+            for _ in range(runs):
+                started = time.perf_counter()
+                render()
+                timings.append((time.perf_counter() - started) * 1000)
+            result[f"{name}_ms"] = statistics.median(timings)
+            result[f"{name}_kb"] = out_path.stat().st_size / 1024 if out_path.exists() else 0
+        result["maxrss_mb"] = _maxrss_mb()
+        return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--background", help="image used as the custom banner background")
+    parser.add_argument("--backend", choices=BACKENDS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.backend:
+        print(json.dumps(_bench(args.backend, args.runs, args.background)))
+        return
+
+    print(f"{'backend':<12}{'warm-up':>10}{'day':>10}{'week':>10}{'day PNG':>11}{'week PNG':>11}{'maxrss':>10}")
+    for backend in BACKENDS:
+        cmd = [sys.executable, __file__, "--backend", backend, "--runs", str(args.runs)]
+        if args.background:
+            cmd += ["--background", args.background]
+        proc = subprocess.run(cmd, capture_output=True, text=True)
+        try:
+            result = json.loads(proc.stdout.strip().splitlines()[-1])
+        except (IndexError, ValueError):
+            result = {"error": (proc.stderr.strip().splitlines() or ["failed"])[-1]}
+        if "error" in result:
+            print(f"{backend:<12}{result['error']}")
+            continue
+        print(
+            f"{backend:<12}"
+            f"{result['warm_up_ms']:>8.0f}ms"
+            f"{result['day_ms']:>8.0f}ms"
+            f"{result['week_ms']:>8.0f}ms"
+            f"{result['day_kb']:>8.0f} KB"
+            f"{result['week_kb']:>8.0f} KB"
+            f"{result['maxrss_mb']:>8.0f}MB"
+        )
+    print(f"Median of {args.runs} renders per banner.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+import datetime as dt
+import json
+import random
+from html import escape
+from pathlib import Path
+
+import pytest
+
+from app.services import schedule_service
+from app.services.schedule_model import DaySchedule
+
+pytest.importorskip("lxml")
+
+_SUBJECTS = ["Математика (Лек.)", "Физика (Лаб.)", "Русский язык ( )", "Информатика", "Физ-ра"]
+_ROOMS = ["204", "307", "Спортзал", "1-12", ""]
+_TEACHERS = ["Гайсина И.Р.", "Хасанов Д.Р.", "Пестерева А.И.", ""]
+_DAY_NAMES = ["Понедельник", "Вторник", "Среда", "Четверг", "Пятница", "Суббота", "Воскресенье"]
+
+
+def _cell(rnd: random.Random) -> str:
+    subject, room, teacher = rnd.choice(_SUBJECTS), rnd.choice(_ROOMS), rnd.choice(_TEACHERS)
+    if rnd.random() < 0.1:
+        return f"<span>  {subject}\n  &amp; co<!-- note --></span>"
+    inner = f'<a class="z1">{subject}</a>'
+    if room:
+        inner += f'<br><a class="z2">{room}</a>'
+    if teacher:
+        inner += f' <a class="z3 x">&nbsp;{teacher} </a>'
+    return inner
+
+
+def _page(seed: int, charset: str = "utf-8") -> str:
+    """A schedule page shaped like the college site: 8 rows per day, one
+    rowspan date cell, merged and per-subgroup cells."""
+    rnd = random.Random(seed)
+    meta = f'<meta charset="{charset}">' if charset else ""
+    out = [
+        f"<html><head>{meta}<title>x</title></head><body><p>hdr</p>",
+        '<table class="output-table">',
+        "<tr><th>Дата</th><th>Пара</th><th colspan=5>Группа</th></tr>",
+    ]
+    start = dt.date(2025, 11, 24)
+    for k in range(rnd.randint(6, 14)):
+        day = start + dt.timedelta(days=k)
+        for num in range(1, 9):
+            row = "<tr>"
+            if num == 1:
+                row += f'<td rowspan="8" class="hd0">{day.strftime("%d.%m.%Y")}<br>{_DAY_NAMES[day.weekday()]}</td>'
+            row += f'<td class="hd">{num}</td>'
+            kind = rnd.random()
+            if kind < 0.35:
+                row += '<td class="nul" colspan="5">&nbsp;</td>'
+            elif kind < 0.6:
+                row += f'<td class="ur" colspan="5">{_cell(rnd)}</td>'
+            elif kind < 0.75:
+                row += f'<td class="ur">{_cell(rnd)}</td><td class="nul">&nbsp;</td><td class="nul" colspan=3></td>'
+            elif kind < 0.85:
+                row += f'<td class="nul"></td><td class="ur">{_cell(rnd)}</td><td colspan="3"></td>'
+            else:
+                cell = _cell(rnd)
+                other = cell if rnd.random() < 0.5 else _cell(rnd)
+                row += f'<td class="ur">{cell}</td><td class="ur">{other}</td><td colspan="3"></td>'
+            out.append(row + "</tr>")
+    out.append("</table><!-- footer --></body></html>")
+    return "\n".join(out)
+
+
+def _unpaired_td(markup: str) -> str:
+    # The site sometimes leaves cells unclosed; drop every third </td>.
+    parts = markup.split("</td>")
+    return "".join(p + ("" if i % 3 == 2 else "</td>") for i, p in enumerate(parts[:-1])) + parts[-1]
+
+
+_VARIANTS = {
+    "utf-8": lambda seed: _page(seed).encode("utf-8"),
+    "cp1251": lambda seed: _page(seed, "windows-1251").encode("cp1251"),
+    "no-meta": lambda seed: _page(seed, "").encode("utf-8"),
+    "bom": lambda seed: b"\xef\xbb\xbf" + _page(seed).encode("utf-8"),
+    "str": lambda seed: _page(seed),
+}
+
+# Pages lxml would read differently; _table_reader must keep them on html.parser.
+_SOUP_ONLY_VARIANTS = {
+    "crlf": lambda seed: _page(seed).replace("\n", "\r\n").encode("utf-8"),
+    "unpaired-td": lambda seed: _unpaired_td(_page(seed)).encode("utf-8"),
+}
+
+_CACHED_WEEKS = sorted((Path(__file__).resolve().parent.parent / "config" / "schedule").glob("*.json"))
+
+
+def _lesson_cell(lesson) -> str:
+    return (
+        f'<td class="ur"><a class="z1">{escape(lesson.subject)}</a>'
+        f'<br><a class="z2">{escape(lesson.room)}</a>'
+        f' <a class="z3">{escape(lesson.teacher)}</a></td>'
+    )
+
+
+def _page_from_week(days: dict[str, DaySchedule]) -> str:
+    """Rebuild a site-shaped page from a cached week."""
+    out = ['<html><head><meta charset="utf-8"></head><body><table class="output-table">']
+    for date, day in days.items():
+        for num in range(1, 9):
+            row = "<tr>"
+            if num == 1:
+                row += f'<td rowspan="8" class="hd0">{date}<br>{escape(day.day)}</td>'
+            row += f'<td class="hd">{num}</td>'
+            first, second = day.pairs.get(num, (None, None))
+            if day.is_merged(first, second):
+                row += _lesson_cell(first).replace("<td ", '<td colspan="5" ', 1)
+            elif first or second:
+                for lesson in (first, second):
+                    row += _lesson_cell(lesson) if lesson else '<td class="nul">&nbsp;</td>'
+                row += '<td class="nul" colspan="3"></td>'
+            else:
+                row += '<td class="nul" colspan="5">&nbsp;</td>'
+            out.append(row + "</tr>")
+    out.append("</table></body></html>")
+    return "\n".join(out)
+
+
+def _parse(html, backend):
+    return {date: day.to_json() for date, day in schedule_service.parse_schedule_html(html, backend=backend).items()}
+
+
+@pytest.mark.parametrize("variant", sorted(_VARIANTS))
+@pytest.mark.parametrize("seed", range(12))
+def test_backends_agree(variant, seed):
+    html = _VARIANTS[variant](seed)
+    soup = _parse(html, "html.parser")
+    assert soup
+    assert _parse(html, "lxml") == soup
+
+
+@pytest.mark.parametrize("variant", sorted(_SOUP_ONLY_VARIANTS))
+@pytest.mark.parametrize("seed", range(4))
+def test_ambiguous_pages_fall_back_to_soup(variant, seed):
+    markup = schedule_service._decode_markup(_SOUP_ONLY_VARIANTS[variant](seed))
+    assert schedule_service._table_reader(markup, "lxml").name == "html.parser"
+
+
+@pytest.mark.skipif(not _CACHED_WEEKS, reason="no cached schedules in config/schedule")
+@pytest.mark.parametrize("path", _CACHED_WEEKS, ids=lambda p: p.stem)
+def test_cached_weeks_round_trip(path):
+    stored = json.loads(path.read_text(encoding="utf-8"))["schedule"]
+    days = {date: DaySchedule.from_json(info) for date, info in stored.items()}
+    markup = _page_from_week(days)
+    assert schedule_service._table_reader(markup, "lxml").name == "lxml"
+    expected = {date: day.to_json() for date, day in days.items()}
+    assert _parse(markup, "html.parser") == expected
+    assert _parse(markup, "lxml") == expected
+    # ``lessons`` was written by the bot's original parser, so this pins the
+    # output to the baseline rather than to the two readers agreeing.
+    for backend in ("html.parser", "lxml"):
+        parsed = schedule_service.parse_schedule_html(markup, backend=backend)
+        assert {date: day.lesson_lines() for date, day in parsed.items()} == {
+            date: info["lessons"] for date, info in stored.items()
+        }
+
+
+_KNOWN_PAGE = """<html><head><meta charset="utf-8"></head><body><table class="output-table">
+<tr><th>Дата</th><th>Пара</th><th colspan=5>Группа</th></tr>
+<tr><td rowspan="8" class="hd0">24.11.2025<br>Понедельник</td><td class="hd">1</td>
+<td class="ur" colspan="5"><a class="z1">Математика (Лек.)</a><br><a class="z2">204</a> <a class="z3 x">&nbsp;Гайсина И.Р. </a></td></tr>
+<tr><td class="hd">2</td><td class="ur"><a class="z1">Физика (Лаб.)</a><br><a class="z2">307</a> <a class="z3">Хасанов Д.Р.</a></td>
+<td class="ur"><a class="z1">Информатика</a><br><a class="z2">1-12</a></td><td colspan="3"></td></tr>
+<tr><td class="hd">3</td><td class="nul"></td><td class="ur"><a class="z1">Русский язык ( )</a></td><td colspan="3"></td></tr>
+<tr><td class="hd">4</td><td class="ur"><a class="z1">Физ-ра</a><br><a class="z2">Спортзал</a></td>
+<td class="ur"><a class="z1">Физ-ра</a><br><a class="z2">Спортзал</a></td><td colspan="3"></td></tr>
+<tr><td class="hd">5</td><td class="nul" colspan="5">&nbsp;</td></tr>
+<tr><td class="hd">6</td><td class="nul" colspan="5">&nbsp;</td></tr>
+<tr><td class="hd">7</td><td class="nul" colspan="5">&nbsp;</td></tr>
+<tr><td class="hd">8</td><td class="nul" colspan="5">&nbsp;</td></tr>
+</table></body></html>"""
+
+_KNOWN_LINES = [
+    "1 пара: Математика (Лек.) | 204 | Гайсина И.Р.",
+    "2 пара:",
+    "① Физика (Лаб.) | 307 | Хасанов Д.Р.",
+    "② Информатика | 1-12",
+    "3 пара: ② Русский язык",
+    "4 пара: Физ-ра | Спортзал",
+    "5 пара: НЕТ",
+    "6 пара: НЕТ",
+    "7 пара: НЕТ",
+    "8 пара: НЕТ",
+]
+
+
+@pytest.mark.parametrize("backend", ["html.parser", "lxml"])
+def test_known_page(backend):
+    parsed = schedule_service.parse_schedule_html(_KNOWN_PAGE.encode("utf-8"), backend=backend)
+    assert list(parsed) == ["24.11.2025"]
+    assert parsed["24.11.2025"].day == "Понедельник"
+    assert parsed["24.11.2025"].lesson_lines() == _KNOWN_LINES
+
+
+def test_clean_pages_use_lxml():
+    markup = schedule_service._decode_markup(_VARIANTS["cp1251"](0))
+    assert schedule_service._table_reader(markup, "lxml").name == "lxml"
+
+
+@pytest.mark.parametrize("html", [b"", "", "<table></table>", b"<html><body>nothing</body></html>"])
+def test_backends_agree_on_empty_pages(html):
+    assert _parse(html, "lxml") == _parse(html, "html.parser") == {}
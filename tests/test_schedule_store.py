@@ -0,0 +1,56 @@
+import asyncio
+import datetime as dt
+
+from app.services.db import Database
+from app.services.schedule_model import DaySchedule, Lesson
+
+_WEEK = (dt.date(2025, 11, 24), dt.date(2025, 11, 30))
+
+
+def _day(day: str, subject: str) -> DaySchedule:
+    lesson = Lesson.of(subject, "204", "Гайсина И.Р.")
+    return DaySchedule(day, {1: (lesson, lesson)})
+
+
+def _run(tmp_path, scenario):
+    async def run():
+        db = Database(str(tmp_path / "bot.db"))
+        await db.init()
+        try:
+            return await scenario(db)
+        finally:
+            await db.close()
+
+    return asyncio.run(run())
+
+
+def test_baselines_are_not_served_as_the_timetable(tmp_path):
+    async def scenario(db):
+        await db.set_notified_schedule_days("ИС131п", {"24.11.2025": _day("Пн-1", "Математика")})
+        assert await db.get_schedule_days("ИС131п", *_WEEK) == {}
+        assert await db.get_notified_schedule_day("ИС131п", _WEEK[0]) is not None
+        page = {"24.11.2025": _day("Пн-1", "Физика")}
+        assert await db.upsert_schedule_days("ИС131п", page) == ["24.11.2025"]
+        stored = await db.get_schedule_days("ИС131п", *_WEEK)
+        assert stored["24.11.2025"].to_json() == page["24.11.2025"].to_json()
+
+    _run(tmp_path, scenario)
+
+
+def test_days_withdrawn_from_the_page_are_dropped(tmp_path):
+    async def scenario(db):
+        page = {
+            "24.11.2025": _day("Пн-1", "Математика"),
+            "25.11.2025": _day("Вт-1", "Физика"),
+            "26.11.2025": _day("Ср-1", "Информатика"),
+        }
+        await db.upsert_schedule_days("ИС131п", page)
+        await db.set_notified_schedule_days("ИС131п", {"25.11.2025": page["25.11.2025"]})
+        del page["25.11.2025"]
+        assert await db.upsert_schedule_days("ИС131п", page) == ["25.11.2025"]
+        assert sorted(await db.get_schedule_days("ИС131п", *_WEEK)) == ["24.11.2025", "26.11.2025"]
+        # The watchdog keeps what subscribers were told about the day.
+        assert await db.get_notified_schedule_day("ИС131п", dt.date(2025, 11, 25)) is not None
+        assert await db.upsert_schedule_days("ИС131п", page) == []
+
+    _run(tmp_path, scenario)
@@ -0,0 +1,69 @@
+import asyncio
+import datetime as dt
+from types import SimpleNamespace
+
+from app.services import schedule_watchdog
+from app.services.db import Database
+from app.services.schedule_model import DaySchedule, Lesson
+
+
+class _Notifier:
+    def __init__(self) -> None:
+        self.messages: list[str] = []
+
+    async def submit(self, users, text, **kwargs) -> int:
+        self.messages.append(text)
+        return len(users)
+
+
+def _day(day: str, *subjects: str) -> DaySchedule:
+    pairs = {}
+    for num, subject in enumerate(subjects, start=1):
+        lesson = Lesson.of(subject, "204", "Гайсина И.Р.")
+        pairs[num] = (lesson, lesson)
+    return DaySchedule(day, pairs)
+
+
+def _check(tmp_path, page: dict[str, DaySchedule], now: dt.datetime, known: dict[str, DaySchedule] | None = None):
+    async def run() -> list[str]:
+        db = Database(str(tmp_path / "bot.db"))
+        await db.init()
+        try:
+            if known:
+                await db.set_notified_schedule_days("ИС131п", known)
+            ctx = SimpleNamespace(db=db, notifier=_Notifier())
+            await schedule_watchdog._check_group(ctx, "ИС131п", page, {}, now)
+            return ctx.notifier.messages
+        finally:
+            await db.close()
+
+    return asyncio.run(run())
+
+
+def test_next_week_monday_published_on_sunday(tmp_path):
+    sunday = dt.datetime(2025, 11, 30, 18, 0)
+    page = {
+        "01.12.2025": _day("Пн-1", "Математика", "Физика"),
+        "02.12.2025": _day("Вт-1", "Информатика"),
+    }
+    messages = _check(tmp_path, page, sunday)
+    assert len(messages) == 1
+    text = messages[0]
+    assert "Понедельник • 01.12.2025 • расписание опубликовано" in text
+    assert "1 пара: Математика | 204 | Гайсина И.Р." in text
+    assert "2 пара: Физика | 204 | Гайсина И.Р." in text
+    # Days after tomorrow are baselined without a message.
+    assert "02.12.2025" not in text
+
+
+def test_known_and_far_days_stay_quiet(tmp_path):
+    sunday = dt.datetime(2025, 11, 30, 18, 0)
+    monday = _day("Пн-1", "Математика")
+    page = {"01.12.2025": monday, "03.12.2025": _day("Ср-1", "Физика")}
+    assert _check(tmp_path, page, sunday, known={"01.12.2025": monday}) == []
+
+
+def test_published_day_without_lessons_is_not_announced(tmp_path):
+    saturday = dt.datetime(2025, 11, 29, 18, 0)
+    page = {"30.11.2025": _day("Вс-1")}
+    assert _check(tmp_path, page, saturday) == []
@@ -0,0 +1,49 @@
+import asyncio
+
+import pytest
+
+from app.services.single_flight import SingleFlight
+
+
+def test_cancelled_owner_does_not_cancel_waiters():
+    async def run():
+        flight = SingleFlight()
+        release = asyncio.Event()
+        calls = 0
+
+        async def work():
+            nonlocal calls
+            calls += 1
+            await release.wait()
+            return "week"
+
+        owner = asyncio.create_task(flight.run("key", work))
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(flight.run("key", work))
+        await asyncio.sleep(0)
+        owner.cancel()
+        await asyncio.sleep(0)
+        release.set()
+        with pytest.raises(asyncio.CancelledError):
+            await owner
+        assert await waiter == "week"
+        assert calls == 1
+        assert "key" not in flight
+
+    asyncio.run(run())
+
+
+def test_exception_reaches_every_caller_and_clears_key():
+    async def run():
+        flight = SingleFlight()
+
+        async def fail():
+            await asyncio.sleep(0)
+            raise RuntimeError("HTTP 500")
+
+        results = await asyncio.gather(flight.run("key", fail), flight.run("key", fail), return_exceptions=True)
+        assert [type(r) for r in results] == [RuntimeError, RuntimeError]
+        assert results[0] is results[1]
+        assert "key" not in flight
+
+    asyncio.run(run())